@@ -14,7 +14,9 @@ import copy
 import re
 import os
 import json
+import hashlib
 import numpy as np
+from collections import OrderedDict
 
 from pylabnet.utils.logging.logger import LogHandler
 
@@ -43,12 +45,17 @@ SAMPLING_RATE_DICT = {
 
 class Driver():
 
-    def __init__(self, device_id, interface, logger, dummy=False, api_level=6, reset_dio=False, disable_everything=False, **kwargs):
+    def __init__(self, device_id, interface, logger, dummy=False, api_level=6, reset_dio=False, disable_everything=False,
+                 sequence_cache_size=32, sequence_cache_dir=None, **kwargs):
         """ Instantiate AWG
 
         :logger: instance of LogClient class
         :device_id: Device id of connceted ZI HDAWG, for example 'dev8060'
         :api_level: API level of zhins API
+        :sequence_cache_size: (int) Number of compiled sequences kept in memory
+            by the sequence cache, 0 disables caching.
+        :sequence_cache_dir: (str, optional) Directory of the persistent
+            sequence cache. If None, the AWG module data directory is used.
         """
 
         # Instantiate log
@@ -57,6 +64,12 @@ class Driver():
         # Store dummy flag
         self.dummy = dummy
 
+        # Cache of compiled sequences, shared by all AWG modules of this device.
+        self.sequence_cache = SequenceCache(
+            max_entries=sequence_cache_size,
+            cache_dir=sequence_cache_dir
+        ) if sequence_cache_size > 0 else None
+
         # Setup HDAWG
         self._setup_hdawg(device_id, interface, logger, api_level, reset_dio, disable_everything)
 
@@ -382,6 +395,11 @@ class AWGModule():
         self.module = awgModule
         self.hd.log.info(f"AWG {self.index}: Module created.")
 
+        # Default the persistent sequence cache to the module data directory.
+        cache = getattr(self.hd, 'sequence_cache', None)
+        if cache is not None and cache.cache_dir is None:
+            cache.set_cache_dir(os.path.join(self._get_elf_directory(), "pylabnet_cache"))
+
     def set_sampling_rate(self, sampling_rate):
         """ Set sampling rate of AWG output
 
@@ -521,10 +539,15 @@ class AWGModule():
             # Enable output
             self.hd.enable_output(ch_num)
 
-    def compile_upload_sequence(self, sequence):
+    def compile_upload_sequence(self, sequence, use_cache=True):
         """ Compile and upload AWG sequence to AWG Module.
 
+        If the sequence cache of the HDAWG driver already contains the compiled
+        sequence, compilation is skipped and the cached ELF file is uploaded.
+
         :sequence: Instance of Sequence class.
+        :use_cache: (bool) Whether to look up / store the compiled sequence in
+            the sequence cache.
         """
 
         # First check if all values have been replaced in sequence:
@@ -532,6 +555,27 @@ class AWGModule():
             self.hd.log.error("Sequence is not ready: Not all placeholders have been replaced.")
             return
 
+        cache = getattr(self.hd, 'sequence_cache', None) if use_cache else None
+        cache_key = None
+
+        if cache is not None:
+            cache_key = cache.get_key(
+                sequence.sequence,
+                self.hd.device_id,
+                self.index,
+                self.channel_grouping,
+                wave_files=self._get_wave_files(sequence.sequence)
+            )
+            elf = cache.get(cache_key)
+
+            if elf is not None:
+                self.hd.log.info(
+                    f"AWG {self.index}: Found compiled sequence in cache, skipping compilation. "
+                    f"Cache stats: {cache.get_stats()}"
+                )
+                self._upload_elf(elf, cache_key)
+                return
+
         self.module.set('compiler/sourcestring', sequence.sequence)
         # Note: when using an AWG program from a source file
         # (and only then), the compiler needs to
@@ -558,6 +602,69 @@ class AWGModule():
 
         # Wait for the waveform upload to finish
         time.sleep(0.2)
+        upload_successful = self._wait_for_upload()
+
+        # Store the compiled ELF file for later re-uploads.
+        if cache is not None and upload_successful:
+            elf_path = os.path.join(self._get_elf_directory(), self.module.getString('elf/file'))
+            try:
+                with open(elf_path, 'rb') as elf_file:
+                    cache.put(cache_key, elf_file.read())
+            except OSError:
+                self.hd.log.warn(f"AWG {self.index}: Could not read compiled ELF file {elf_path}, not caching sequence.")
+
+    def _get_elf_directory(self):
+        """ Returns the directory in which the AWG module stores ELF files. """
+        return os.path.join(self.module.getString('directory'), "awg", "elf")
+
+    def _get_wave_files(self, source):
+        """ Returns the CSV files of the waves directory referenced by a sequence.
+
+        The compiler reads the waveforms of these files, so a changed file has
+        to change the sequence cache key.
+
+        :source: (str) .seqc source string
+
+        :return: (list) Paths of the referenced CSV files.
+        """
+
+        wave_dir = os.path.join(self.module.getString('directory'), "awg", "waves")
+        if not os.path.isdir(wave_dir):
+            return []
+
+        # Waves are referenced by their filename without extension in string literals.
+        names = set(re.findall(r'"([^"]+)"', source))
+        return [
+            os.path.join(wave_dir, filename) for filename in sorted(os.listdir(wave_dir))
+            if filename.endswith('.csv') and filename[:-len('.csv')] in names
+        ]
+
+    def _upload_elf(self, elf, cache_key):
+        """ Upload a previously compiled ELF file to the instrument.
+
+        :elf: (bytes) Content of the ELF file.
+        :cache_key: (str) Sequence cache key, used to name the ELF file.
+        """
+
+        elf_filename = f"pylabnet_cache_{cache_key[:16]}.elf"
+        elf_directory = self._get_elf_directory()
+        os.makedirs(elf_directory, exist_ok=True)
+
+        with open(os.path.join(elf_directory, elf_filename), 'wb') as elf_file:
+            elf_file.write(elf)
+
+        self.module.set('elf/file', elf_filename)
+        self.module.set('elf/upload', 1)
+
+        time.sleep(0.2)
+        return self._wait_for_upload()
+
+    def _wait_for_upload(self):
+        """ Wait for the ELF upload to the instrument to finish.
+
+        :return: (bool) True if the upload was successful.
+        """
+
         i = 0
         while (self.module.getDouble('progress') < 1.0) and (self.module.getInt('elf/status') != 1):
             self.hd.log.info("{} progress: {:.2f}".format(i, self.module.getDouble('progress')))
@@ -568,8 +675,10 @@ class AWGModule():
         )
         if self.module.getInt('elf/status') == 0:
             self.hd.log.info("Upload to the instrument successful.")
+            return True
         if self.module.getInt('elf/status') == 1:
             self.hd.log.warn("Upload to the instrument failed.")
+        return False
 
     def dyn_waveform_upload(self, wave_index, wave1, wave2=None, marker=None, index=None):
         """ Dynamically upload a numpy array into HDAWG Memory
@@ -656,6 +765,157 @@ class AWGModule():
         return True
 
 
+class SequenceCache():
+    """ LRU cache of compiled AWG sequences.
+
+    Compiled ELF files are keyed on a hash of the sequence source string, of
+    the wave files it references and of the AWG core it was compiled for. The most recently used entries are
+    kept in memory, and all entries are additionally stored in a persistent
+    on-disk store so that they survive restarts.
+    """
+
+    def __init__(self, max_entries=32, cache_dir=None, max_disk_entries=256):
+        """ Initialize sequence cache
+
+        :max_entries: (int) Maximum number of ELF files kept in memory.
+        :cache_dir: (str, optional) Directory of the persistent store. If None,
+            the cache only lives in memory.
+        :max_disk_entries: (int) Maximum number of ELF files kept in the
+            persistent store, least recently used files are deleted first.
+        """
+
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.cache_dir = cache_dir
+
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        if self.cache_dir is not None:
+            self.set_cache_dir(self.cache_dir)
+
+    def set_cache_dir(self, cache_dir):
+        """ Set the directory of the persistent store.
+
+        :cache_dir: (str) Directory in which the ELF files are stored.
+        """
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def get_key(source, device_id, awg_index, channel_grouping, wave_files=()):
+        """ Get the cache key of a sequence.
+
+        :source: (str) .seqc source string
+        :device_id: (str) Device id of the HDAWG, e.g. 'dev8060'
+        :awg_index: (int) Index of the AWG core
+        :channel_grouping: (int) Channel grouping of the HDAWG
+        :wave_files: (list, optional) Paths of the wave files referenced by the
+            sequence, whose contents are hashed into the key.
+
+        :return: (str) SHA-256 hex digest identifying the compiled sequence.
+        """
+
+        key_str = f"{device_id}|{awg_index}|{channel_grouping}|{source}"
+        key_hash = hashlib.sha256(key_str.encode('utf-8'))
+
+        for wave_file in wave_files:
+            with open(wave_file, 'rb') as wave:
+                key_hash.update(f"|{os.path.basename(wave_file)}|".encode('utf-8'))
+                key_hash.update(hashlib.sha256(wave.read()).digest())
+
+        return key_hash.hexdigest()
+
+    def get(self, key):
+        """ Retrieve a compiled sequence.
+
+        :key: (str) Cache key as returned by get_key()
+
+        :return: (bytes) ELF file content, or None if the sequence is not cached.
+        """
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        elf_path = self._get_disk_path(key)
+        if elf_path is not None and os.path.isfile(elf_path):
+            with open(elf_path, 'rb') as elf_file:
+                elf = elf_file.read()
+            # Mark as recently used in the persistent store.
+            os.utime(elf_path)
+            self._store(key, elf)
+            self.hits += 1
+            return elf
+
+        self.misses += 1
+        return None
+
+    def put(self, key, elf):
+        """ Store a compiled sequence.
+
+        :key: (str) Cache key as returned by get_key()
+        :elf: (bytes) ELF file content
+        """
+
+        self._store(key, elf)
+
+        elf_path = self._get_disk_path(key)
+        if elf_path is not None:
+            with open(elf_path, 'wb') as elf_file:
+                elf_file.write(elf)
+            self._evict_disk()
+
+    def clear(self, disk=False):
+        """ Remove all entries from the cache.
+
+        :disk: (bool) If True, also empty the persistent store.
+        """
+
+        self._entries.clear()
+
+        if disk and self.cache_dir is not None:
+            for elf_path in self._get_disk_files():
+                os.remove(elf_path)
+
+    def get_stats(self):
+        """ Returns a dictionary with the number of hits, misses and entries. """
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries)
+        }
+
+    def _store(self, key, elf):
+        """ Insert into the in-memory store, evicting the least recently used entry. """
+
+        self._entries[key] = elf
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_disk_path(self, key):
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, f"{key}.elf")
+
+    def _get_disk_files(self):
+        return [os.path.join(self.cache_dir, filename) for filename
+                in os.listdir(self.cache_dir) if filename.endswith('.elf')]
+
+    def _evict_disk(self):
+        """ Delete the least recently used files from the persistent store. """
+
+        elf_paths = sorted(self._get_disk_files(), key=os.path.getmtime)
+        for elf_path in elf_paths[:max(0, len(elf_paths) - self.max_disk_entries)]:
+            os.remove(elf_path)
+
+
 class Sequence():
     """ Helper class containing .seqc sequences and helper functions
 
@@ -0,0 +1,785 @@
+""" Vectorized analysis of time tag streams
+
+Time tags are given as two arrays of equal length: the channels (int32) and
+the timestamps in ps (int64) of the events in chronological order, as
+returned by TimeTagger.TimeTagStream. The measurement classes reproduce the
+corresponding TimeTagger measurements in software and process the tags chunk
+by chunk:
+
+    histogram = Histogram(click_ch=1, start_ch=2, binwidth=100, n_bins=1000)
+    for channels, timestamps in chunks:
+        histogram.process(channels, timestamps)
+    histogram.flush()
+    counts = histogram.get_data()
+
+Events near the end of a chunk that depend on later tags are kept until the
+next chunk. The results therefore do not depend on how the stream is divided
+into chunks, and the memory used is bounded by the chunk size.
+
+Recorded tags can be reanalysed offline, e.g. with other bin widths, using
+analyze(), which evaluates long recordings (1e8+ tags) in chunks and in
+parallel. Run this module to benchmark the parallel evaluation.
+"""
+
+import copy
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+
+# Default number of tags read at once by analyze()
+CHUNK_SIZE = 10000000
+
+# Minimal number of tags of a segment evaluated in parallel by analyze()
+MIN_SEGMENT_SIZE = 1000000
+
+_NO_TAG = np.iinfo(np.int64).min
+
+
+class TagBuffer:
+    """ Bounded FIFO of time tags, indexed by their position in the stream
+
+    Tags are indexed by the number of tags appended before them, such that
+    readers can resume at a cursor. If the capacity is exceeded, the oldest
+    tags are dropped and counted as lost.
+    """
+
+    def __init__(self, capacity):
+        """ Instantiates an empty buffer
+
+        :param capacity: (int) maximal number of stored tags
+        """
+
+        self.capacity = int(capacity)
+
+        # Index of the first stored tag
+        self.start = 0
+        self.lost = 0
+
+        self._channels = np.empty(0, dtype=np.int32)
+        self._timestamps = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    @property
+    def end(self):
+        """ Index following the last stored tag """
+
+        return self.start + len(self)
+
+    def append(self, channels, timestamps):
+        """ Appends tags to the buffer
+
+        :param channels: (np.ndarray) channel of each tag
+        :param timestamps: (np.ndarray) timestamp of each tag in ps
+        """
+
+        if len(self) == 0:
+            self._channels = np.asarray(channels)
+            self._timestamps = np.asarray(timestamps)
+        elif len(timestamps) > 0:
+            self._channels = np.concatenate((self._channels, channels))
+            self._timestamps = np.concatenate((self._timestamps, timestamps))
+
+        excess = len(self) - self.capacity
+        if excess > 0:
+            self.discard(self.start + excess)
+            self.lost += excess
+
+    def discard(self, index):
+        """ Removes the tags before index
+
+        :param index: (int) index of the first tag to keep
+        """
+
+        n = min(max(index - self.start, 0), len(self))
+        if n > 0:
+            self._channels = self._channels[n:]
+            self._timestamps = self._timestamps[n:]
+            self.start += n
+
+    def read(self, index=None, max_events=None):
+        """ Returns stored tags without copying them, and removes the tags before index
+
+        :param index: (int) index of the first tag to return. Tags before index
+            are discarded. The oldest stored tag is returned first if None or
+            if the tag at index was lost.
+        :param max_events: (int) maximal number of tags to return, None for all
+        :return: (tuple) index of the first returned tag, channels and timestamps
+        """
+
+        if index is not None:
+            self.discard(index)
+
+        n = len(self) if max_events is None else min(int(max_events), len(self))
+        return self.start, self._channels[:n], self._timestamps[:n]
+
+
+class Measurement:
+    """ Base class of measurements evaluating chunks of time tags
+
+    Every event of a measurement is anchored at the time of one tag (e.g. the
+    click of a histogram). If start_time or stop_time are set, only events
+    anchored in [start_time, stop_time) are evaluated, such that segments of a
+    recording can be evaluated separately and merged, see analyze().
+    """
+
+    start_time = None
+    stop_time = None
+
+    # Time in ps before start_time from which tags are needed to evaluate the
+    # first events, e.g. to find the start tag of the first click
+    warmup = 0
+
+    def process(self, channels, timestamps):
+        """ Adds a chunk of tags to the measurement
+
+        :param channels: (np.ndarray) channel of each tag
+        :param timestamps: (np.ndarray) timestamp of each tag in ps, sorted
+        """
+
+        raise NotImplementedError
+
+    def flush(self):
+        """ Evaluates events kept for later tags, to be called after the last chunk """
+
+        pass
+
+    def is_complete(self):
+        """ Returns whether no event is waiting for later tags """
+
+        return True
+
+    def merge(self, other):
+        """ Adds the results of a measurement of the following segment
+
+        :param other: (Measurement) measurement with the same parameters
+        """
+
+        raise NotImplementedError
+
+    def clear(self):
+        """ Resets the measurement """
+
+        raise NotImplementedError
+
+    def get_data(self):
+        raise NotImplementedError
+
+    def get_index(self):
+        raise NotImplementedError
+
+    def _owned(self, times):
+        """ Returns the mask of times in [start_time, stop_time) """
+
+        mask = np.ones(len(times), dtype=bool)
+        if self.start_time is not None:
+            mask &= times >= self.start_time
+        if self.stop_time is not None:
+            mask &= times < self.stop_time
+        return mask
+
+
+class Histogram(Measurement):
+    """ Histogram of the time from the latest start tag to each click tag,
+    see TimeTagger.Histogram """
+
+    def __init__(self, click_ch, start_ch, binwidth=1000, n_bins=1000):
+        """ Instantiates the histogram
+
+        :param click_ch: (int) click channel
+        :param start_ch: (int) start channel
+        :param binwidth: (int) width of bins in ps
+        :param n_bins: (int) number of bins
+        """
+
+        self.click_ch = click_ch
+        self.start_ch = start_ch
+        self.binwidth = int(binwidth)
+        self.n_bins = int(n_bins)
+        self.clear()
+
+    @property
+    def warmup(self):
+        return self.binwidth * self.n_bins
+
+    def clear(self):
+
+        self._data = np.zeros(self.n_bins, dtype=np.int64)
+        self._last_start = _NO_TAG
+
+    def process(self, channels, timestamps):
+
+        if len(timestamps) == 0:
+            return
+
+        clicks, bins = self._click_bins(channels, timestamps, self._owned(timestamps))
+        self._data += np.bincount(bins, minlength=self.n_bins)
+
+    def merge(self, other):
+        self._data += other._data
+
+    def get_data(self):
+        return self._data.copy()
+
+    def get_index(self):
+        return np.arange(self.n_bins, dtype=np.int64) * self.binwidth
+
+    def _click_bins(self, channels, timestamps, mask=True):
+        """ Returns the indices of the clicks selected by mask within the range
+        of the histogram, and their bins """
+
+        # Timestamp of the latest start at every tag
+        last_start = np.where(channels == self.start_ch, timestamps, _NO_TAG)
+        last_start[0] = max(last_start[0], self._last_start)
+        np.maximum.accumulate(last_start, out=last_start)
+        self._last_start = last_start[-1]
+
+        clicks = np.flatnonzero(
+            (channels == self.click_ch) & (last_start != _NO_TAG) & mask
+        )
+        bins = (timestamps[clicks] - last_start[clicks]) // self.binwidth
+        in_range = bins < self.n_bins
+        return clicks[in_range], bins[in_range]
+
+
+class Correlation(Measurement):
+    """ Histogram of the time differences t_2 - t_1 between all pairs of tags
+    on the two channels, centered at zero, see TimeTagger.Correlation """
+
+    def __init__(self, ch_1, ch_2, binwidth=1000, n_bins=1000):
+        """ Instantiates the correlation
+
+        :param ch_1: (int) first channel
+        :param ch_2: (int) second channel
+        :param binwidth: (int) width of bins in ps
+        :param n_bins: (int) number of bins
+        """
+
+        self.ch_1 = ch_1
+        self.ch_2 = ch_2
+        self.binwidth = int(binwidth)
+        self.n_bins = int(n_bins)
+
+        # Time differences from -offset to width - offset are histogrammed
+        self._width = self.binwidth * self.n_bins
+        self._offset = self._width // 2
+        self.clear()
+
+    @property
+    def warmup(self):
+        return self._width - self._offset
+
+    def clear(self):
+
+        self._data = np.zeros(self.n_bins, dtype=np.int64)
+
+        # Tags of channel 1 that can be partners of later tags of channel 2,
+        # and tags of channel 2 whose partners are not all known yet
+        self._t_1 = np.empty(0, dtype=np.int64)
+        self._t_2 = np.empty(0, dtype=np.int64)
+
+        self.counts_1 = 0
+        self.counts_2 = 0
+        self._first_time = None
+        self._last_time = None
+
+    def process(self, channels, timestamps):
+
+        if len(timestamps) == 0:
+            return
+
+        owned = self._owned(timestamps)
+        owned_times = timestamps[owned]
+        if len(owned_times) > 0:
+            if self._first_time is None:
+                self._first_time = int(owned_times[0])
+            self._last_time = int(owned_times[-1])
+
+        # Pairs are anchored at the tag of channel 2
+        is_1 = channels == self.ch_1
+        t_2 = timestamps[(channels == self.ch_2) & owned]
+        self.counts_1 += np.count_nonzero(is_1 & owned)
+        self.counts_2 += len(t_2)
+        self._t_1 = np.concatenate((self._t_1, timestamps[is_1]))
+        self._t_2 = np.concatenate((self._t_2, t_2))
+
+        self._correlate(horizon=int(timestamps[-1]))
+
+    def flush(self):
+
+        self._correlate(horizon=None)
+
+    def is_complete(self):
+        return len(self._t_2) == 0
+
+    def merge(self, other):
+
+        self._data += other._data
+        self.counts_1 += other.counts_1
+        self.counts_2 += other.counts_2
+        if self._first_time is None:
+            self._first_time = other._first_time
+        if other._last_time is not None:
+            self._last_time = other._last_time
+
+    def get_data(self):
+        return self._data.copy()
+
+    def get_data_normalized(self):
+        """ Returns the normalized correlation g2, which is 1 for uncorrelated tags
+
+        :return: (np.ndarray) g2 of each bin
+        """
+
+        duration = 0 if self._first_time is None else self._last_time - self._first_time
+        expected = self.counts_1 * self.counts_2 * self.binwidth / duration if duration else 0
+        if expected == 0:
+            return np.zeros(self.n_bins)
+        return self._data / expected
+
+    def get_index(self):
+        return np.arange(self.n_bins, dtype=np.int64) * self.binwidth - self._offset
+
+    def _correlate(self, horizon):
+        """ Histograms the pairs of tags of channel 2 with all partners known
+
+        :param horizon: (int) time up to which all tags are known, None if
+            all tags are known
+        """
+
+        t_1, t_2 = self._t_1, self._t_2
+
+        # Partners of a tag of channel 2 at t arrive until t + offset
+        n = len(t_2) if horizon is None else np.searchsorted(t_2, horizon - self._offset, side='left')
+        ready = t_2[:n]
+
+        # Range of partners of each tag, with -offset <= t_2 - t_1 < width - offset
+        low = np.searchsorted(t_1, ready - (self._width - self._offset), side='right')
+        high = np.searchsorted(t_1, ready + self._offset, side='right')
+        n_pairs = high - low
+
+        # Pairs with the k-th partner of every tag, which keeps the memory
+        # bounded by the number of tags instead of the number of pairs
+        active = np.flatnonzero(n_pairs)
+        for k in range(n_pairs.max() if n > 0 else 0):
+            active = active[n_pairs[active] > k]
+            bins = (ready[active] - t_1[low[active] + k] + self._offset) // self.binwidth
+            self._data += np.bincount(bins, minlength=self.n_bins)[:self.n_bins]
+
+        self._t_2 = t_2[n:]
+
+        # Tags of channel 1 that cannot be partners of later tags are dropped
+        if horizon is None:
+            self._t_1 = t_1[:0]
+        else:
+            next_time = self._t_2[0] if len(self._t_2) > 0 else horizon
+            self._t_1 = t_1[np.searchsorted(t_1, next_time - (self._width - self._offset), side='right'):]
+
+
+class Coincidences(Correlation):
+    """ Number of pairs of tags on the two channels within a coincidence window """
+
+    def __init__(self, ch_1, ch_2, window=1000):
+        """ Instantiates the coincidence counter
+
+        :param ch_1: (int) first channel
+        :param ch_2: (int) second channel
+        :param window: (int) maximal time difference |t_2 - t_1| in ps
+        """
+
+        # A single bin from -window to window
+        super().__init__(ch_1, ch_2, binwidth=2 * int(window) + 1, n_bins=1)
+        self.window = int(window)
+
+    def get_data(self):
+        """ Returns the number of coincidences """
+
+        return int(self._data[0])
+
+    def get_index(self):
+        return np.zeros(1, dtype=np.int64)
+
+
+class GatedCounter(Measurement):
+    """ Number of clicks in each gate window, see TimeTagger.CountBetweenMarkers """
+
+    def __init__(self, click_ch, begin_ch, end_ch=None):
+        """ Instantiates the counter
+
+        :param click_ch: (int) click channel
+        :param begin_ch: (int) channel of the tags opening the gate windows
+        :param end_ch: (int) channel of the tags closing the gate windows,
+            e.g. -begin_ch for the falling edge. If None, a window ends at the
+            next tag of begin_ch.
+        """
+
+        self.click_ch = click_ch
+        self.begin_ch = begin_ch
+        self.end_ch = begin_ch if end_ch is None else end_ch
+        self.clear()
+
+    def clear(self):
+
+        # Results of the closed windows
+        self._counts = []
+        self._begins = []
+
+        # Open windows and the clicks since the first of them
+        self._open = np.empty(0, dtype=np.int64)
+        self._clicks = np.empty(0, dtype=np.int64)
+
+    def process(self, channels, timestamps):
+
+        if len(timestamps) == 0:
+            return
+
+        begins = timestamps[(channels == self.begin_ch) & self._owned(timestamps)]
+        self._open = np.concatenate((self._open, begins))
+        if len(self._open) == 0:
+            return
+        clicks = timestamps[channels == self.click_ch]
+        self._clicks = np.concatenate((self._clicks, clicks[clicks >= self._open[0]]))
+
+        # A window ends at the first end tag after its beginning
+        ends = timestamps[channels == self.end_ch]
+        end_index = np.searchsorted(ends, self._open, side='right')
+        n_closed = np.searchsorted(end_index, len(ends), side='left')
+        self._close(n_closed, ends[end_index[:n_closed]])
+
+    def flush(self):
+        """ Discards the windows that were not closed """
+
+        self._open = self._open[:0]
+        self._clicks = self._clicks[:0]
+
+    def is_complete(self):
+        return len(self._open) == 0
+
+    def merge(self, other):
+
+        self._counts.extend(other._counts)
+        self._begins.extend(other._begins)
+
+    def get_data(self):
+        """ Returns the number of clicks in each closed window """
+
+        return np.concatenate(self._counts) if self._counts else np.empty(0, dtype=np.int64)
+
+    def get_index(self):
+        """ Returns the beginning of each closed window in ps """
+
+        return np.concatenate(self._begins) if self._begins else np.empty(0, dtype=np.int64)
+
+    def _close(self, n_closed, end_times):
+        """ Counts the clicks of the first n_closed open windows """
+
+        if n_closed == 0:
+            return
+
+        begins = self._open[:n_closed]
+        counts = (np.searchsorted(self._clicks, end_times, side='left')
+                  - np.searchsorted(self._clicks, begins, side='left'))
+        self._counts.append(counts)
+        self._begins.append(begins)
+
+        self._open = self._open[n_closed:]
+        if len(self._open) > 0:
+            self._clicks = self._clicks[np.searchsorted(self._clicks, self._open[0], side='left'):]
+        else:
+            self._clicks = self._clicks[:0]
+
+
+class ConditionalHistogram(Histogram):
+    """ Start-stop histogram of the rounds of an experiment that pass a
+    preselection, like PreselectedHistogram in the data center
+
+    A round starts at every tag of round_ch. Its histogram is added to the
+    preselected histogram if the number of tags of presel_ch in the round is
+    above the threshold (below if less_than is set).
+    """
+
+    def __init__(self, click_ch, start_ch, round_ch, presel_ch, threshold,
+                 less_than=False, binwidth=1000, n_bins=1000):
+        """ Instantiates the histogram
+
+        :param click_ch: (int) click channel
+        :param start_ch: (int) start channel
+        :param round_ch: (int) channel marking the beginning of each round
+        :param presel_ch: (int) channel counted for the preselection, e.g. a
+            gated virtual channel
+        :param threshold: (float) threshold of the preselection counts
+        :param less_than: (bool) whether rounds pass below the threshold
+        :param binwidth: (int) width of bins in ps
+        :param n_bins: (int) number of bins
+        """
+
+        self.round_ch = round_ch
+        self.presel_ch = presel_ch
+        self.threshold = threshold
+        self.less_than = less_than
+        super().__init__(click_ch, start_ch, binwidth=binwidth, n_bins=n_bins)
+
+    def clear(self):
+
+        super().clear()
+        self._raw_data = np.zeros(self.n_bins, dtype=np.int64)
+        self._presel_counts = []
+
+        # Round that started before the current chunk, if it is evaluated
+        self._round_open = False
+        self._round_bins = np.empty(0, dtype=np.int64)
+        self._round_presel = 0
+
+    def process(self, channels, timestamps):
+
+        if len(timestamps) == 0:
+            return
+
+        # Rounds are anchored at their first tag, all of their clicks are evaluated
+        clicks, bins = self._click_bins(channels, timestamps)
+        markers = timestamps[channels == self.round_ch]
+        evaluated = np.concatenate(([self._round_open], self._owned(markers)))
+
+        # Round of every click and preselection tag: 0 for the round open
+        # before this chunk, k for the round starting at markers[k - 1]
+        rounds = np.searchsorted(markers, timestamps[clicks], side='right')
+        presel = np.bincount(
+            np.searchsorted(markers, timestamps[channels == self.presel_ch], side='right'),
+            minlength=len(markers) + 1
+        )
+        presel[0] += self._round_presel
+
+        # All but the last round are closed
+        n_closed = len(markers)
+        if n_closed > 0:
+            closed = rounds < n_closed
+            self._close_rounds(
+                np.concatenate((self._round_bins, bins[closed])),
+                np.concatenate((np.zeros(len(self._round_bins), dtype=rounds.dtype), rounds[closed])),
+                presel[:n_closed],
+                evaluated[:n_closed]
+            )
+            self._round_bins = bins[~closed]
+        else:
+            self._round_bins = np.concatenate((self._round_bins, bins))
+        self._round_presel = presel[n_closed]
+        self._round_open = evaluated[n_closed]
+
+    def flush(self):
+        """ Closes the last round """
+
+        self._close_rounds(
+            self._round_bins,
+            np.zeros(len(self._round_bins), dtype=np.int64),
+            np.array([self._round_presel]),
+            np.array([self._round_open])
+        )
+        self._round_open = False
+        self._round_bins = self._round_bins[:0]
+        self._round_presel = 0
+
+    def is_complete(self):
+        return not self._round_open
+
+    def merge(self, other):
+
+        super().merge(other)
+        self._raw_data += other._raw_data
+        self._presel_counts.extend(other._presel_counts)
+
+    def get_data(self):
+        """ Returns the histogram of the rounds that passed the preselection """
+
+        return self._data.copy()
+
+    def get_raw_data(self):
+        """ Returns the histogram of all rounds """
+
+        return self._raw_data.copy()
+
+    def get_preselection_counts(self):
+        """ Returns the preselection counts of every round """
+
+        if not self._presel_counts:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(self._presel_counts)
+
+    def _close_rounds(self, bins, rounds, presel, evaluated):
+        """ Adds closed rounds to the histograms
+
+        :param bins: (np.ndarray) bins of the clicks
+        :param rounds: (np.ndarray) round of every click
+        :param presel: (np.ndarray) preselection counts of every round
+        :param evaluated: (np.ndarray) whether every round is evaluated
+        """
+
+        if self.less_than:
+            passed = presel < self.threshold
+        else:
+            passed = presel > self.threshold
+
+        self._presel_counts.append(presel[evaluated])
+        click_evaluated = evaluated[rounds]
+        self._raw_data += np.bincount(bins[click_evaluated], minlength=self.n_bins)
+        self._data += np.bincount(bins[click_evaluated & passed[rounds]], minlength=self.n_bins)
+
+
+def save_tags(filename, channels, timestamps):
+    """ Saves time tags as NumPy files, which load_tags() maps into memory
+
+    :param filename: (str) path without extension, the tags are saved to
+        <filename>_channels.npy and <filename>_timestamps.npy
+    :param channels: (np.ndarray) channel of each tag
+    :param timestamps: (np.ndarray) timestamp of each tag in ps
+    """
+
+    np.save(f'{filename}_channels.npy', np.asarray(channels, dtype=np.int32))
+    np.save(f'{filename}_timestamps.npy', np.asarray(timestamps, dtype=np.int64))
+
+
+def load_tags(filename):
+    """ Maps time tags saved with save_tags() into memory, without reading them
+
+    :param filename: (str) path without extension, see save_tags()
+    :return: (tuple) memory-mapped arrays of the channels and timestamps
+    """
+
+    return (
+        np.load(f'{filename}_channels.npy', mmap_mode='r'),
+        np.load(f'{filename}_timestamps.npy', mmap_mode='r')
+    )
+
+
+def analyze(tags, measurements, chunk_size=CHUNK_SIZE, n_workers=1):
+    """ Evaluates measurements on recorded time tags
+
+    The tags are read in chunks, such that the memory used does not depend on
+    the length of the recording. With several workers, the recording is split
+    into segments of equal numbers of tags, which are evaluated in parallel
+    and merged. The segments are evaluated in separate processes if tags is
+    the filename of tags saved with save_tags(), and in threads otherwise,
+    which only run in parallel while NumPy releases the GIL. On Windows, scripts
+    using processes need an if __name__ == '__main__' guard.
+
+    :param tags: (str or tuple) filename of tags saved with save_tags(), or
+        arrays of the channels and timestamps in ps
+    :param measurements: (list) Measurement instances, which are cleared and
+        then hold the results
+    :param chunk_size: (int) number of tags read at once by each worker
+    :param n_workers: (int) number of parallel workers, None for the number of CPUs
+    :return: (list) measurements
+    """
+
+    timestamps = load_tags(tags)[1] if isinstance(tags, str) else tags[1]
+    n_tags = len(timestamps)
+    n_workers = os.cpu_count() if n_workers is None else n_workers
+    n_segments = max(min(n_workers, n_tags // MIN_SEGMENT_SIZE), 1)
+
+    for measurement in measurements:
+        measurement.clear()
+
+    if n_segments == 1:
+        return _analyze_segment(tags, measurements, 0, n_tags, chunk_size, copy_measurements=False)
+
+    bounds = np.linspace(0, n_tags, n_segments + 1).astype(np.int64)
+    pool = ProcessPoolExecutor if isinstance(tags, str) else ThreadPoolExecutor
+    with pool(max_workers=n_segments) as executor:
+        futures = [
+            executor.submit(_analyze_segment, tags, measurements, int(begin), int(end), chunk_size)
+            for begin, end in zip(bounds[:-1], bounds[1:])
+        ]
+        segments = [future.result() for future in futures]
+
+    for segment in segments:
+        for measurement, part in zip(measurements, segment):
+            measurement.merge(part)
+    return measurements
+
+
+def _analyze_segment(tags, measurements, begin, end, chunk_size, copy_measurements=True):
+    """ Evaluates the events anchored between the tags begin and end of a recording
+
+    Tags before the segment are read for the warmup of the measurements, and
+    tags after it until all events of the segment are complete.
+    """
+
+    channels, timestamps = load_tags(tags) if isinstance(tags, str) else tags
+    n_tags = len(timestamps)
+    if copy_measurements:
+        measurements = copy.deepcopy(measurements)
+
+    start_time = int(timestamps[begin]) if begin > 0 else None
+    stop_time = int(timestamps[end]) if end < n_tags else None
+    for measurement in measurements:
+        measurement.start_time = start_time
+        measurement.stop_time = stop_time
+
+    index = 0
+    if start_time is not None:
+        warmup = max(measurement.warmup for measurement in measurements)
+        index = np.searchsorted(timestamps, start_time - warmup, side='left')
+    past = n_tags if stop_time is None else np.searchsorted(timestamps, stop_time, side='left')
+
+    while index < n_tags:
+        if index >= past and all(measurement.is_complete() for measurement in measurements):
+            break
+
+        stop = min(index + chunk_size, n_tags)
+        chunk_channels = np.asarray(channels[index:stop])
+        chunk_timestamps = np.asarray(timestamps[index:stop])
+        for measurement in measurements:
+            measurement.process(chunk_channels, chunk_timestamps)
+        index = stop
+
+    for measurement in measurements:
+        measurement.flush()
+    return measurements
+
+
+def benchmark(n_tags=20000000, n_workers=None, seed=0):
+    """ Evaluates a histogram, a correlation and a gated counter on simulated
+    tags with a single and with several workers
+
+    :param n_tags: (int) number of simulated tags
+    :param n_workers: (int) number of parallel workers, None for the number of CPUs
+    :param seed: (int) seed of the simulated tags
+    :return: (dict) number of workers: duration in s
+    """
+
+    rng = np.random.default_rng(seed)
+    timestamps = np.cumsum(rng.integers(1, 20000, n_tags))
+    channels = rng.integers(1, 5, n_tags).astype(np.int32)
+
+    def measurements():
+        return [
+            Histogram(click_ch=1, start_ch=2, binwidth=100, n_bins=1000),
+            Correlation(ch_1=1, ch_2=3, binwidth=100, n_bins=1000),
+            GatedCounter(click_ch=1, begin_ch=4)
+        ]
+
+    n_workers = os.cpu_count() if n_workers is None else n_workers
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'tags')
+        save_tags(filename, channels, timestamps)
+        for workers in sorted({1, n_workers}):
+            start_time = time.time()
+            analyze(filename, measurements(), n_workers=workers)
+            results[workers] = time.time() - start_time
+
+    return results
+
+
+def main():
+
+    for n_workers, duration in benchmark().items():
+        print(f'{n_workers} workers: {duration:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ import TimeTagger as TT
 import time
 import numpy as np
 from pylabnet.utils.logging.logger import LogHandler
+from pylabnet.hardware.counter.swabian_instruments import tag_analysis
 
 
 class Wrap:
@@ -47,6 +48,16 @@ class Wrap:
         self._ctr = {}
         self._channels = {}
 
+        # Incremented whenever a measurement is created or cleared, such that
+        # clients can detect that their copy of its data is outdated
+        self._generations = {}
+
+        # Bin widths of count traces, used to locate their bins in time
+        self._trace_bin_widths = {}
+
+        # Tags read from time tag streams, see get_timetag_stream_chunk()
+        self._stream_buffers = {}
+
     def start_trace(self, name=None, ch_list=[1], bin_width=1000000000,
                     n_bins=10000):
         """Start counter - used for count-trace applications
@@ -63,6 +74,7 @@ class Wrap:
             name = str(len(self._ctr))
 
         # Instantiate Counter instance, see TT documentation
+        self._new_generation(name)
         self._ctr[name] = TT.Counter(
             self._tagger,
             channels=ch_list,
@@ -70,6 +82,8 @@ class Wrap:
             n_values=n_bins
         )
 
+        self._trace_bin_widths[name] = bin_width
+
         self.log.info('Set up count trace measurement on channel(s)'
                       f' {ch_list}')
 
@@ -84,6 +98,7 @@ class Wrap:
         name = self.handle_name(name)
 
         # Clear counter (see TT documentation)
+        self._new_generation(name)
         self._ctr[name].clear()
 
     def get_counts(self, name=None):
@@ -98,6 +113,56 @@ class Wrap:
         # Get count data (see TT documentation)
         return self._ctr[name].getData()
 
+    def get_counts_since(self, name=None, generation=None, cursor=None):
+        """Gets the bins of a count trace completed since a previous call,
+            such that clients can keep a copy of the trace up to date
+            without transferring the full array every time
+
+        The cursor is the number of bins completed since the trace was
+        started or cleared. The last bin of the previous call is sent again,
+        since it may not have been complete.
+
+        :param name: (str) identifier for the counter measurement
+        :param generation: (int) generation returned by the previous call
+        :param cursor: (int) cursor returned by the previous call
+        :return: (tuple) generation, cursor and 2D array of counts on all
+            channels. The array contains the last (new cursor - cursor + 1)
+            bins, or all bins if generation or cursor are outdated. The cursor
+            is None if the position of the bins is unknown.
+        """
+
+        name = self.handle_name(name)
+        current_generation = self._generations.get(name, 0)
+
+        # Make sure that no bin was completed while reading the data
+        new_cursor = None
+        for _ in range(3):
+            start_cursor = self._get_cursor(name)
+            counts = self._ctr[name].getData()
+            new_cursor = self._get_cursor(name)
+            if new_cursor == start_cursor:
+                break
+        else:
+            new_cursor = None
+
+        n_bins = counts.shape[-1]
+        if (generation != current_generation or cursor is None or new_cursor is None
+                or not 0 <= new_cursor - cursor < n_bins - 1):
+            return current_generation, new_cursor, counts
+
+        return current_generation, new_cursor, np.ascontiguousarray(
+            counts[..., n_bins - (new_cursor - cursor) - 1:]
+        )
+
+    def get_generation(self, name=None):
+        """Gets the generation of a measurement, which changes whenever it
+            is created or cleared
+
+        :param name: (str) identifier for the measurement
+        """
+
+        return self._generations.get(self.handle_name(name), 0)
+
     def get_bin_widths(self, name=None):
         """Gets a 2D array of binwidths on all channels. See the
             getBinWidths() method of Counter class in TT
@@ -136,6 +201,7 @@ class Wrap:
         ch_list = [self._get_channel(ch) for ch in ch_list]
 
         # Instantiate Counter instance, see TT documentation
+        self._new_generation(name)
         self._ctr[name] = TT.Countrate(
             self._tagger,
             channels=ch_list
@@ -169,6 +235,7 @@ class Wrap:
 
         if gated:
             if end_channel is None:
+                self._new_generation(name)
                 self._ctr[name] = TT.CountBetweenMarkers(
                     self._tagger,
                     self._get_channel(click_ch),
@@ -177,6 +244,7 @@ class Wrap:
                     n_values=bins
                 )
             else:
+                self._new_generation(name)
                 self._ctr[name] = TT.CountBetweenMarkers(
                     self._tagger,
                     self._get_channel(click_ch),
@@ -185,6 +253,7 @@ class Wrap:
                     n_values=bins
                 )
         else:
+            self._new_generation(name)
             self._ctr[name] = TT.CountBetweenMarkers(
                 self._tagger,
                 self._get_channel(click_ch),
@@ -220,6 +289,7 @@ class Wrap:
             )
             start_ch = name
 
+        self._new_generation(name)
         self._ctr[name] = TT.TimeDifferences(
             tagger=self._tagger,
             click_channel=self._get_channel(click_ch),
@@ -253,6 +323,7 @@ class Wrap:
             )
             ch_1 = label
 
+        self._new_generation(name)
         self._ctr[name] = TT.Correlation(
             tagger=self._tagger,
             channel_1=self._get_channel(ch_1),
@@ -265,16 +336,114 @@ class Wrap:
 
         channels = [self._get_channel(ch) for ch in channel_list]
 
+        self._new_generation(name)
         self._ctr[name] = TT.TimeTagStream(
             tagger=self._tagger,
             n_max_events=n_max_events,
             channels=channels
         )
+        self._stream_buffers[name] = tag_analysis.TagBuffer(n_max_events)
 
     def get_timetag_stream_data(self, name):
-        timetag_stream_buffer = self.get_counts(name=name)
-        return ([int(i) for i in timetag_stream_buffer.getChannels()],
-                [int(i) for i in timetag_stream_buffer.getTimestamps()])
+        """ Gets all tags of a time tag stream that were not retrieved yet
+
+        :param name: (str) name of the TimeTagStream measurement
+        :return: (tuple) arrays of the channels and timestamps in ps of the tags
+        """
+
+        self._read_stream(name)
+        index, channels, timestamps = self._stream_buffers[name].read()
+        self._stream_buffers[name].discard(index + len(timestamps))
+        return channels, timestamps
+
+    def get_timetag_stream_chunk(self, name, cursor=None, max_events=1000000):
+        """ Gets a bounded chunk of tags of a time tag stream
+
+        Tags are indexed by their position in the stream. A chunk is kept
+        until the next call with a cursor behind it, such that it can be
+        requested again if it was not received.
+
+        :param name: (str) name of the TimeTagStream measurement
+        :param cursor: (int) index of the first tag to get, i.e. index + number
+            of tags of the previous chunk. None to continue with the oldest tag
+            that was not discarded.
+        :param max_events: (int) maximal number of tags in the chunk
+        :return: (tuple) generation, index of the first tag of the chunk (larger
+            than cursor if tags were lost), channels and timestamps in ps
+        """
+
+        buffer = self._stream_buffers[name]
+        if buffer.end - max(buffer.start, cursor or 0) < max_events:
+            self._read_stream(name)
+
+        index, channels, timestamps = buffer.read(cursor, max_events)
+        return self._generations.get(name, 0), index, channels, timestamps
+
+    def start_stream_histogram(self, name, stream, click_ch, start_ch, binwidth=1000, n_bins=1000):
+        """ Sets up a start-stop histogram of the tags of a time tag stream,
+        evaluated on the server
+
+        The result is read with get_counts() and get_x_axis(), like the
+        histograms of the hardware.
+
+        :param name: (str) name of measurement for future reference
+        :param stream: (str) name of the TimeTagStream measurement providing the tags
+        :param click_ch: (int or str) index of click channel, or name if virtual
+        :param start_ch: (int or str) index of start channel, or name if virtual
+        :param binwidth: (int) width of bins in ps
+        :param n_bins: (int) number of bins
+        """
+
+        self._start_stream_reduction(name, stream, tag_analysis.Histogram(
+            click_ch=self._get_channel(click_ch),
+            start_ch=self._get_channel(start_ch),
+            binwidth=binwidth,
+            n_bins=n_bins
+        ))
+
+    def start_stream_correlation(self, name, stream, ch_1, ch_2, binwidth=1000, n_bins=1000):
+        """ Sets up a correlation of the tags of a time tag stream, evaluated
+        on the server, see start_correlation() and get_g2()
+
+        :param name: (str) name of measurement for future reference
+        :param stream: (str) name of the TimeTagStream measurement providing the tags
+        :param ch_1: (int or str) index of first channel, or name if virtual
+        :param ch_2: (int or str) index of second channel, or name if virtual
+        :param binwidth: (int) width of bins in ps
+        :param n_bins: (int) number of bins
+        """
+
+        self._start_stream_reduction(name, stream, tag_analysis.Correlation(
+            ch_1=self._get_channel(ch_1),
+            ch_2=self._get_channel(ch_2),
+            binwidth=binwidth,
+            n_bins=n_bins
+        ))
+
+    def start_stream_coincidences(self, name, stream, ch_1, ch_2, window=1000):
+        """ Sets up a coincidence counter for the tags of a time tag stream,
+        evaluated on the server. get_counts() returns the number of coincidences.
+
+        :param name: (str) name of measurement for future reference
+        :param stream: (str) name of the TimeTagStream measurement providing the tags
+        :param ch_1: (int or str) index of first channel, or name if virtual
+        :param ch_2: (int or str) index of second channel, or name if virtual
+        :param window: (int) coincidence window in ps
+        """
+
+        self._start_stream_reduction(name, stream, tag_analysis.Coincidences(
+            ch_1=self._get_channel(ch_1),
+            ch_2=self._get_channel(ch_2),
+            window=window
+        ))
+
+    def get_g2(self, name):
+        """ Gets the normalized correlation g2 of a hardware or stream correlation
+
+        :param name: (str) name of the correlation measurement
+        """
+
+        return self._ctr[name].getDataNormalized()
 
     def start(self, name):
         """ Starts a measurement.
@@ -396,9 +565,81 @@ class Wrap:
         new_trigger_val = self._tagger.getTriggerLevel(int(channel))
         self.log.info(f"Changed trigger level of channel {channel} to {new_trigger_val} V.")
 
+    def _start_stream_reduction(self, name, stream, measurement):
+
+        if stream not in self._stream_buffers:
+            raise ValueError(f'No time tag stream {stream}')
+
+        self._new_generation(name)
+        self._ctr[name] = _StreamReduction(self, stream, measurement)
+
+    def _read_stream(self, name):
+        """ Reads the new tags of a time tag stream into its buffer and reductions """
+
+        data = self._ctr[name].getData()
+        channels = np.asarray(data.getChannels())
+        timestamps = np.asarray(data.getTimestamps())
+
+        self._stream_buffers[name].append(channels, timestamps)
+        for ctr in self._ctr.values():
+            if isinstance(ctr, _StreamReduction) and ctr.stream == name and ctr.running:
+                ctr.measurement.process(channels, timestamps)
+
+    def _new_generation(self, name):
+        self._generations[name] = self._generations.get(name, 0) + 1
+
+    def _get_cursor(self, name):
+        """Returns the number of completed bins of a count trace, None if unknown"""
+
+        if name not in self._trace_bin_widths:
+            return None
+
+        try:
+            return int(self._ctr[name].getCaptureDuration() // self._trace_bin_widths[name])
+        except AttributeError:
+            return None
+
     @staticmethod
     def handle_name(name):
         if name is None:
             return '0'
         else:
             return name
+
+
+class _StreamReduction:
+    """ Measurement evaluating the tags of a time tag stream on the server,
+    with the interface of a TimeTagger measurement """
+
+    def __init__(self, wrap, stream, measurement):
+        """ Instantiates the running measurement
+
+        :param wrap: (Wrap) wrapper reading the stream
+        :param stream: (str) name of the TimeTagStream measurement
+        :param measurement: (tag_analysis.Measurement) evaluation of the tags
+        """
+
+        self.wrap = wrap
+        self.stream = stream
+        self.measurement = measurement
+        self.running = True
+
+    def getData(self):
+        self.wrap._read_stream(self.stream)
+        return self.measurement.get_data()
+
+    def getDataNormalized(self):
+        self.wrap._read_stream(self.stream)
+        return self.measurement.get_data_normalized()
+
+    def getIndex(self):
+        return self.measurement.get_index()
+
+    def clear(self):
+        self.measurement.clear()
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
@@ -7,6 +7,18 @@ class WavemeterInterface(abc.ABC):
     def get_wavelength(self, channel=1, units="Frequency (THz)"):
         pass
 
+    def get_wavelengths(self, channels, units="Frequency (THz)"):
+        """ Returns the wavelengths of several channels
+
+        Devices that can read several channels at once should override this.
+
+        :param channels: (list) channel numbers
+        :param units: "Frequency (THz)" or "Wavelength (nm)"
+        :return: (list) wavelength of each channel
+        """
+
+        return [self.get_wavelength(channel=channel, units=units) for channel in channels]
+
 
 class WavemeterError(Exception):
     pass
@@ -2,8 +2,25 @@
 
 """
 This file contains the pylabnet Hardware module class for a generic NI DAQ mx card.
+
+Creating, configuring and clearing a DAQmx task takes milliseconds, which
+dominates fast feedback loops that write or read a single sample per
+iteration. The Driver therefore keeps one committed task per physical channel
+in a TaskPool and reuses it for subsequent calls with the same configuration.
+Tasks are re-created if the configuration of a channel changes, if a cached
+task fails, or after invalidate_tasks() (e.g. if the device has been reset or
+is used by another program). Since a committed task keeps its resources
+reserved (e.g. the single AI timing engine of multiplexed cards), cached tasks
+on the same device are closed if a new task cannot reserve its resources.
+Channels competing for resources in this way are not cached any more, since
+their tasks would otherwise be closed and re-created on every call.
+
+In dummy mode, tasks are emulated by DummyTask, including the overhead of
+creating a task, such that the task pool can be benchmarked without hardware
+(see benchmark()).
 """
 
+import threading
 import nidaqmx
 import time
 import numpy as np
@@ -12,17 +29,17 @@ from pylabnet.hardware.interface.gated_ctr import GatedCtrInterface
 from pylabnet.utils.logging.logger import LogHandler
 from pylabnet.network.core.service_base import ServiceBase
 from pylabnet.network.core.client_base import ClientBase
-from pylabnet.utils.decorators.dummy_wrapper import dummy_wrap
 
 
 class Driver:
     """Driver for NI DAQmx card. Currently only implements setting AO voltage"""
     # TODO implement counter
 
-    def __init__(self, device_name, logger=None, dummy=False):
+    def __init__(self, device_name, logger=None, dummy=False, cache_tasks=True):
         """Instantiate NI DAQ mx card
 
         :device_name: (str) Name of NI DAQ mx card, as displayed in the measurement and automation explorer
+        :param cache_tasks: (bool) whether to reuse tasks between calls, see TaskPool
         """
 
         # Device name
@@ -70,8 +87,12 @@ class Driver:
                 self.log.info('Entering dummy mode instead')
 
         self.counters = {}
+        self.tasks = TaskPool(
+            new_task=DummyTask if self.dummy else nidaqmx.Task,
+            logger=self.log,
+            enabled=cache_tasks
+        )
 
-    @dummy_wrap
     def set_ao_voltage(self, ao_channel, voltages):
         """Set analog output of NI DAQ mx card to a series of voltages
 
@@ -82,9 +103,13 @@ class Driver:
         # TODO: Understand the timing between output voltages (sample-wise?)
         channel = self._gen_ch_path(ao_channel)
 
-        with nidaqmx.Task() as task:
+        def configure(task):
             task.ao_channels.add_ao_voltage_chan(channel)
-            task.write(voltages, auto_start=True)
+
+        return self.tasks.run(
+            channel, ('ao',), configure,
+            lambda task: task.write(voltages, auto_start=True)
+        )
 
     def get_ai_voltage(self, ai_channel, num_samples=1, max_range=10.0):
         """Measures the analog input voltage of NI DAQ mx card
@@ -94,11 +119,15 @@ class Driver:
         :param max_range: (float) Maximum range of voltage that will be measured
         """
         channel = self._gen_ch_path(ai_channel)
-        with nidaqmx.Task() as task:
+
+        def configure(task):
             task.ai_channels.add_ai_voltage_chan(channel)
             task.ai_channels[0].ai_rng_high = max_range
-            return task.read(number_of_samples_per_channel=num_samples)
-        return -1
+
+        return self.tasks.run(
+            channel, ('ai', max_range), configure,
+            lambda task: task.read(number_of_samples_per_channel=num_samples)
+        )
 
     def get_di_state(self, port, di_channel):
         """Measures the state of a digital Input of a of NI DAQ mx card
@@ -107,10 +136,115 @@ class Driver:
         :param channel: (str) channel name ['line1']
         """
         channel = self._gen_di_ch_path(port, di_channel)
-        with nidaqmx.Task() as task:
+
+        def configure(task):
             task.di_channels.add_di_chan(channel, line_grouping=nidaqmx.constants.LineGrouping.CHAN_PER_LINE)
-            return task.read(number_of_samples_per_channel=1)
-        return -1
+
+        return self.tasks.run(
+            channel, ('di',), configure,
+            lambda task: task.read(number_of_samples_per_channel=1)
+        )
+
+    def start_ao_stream(self, ao_channel, voltages, rate, continuous=True):
+        """Outputs a hardware-timed waveform on an analog output
+
+        :param ao_channel: (str) Name of output channel (e.g. 'ao1', 'ao2')
+        :param voltages: (list) voltages to output, sample by sample
+        :param rate: (float) sample rate in Hz
+        :param continuous: (bool) whether to regenerate the waveform until
+            stop_ao_stream() is called, otherwise it is output once
+        """
+
+        channel = self._gen_ch_path(ao_channel)
+        voltages = np.asarray(voltages, dtype=float)
+        sample_mode = (nidaqmx.constants.AcquisitionType.CONTINUOUS if continuous
+                       else nidaqmx.constants.AcquisitionType.FINITE)
+
+        def configure(task):
+            task.ao_channels.add_ao_voltage_chan(channel)
+            task.timing.cfg_samp_clk_timing(rate, sample_mode=sample_mode, samps_per_chan=len(voltages))
+
+        def start(task):
+            task.stop()
+            task.write(voltages, auto_start=False)
+            task.start()
+
+        self.tasks.run(channel, ('ao_stream', rate, continuous, len(voltages)), configure, start, persistent=True)
+
+    def stop_ao_stream(self, ao_channel):
+        """Stops a waveform started with start_ao_stream()
+
+        :param ao_channel: (str) Name of output channel (e.g. 'ao1', 'ao2')
+        """
+
+        self.tasks.invalidate(self._gen_ch_path(ao_channel))
+
+    def start_ai_stream(self, ai_channel, rate, buffer_size=100000, max_range=10.0):
+        """Starts a continuous hardware-timed acquisition on an analog input
+
+        Samples are buffered by the driver until they are read with read_ai_stream().
+
+        :param ai_channel: (str) Name of input channel (e.g. 'ai0')
+        :param rate: (float) sample rate in Hz
+        :param buffer_size: (int) number of samples to buffer
+        :param max_range: (float) Maximum range of voltage that will be measured
+        """
+
+        channel = self._gen_ch_path(ai_channel)
+
+        def configure(task):
+            task.ai_channels.add_ai_voltage_chan(channel)
+            task.ai_channels[0].ai_rng_high = max_range
+            task.timing.cfg_samp_clk_timing(
+                rate,
+                sample_mode=nidaqmx.constants.AcquisitionType.CONTINUOUS,
+                samps_per_chan=buffer_size
+            )
+
+        self.tasks.run(
+            channel, ('ai_stream', rate, buffer_size, max_range), configure,
+            lambda task: task.start(), persistent=True
+        )
+
+    def read_ai_stream(self, ai_channel, num_samples=None):
+        """Reads samples acquired by an acquisition started with start_ai_stream()
+
+        :param ai_channel: (str) Name of input channel (e.g. 'ai0')
+        :param num_samples: (int) number of samples to read (waits until they
+            are acquired), None to read all available samples
+
+        :return: (np.ndarray) acquired voltages
+        """
+
+        channel = self._gen_ch_path(ai_channel)
+        task = self.tasks.get(channel)
+        if task is None:
+            self.log.warn(f'No stream running on {channel}, use start_ai_stream() first')
+            return np.array([])
+
+        if num_samples is None:
+            num_samples = nidaqmx.constants.READ_ALL_AVAILABLE
+        return np.atleast_1d(task.read(number_of_samples_per_channel=num_samples))
+
+    def stop_ai_stream(self, ai_channel):
+        """Stops an acquisition started with start_ai_stream()
+
+        :param ai_channel: (str) Name of input channel (e.g. 'ai0')
+        """
+
+        self.tasks.invalidate(self._gen_ch_path(ai_channel))
+
+    def invalidate_tasks(self, channel=None):
+        """Closes cached tasks, they are re-created on the next call
+
+        :param channel: (str) channel name (e.g. 'ao1') whose task to close,
+            None to close all tasks
+        """
+
+        if channel is None:
+            self.tasks.invalidate()
+        else:
+            self.tasks.invalidate(self._gen_ch_path(channel))
 
     def create_timed_counter(
         self, counter_channel, physical_channel, duration=0.1, name=None
@@ -203,6 +337,279 @@ class Driver:
         return f"{self.dev}/{port}/{di_channel}"
 
 
+class TaskPool:
+    """ Cache of configured and committed DAQmx tasks, one per physical channel """
+
+    def __init__(self, new_task=None, logger=None, enabled=True):
+        """ Instantiates an empty pool
+
+        :param new_task: (callable) returns a new task, nidaqmx.Task by default
+        :param logger: instance of LogHandler
+        :param enabled: (bool) if False, every call creates and closes its own
+            task, as without the pool
+        """
+
+        self.new_task = nidaqmx.Task if new_task is None else new_task
+        self.log = LogHandler(logger=logger)
+        self.enabled = enabled
+
+        # Maps channel path to (configuration key, task, persistent)
+        self._tasks = {}
+        self._lock = threading.RLock()
+
+        # Channels whose tasks compete for the resources of their device
+        self._uncached = set()
+
+    def run(self, channel, key, configure, operation, persistent=False):
+        """ Runs operation with the task for a channel, creating it if needed
+
+        If a cached task fails, it is re-created and the operation is retried once.
+
+        :param channel: (str) full channel path, e.g. 'Dev1/ao0'
+        :param key: (tuple) configuration of the task, a task with a different
+            configuration on the same channel is closed
+        :param configure: (callable) configures a new task (adds the channel)
+        :param operation: (callable) operation to run with the task
+        :param persistent: (bool) whether the task runs until it is invalidated
+            (e.g. a stream), otherwise it is closed if another task on the
+            device needs its resources
+
+        :return: return value of operation
+        """
+
+        if not self.enabled:
+            task = self.new_task()
+            try:
+                configure(task)
+                return operation(task)
+            finally:
+                task.close()
+
+        with self._lock:
+            if channel in self._uncached and not persistent:
+                return self._run_uncached(channel, configure, operation)
+
+            cached = channel in self._tasks and self._tasks[channel][0] == key
+            task = self._get_task(channel, key, configure, persistent)
+            if task is None:
+                return self._run_uncached(channel, configure, operation)
+            try:
+                return operation(task)
+            except nidaqmx.DaqError:
+                if not cached:
+                    raise
+                self.log.warn(f'Cached task for {channel} failed, re-creating it')
+                self.invalidate(channel)
+                task = self._get_task(channel, key, configure, persistent)
+                if task is None:
+                    return self._run_uncached(channel, configure, operation)
+                return operation(task)
+
+    def get(self, channel):
+        """ Returns the cached task of a channel, or None """
+
+        with self._lock:
+            if channel in self._tasks:
+                return self._tasks[channel][1]
+        return None
+
+    def invalidate(self, channel=None):
+        """ Closes the task of a channel, or all tasks if channel is None
+
+        Closing all tasks also caches the tasks of competing channels again.
+        """
+
+        with self._lock:
+            if channel is None:
+                self._uncached.clear()
+            channels = list(self._tasks) if channel is None else [channel]
+            for name in channels:
+                if name in self._tasks:
+                    _, task, _ = self._tasks.pop(name)
+                    try:
+                        task.close()
+                    except nidaqmx.DaqError:
+                        self.log.warn(f'Failed to close NI DAQmx task for {name}')
+
+    def _get_task(self, channel, key, configure, persistent=False):
+        """ Returns the cached task of channel if it has configuration key, or a new one
+
+        :return: the task, or None if the channel competes with other channels
+            for the resources of the device and is not cached any more
+        """
+
+        if channel in self._tasks:
+            if self._tasks[channel][0] == key:
+                return self._tasks[channel][1]
+
+            # A channel can only be reserved by one task
+            self.invalidate(channel)
+
+        try:
+            task = self._new_task(configure)
+        except nidaqmx.DaqError:
+            # The resources may be reserved by cached tasks on other channels,
+            # e.g. the AI timing engine of multiplexed cards
+            released = self._release_device(channel)
+            if not released:
+                raise
+
+            # Caching the tasks of competing channels would close and re-create
+            # them whenever the channels alternate
+            if not persistent:
+                self.log.info(f'{channel} competes with {", ".join(released)}, not caching their tasks')
+                self._uncached.update(released)
+                self._uncached.add(channel)
+                return None
+            task = self._new_task(configure)
+
+        self._tasks[channel] = (key, task, persistent)
+        return task
+
+    def _new_task(self, configure):
+        """ Returns a new configured and committed task """
+
+        task = self.new_task()
+        try:
+            configure(task)
+
+            # Committing reserves the resources once, such that later (implicit)
+            # starts and stops are fast
+            task.control(nidaqmx.constants.TaskMode.TASK_COMMIT)
+        except nidaqmx.DaqError:
+            task.close()
+            raise
+
+        return task
+
+    def _run_uncached(self, channel, configure, operation):
+        """ Runs operation with a task that is closed afterwards, see run() """
+
+        task = self.new_task()
+        try:
+            configure(task)
+            try:
+                return operation(task)
+            except nidaqmx.DaqError:
+                # Another channel of the device may have been cached in the meantime
+                released = self._release_device(channel)
+                if not released:
+                    raise
+                self._uncached.update(released)
+                return operation(task)
+        finally:
+            task.close()
+
+    def _release_device(self, channel):
+        """ Closes the cached tasks on the device of channel, except persistent ones
+
+        :param channel: (str) full channel path, e.g. 'Dev1/ai0'
+        :return: (list) channels whose tasks were closed
+        """
+
+        device = channel.split('/')[0]
+        released = [
+            name for name, (_, _, persistent) in self._tasks.items()
+            if name.split('/')[0] == device and not persistent
+        ]
+        for name in released:
+            self.invalidate(name)
+        return released
+
+
+class DummyTask:
+    """ Emulation of nidaqmx.Task used in dummy mode
+
+    Emulates the overhead of creating and clearing a task with a delay.
+    Analog inputs read the last value written to any analog output plus noise,
+    hardware-timed inputs produce samples at their sample rate.
+    """
+
+    # Delay in s emulating the creation, configuration and clearing of a task
+    OVERHEAD = 2e-3
+
+    # Last value written to an analog output, shared by all dummy tasks
+    _ao_value = 0.0
+
+    def __init__(self):
+        time.sleep(self.OVERHEAD)
+        self.name = 'DummyTask'
+        self.ao_channels = _DummyChannels('ao')
+        self.ai_channels = _DummyChannels('ai')
+        self.di_channels = _DummyChannels('di')
+        self.timing = self
+        self._rate = None
+        self._start_time = None
+        self._samples_read = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def cfg_samp_clk_timing(self, rate, sample_mode=None, samps_per_chan=1000, **kwargs):
+        self._rate = rate
+
+    def control(self, action):
+        pass
+
+    def start(self):
+        self._start_time = time.time()
+        self._samples_read = 0
+
+    def stop(self):
+        self._start_time = None
+
+    def close(self):
+        self._start_time = None
+
+    def write(self, data, auto_start=False):
+        data = np.atleast_1d(data)
+        DummyTask._ao_value = float(data[-1])
+        return len(data)
+
+    def read(self, number_of_samples_per_channel=1):
+        if self.di_channels:
+            return [False]
+
+        num_samples = number_of_samples_per_channel
+        if self._rate is not None and self._start_time is not None:
+            available = int((time.time() - self._start_time) * self._rate) - self._samples_read
+            if num_samples == nidaqmx.constants.READ_ALL_AVAILABLE:
+                num_samples = available
+            elif num_samples > available:
+                time.sleep((num_samples - available) / self._rate)
+            self._samples_read += num_samples
+
+        data = DummyTask._ao_value + 1e-3 * np.random.randn(max(num_samples, 1))
+        if number_of_samples_per_channel == 1:
+            return float(data[0])
+        return list(data[:num_samples])
+
+
+class _DummyChannels(list):
+    """ Channel collection of a DummyTask """
+
+    def __init__(self, kind):
+        super().__init__()
+        self.kind = kind
+
+    def _add(self, channel, *args, **kwargs):
+        self.append(_DummyChannel(channel))
+        return self[-1]
+
+    add_ao_voltage_chan = add_ai_voltage_chan = add_di_chan = _add
+
+
+class _DummyChannel:
+    """ Channel of a DummyTask """
+
+    def __init__(self, name):
+        self.name = name
+        self.ai_rng_high = 10.0
+
+
 class TimedCounter:
     """ Hardware class for NI gated counter """
 
@@ -297,8 +704,37 @@ class TimedCounter:
         return self._status
 
 
+def benchmark(num_calls=200):
+    """ Compares single-sample calls with and without task pool in dummy mode
+
+    :param num_calls: (int) number of calls per method
+    :return: (dict) time per call in ms for each method
+    """
+
+    results = {}
+    for cache_tasks in (False, True):
+        driver = Driver('Dev1', dummy=True, cache_tasks=cache_tasks)
+        name = 'pooled' if cache_tasks else 'per_call'
+
+        start = time.perf_counter()
+        for index in range(num_calls):
+            driver.set_ao_voltage('ao0', [index * 1e-3])
+        results[f'ao_{name}_ms'] = (time.perf_counter() - start) / num_calls * 1e3
+
+        start = time.perf_counter()
+        for _ in range(num_calls):
+            driver.get_ai_voltage('ai0')
+        results[f'ai_{name}_ms'] = (time.perf_counter() - start) / num_calls * 1e3
+
+        driver.invalidate_tasks()
+
+    return results
+
+
+def main():
+    for key, value in benchmark().items():
+        print(f'{key:>16}: {value:.3f} ms per call')
+
+
 if __name__ == '__main__':
-    port = 'port1'
-    channel = 'line5'
-    dev = Driver('Dev1')
-    dev.get_di_state(port=port, di_channel=channel)
+    main()
@@ -44,8 +44,11 @@ import traceback
 import re
 import os
 import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pylabnet.utils.logging import logger
-from pylabnet.utils.helper_methods import get_ip, parse_args, hide_console, create_server, load_config, load_script_config, load_device_config, launch_device_server
+from pylabnet.utils.helper_methods import (get_ip, parse_args, hide_console, create_server, load_config, load_script_config,
+                                           load_device_config, launch_device_server, wait_for_server, SSHConnectionPool)
 from pylabnet.network.client_server import external_gui
 from pylabnet.network.core.service_base import ServiceBase
 from pylabnet.network.core.generic_server import GenericServer
@@ -109,6 +112,9 @@ class Launcher:
         # Containers for clients that servers that this launcher creates / connects to
         self.clients = {}
 
+        # SSH connections to the hosts of launched servers, kept open while the launcher runs
+        self.ssh_pool = SSHConnectionPool()
+
         # Script server
         self.script_server_port = None
         self.script_server = None
@@ -117,12 +123,15 @@ class Launcher:
     def launch(self):
         """ Launches/connects to required servers and runs the script """
 
-        if "servers" in self.config_dict:
-            self._launch_servers()
-        if not ('script_server' in self.config_dict and self.config_dict['script_server'] == 'False'):
-            self._launch_script_server()
-        hide_console()
-        self._launch_scripts()
+        try:
+            if "servers" in self.config_dict:
+                self._launch_servers()
+            if not ('script_server' in self.config_dict and self.config_dict['script_server'] == 'False'):
+                self._launch_script_server()
+            hide_console()
+            self._launch_scripts()
+        finally:
+            self.ssh_pool.close()
 
     def _connect_to_logger(self):
         """ Connects to the LogServer"""
@@ -248,8 +257,14 @@ class Launcher:
             self.clients[(server, device_id)] = mod.Client(host=host, port=port)
 
     def _launch_servers(self):
-        """ Searches through active servers and connects/launches them """
+        """ Searches through active servers and connects/launches them
+
+        The servers to launch or connect to are determined first (asking the
+        user if several servers match), then they are launched and connected
+        concurrently by a pool of launch_workers threads (8 by default).
+        """
 
+        startups = []
         for server in self.config_dict['servers']:
             module_name = server['type']
             if "script" in server and server["script"] == "True":
@@ -283,7 +298,79 @@ class Launcher:
                 optional_clients = False
                 self.logger.info('Optional Clients disabled')
 
-            self._connect_matched_servers(matches, module_name, server['config'], server_config, auto_connect, optional_clients)
+            startup = self._connect_matched_servers(
+                matches, module_name, server['config'], server_config, auto_connect, optional_clients
+            )
+            if startup is not None:
+                startups.append((f'{module_name} ({server["config"]})', startup))
+
+        self._run_startups(startups)
+
+    def _run_startups(self, startups):
+        """ Launches and connects to servers concurrently, and logs the time each one took
+
+        :param startups: (list) tuples of the server description and a function
+            launching and connecting to it
+        """
+
+        if not startups:
+            return
+
+        num_workers = int(self.config_dict.get('launch_workers', 8))
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = [(name, executor.submit(startup, self.ssh_pool)) for name, startup in startups]
+            timings = [(name, future.result()) for name, future in futures]
+
+        report = f'Started {len(startups)} servers in {time.time() - start_time:.1f} s'
+        for name, timing in sorted(timings, key=lambda item: -item[1]['total']):
+            report += f'\n{name}: ' + ', '.join(f'{step} {duration:.2f} s' for step, duration in timing.items())
+        self.logger.info(report)
+
+    def _launch_and_connect(self, module, config_name, device_id, ssh_pool=None):
+        """ Launches a new server and connects to it once it accepts connections
+
+        :param module: (str) name of module to launch (e.g. nidaqmx)
+        :param config_name: (str) name of the config file for the device server
+        :param device_id: (str) device_id of server
+        :param ssh_pool: (SSHConnectionPool) SSH connections to reuse
+        :return: (dict) durations of the 'launch', of the 'connect' including
+            waiting for the server, and 'total' in s
+        """
+
+        start_time = time.time()
+        address = launch_device_server(
+            server=module,
+            dev_config=config_name,
+            log_ip=self.log_ip,
+            log_port=self.log_port,
+            server_port=np.random.randint(1024, 49151),
+            debug=self.server_debug,
+            logger=self.logger,
+            ssh_pool=ssh_pool
+        )
+        launch_time = time.time()
+
+        if address is not None:
+            host, port = address
+            try:
+                wait_for_server(
+                    partial(self._connect_to_server, module, host, port, device_id),
+                    timeout=float(self.config_dict.get('startup_timeout', 30))
+                )
+            except ConnectionRefusedError:
+                self.logger.error(f'Failed to connect to {module}')
+
+        end_time = time.time()
+        return dict(launch=launch_time - start_time, connect=end_time - launch_time, total=end_time - start_time)
+
+    def _connect_existing(self, module, host, port, device_id, ssh_pool=None):
+        """ Connects to a running server, see _launch_and_connect() """
+
+        start_time = time.time()
+        self._connect_to_server(module, host, port, device_id)
+        duration = time.time() - start_time
+        return dict(connect=duration, total=duration)
 
     def _connect_matched_servers(self, matches, module, config_name, config, auto_connect, optional_clients):
         """ Connects to a list of servers that have been matched to a given device
@@ -295,6 +382,8 @@ class Launcher:
         :param config: (dict) actual config dict for the server
         :param auto_connect: (bool) whether or not to automatically connect to the device/server
         :param optional_clients: (bool) whether the current script should still run if it cannot connect to a desired client server
+        :return: (callable) function launching and/or connecting to the server,
+            see _run_startups(), None if there is nothing to do
         """
 
         device_id = config['device_id']
@@ -307,12 +396,6 @@ class Launcher:
         else:
             launch_stop = False
 
-        #specify the number of times we want to try to connect to a server
-        if 'num_connect_tries' in self.config_dict:
-            NUM_TRIES = self.config_dict['num_connect_tries']
-        else:
-            NUM_TRIES = 10
-
         # If there are no matches, launch and connect to the server manually
         if num_matches == 0:
             if launch_stop:
@@ -323,31 +406,12 @@ class Launcher:
             else:
                 self.logger.info(f'No active servers matching module {module_name}'
                                  ' were found. Instantiating a new server.')
-                host, port = launch_device_server(
-                    server=module,
-                    dev_config=config_name,
-                    log_ip=self.log_ip,
-                    log_port=self.log_port,
-                    server_port=np.random.randint(1024, 49151),
-                    debug=self.server_debug,
-                    logger=self.logger
-                )
-
-                tries = 0
-                while tries < NUM_TRIES:
-                    try:
-                        self._connect_to_server(module, host, port, device_id)
-                        tries = NUM_TRIES + 1
-                    except ConnectionRefusedError:
-                        time.sleep(0.1)
-                        tries += 1
-                if tries == NUM_TRIES:
-                    self.logger.error(f'Failed to connect to {module}')
+                return partial(self._launch_and_connect, module, config_name, device_id)
 
         # If there is exactly 1 match, try to connect automatically
         elif num_matches == 1 and auto_connect:
             self.logger.info(f'Found exactly 1 match for {module_name}.')
-            self._connect_to_server(module, matches[0].ip, matches[0].port, device_id)
+            return partial(self._connect_existing, module, matches[0].ip, matches[0].port, device_id)
 
         # If there are multiple matches, force the user to choose in the launched console
         else:
@@ -368,37 +432,16 @@ class Launcher:
                 app.processEvents()
             self.logger.info(f'User chose ({self.use_index})')
 
+            hide_console()
+
             # If the user's choice falls within a relevant GUI, attempt to connect.
-            try:
-                if self.use_index - 1 < 0:
-                    raise IndexError
+            if 0 < self.use_index <= len(matches):
                 host, port = matches[self.use_index - 1].ip, matches[self.use_index - 1].port
-                self._connect_to_server(module, host, port, device_id)
+                return partial(self._connect_existing, module, host, port, device_id)
 
             # If the user's choice did not exist, just launch a new GUI
-            except IndexError:
-                self.logger.info('Launching new server')
-                host, port = launch_device_server(
-                    server=module,
-                    dev_config=config_name,
-                    log_ip=self.log_ip,
-                    log_port=self.log_port,
-                    server_port=np.random.randint(1024, 49151),
-                    debug=self.server_debug,
-                    logger=self.logger
-                )
-
-                tries = 0
-                while tries < NUM_TRIES:
-                    try:
-                        self._connect_to_server(module, host, port, device_id)
-                        tries = NUM_TRIES + 1
-                    except ConnectionRefusedError:
-                        time.sleep(0.1)
-                        tries += 1
-                if tries == NUM_TRIES:
-                    self.logger.error(f'Failed to connect to {module}')
-            hide_console()
+            self.logger.info('Launching new server')
+            return partial(self._launch_and_connect, module, config_name, device_id)
 
     def find_index(self, params):
         """ Loads the index of device to use """
@@ -9,6 +9,9 @@ from pylabnet.utils.helper_methods import load_config, get_config_filepath
 
 class Service(ServiceBase):
 
+    # Receive curve data as raw buffers instead of pickles
+    use_array_codec = True
+
     def exposed_assign_plot(self, plot_widget, plot_label, legend_widget):
         return self._module.assign_plot(
             plot_widget=plot_widget,
@@ -57,8 +60,8 @@ class Service(ServiceBase):
         return self._module.assign_container(container_widget, container_label)
 
     def exposed_set_curve_data(self, data_pickle, plot_label, curve_label, error_pickle=None):
-        data = pickle.loads(data_pickle)
-        error = pickle.loads(error_pickle)
+        data = self.decode_data(data_pickle)
+        error = self.decode_data(error_pickle)
         return self._module.set_curve_data(
             data=data,
             plot_label=plot_label,
@@ -127,6 +130,8 @@ class Service(ServiceBase):
 
 class Client(ClientBase):
 
+    use_array_codec = True
+
     def assign_plot(self, plot_widget, plot_label, legend_widget):
         return self._service.exposed_assign_plot(
             plot_widget=plot_widget,
@@ -174,8 +179,8 @@ class Client(ClientBase):
         return self._service.exposed_assign_container(container_widget, container_label)
 
     def set_curve_data(self, data, plot_label, curve_label, error=None):
-        data_pickle = pickle.dumps(data)
-        error_pickle = pickle.dumps(error)
+        data_pickle = self.encode_data(data)
+        error_pickle = self.encode_data(error)
         return self._service.exposed_set_curve_data(
             data_pickle=data_pickle,
             plot_label=plot_label,
@@ -1,3 +1,5 @@
+import pickle
+
 from pylabnet.network.core.service_base import ServiceBase
 from pylabnet.network.core.client_base import ClientBase
 from pylabnet.hardware.interface.wavemeter import WavemeterInterface
@@ -11,8 +13,34 @@ class Service(ServiceBase):
             units=units
         )
 
+    def exposed_get_wavelengths(self, channels, units):
+        return pickle.dumps(self._module.get_wavelengths(
+            channels=list(channels),
+            units=units
+        ))
+
+    def topic_wavelengths(self, channels, units="Frequency(THz)"):
+        """ Frames of the wavelengths of several channels, see ClientBase.subscribe() """
+
+        return self._module.get_wavelengths(channels=list(channels), units=units)
+
 
 class Client(ClientBase, WavemeterInterface):
 
     def get_wavelength(self, channel=1, units="Frequency(THz)"):
         return self._service.exposed_get_wavelength(channel, units)
+
+    def get_wavelengths(self, channels, units="Frequency(THz)"):
+        """ Returns the wavelengths of several channels in a single call
+
+        :param channels: (list) channel numbers
+        :param units: "Frequency (THz)" or "Wavelength (nm)"
+        :return: (list) wavelength of each channel
+        """
+
+        try:
+            return pickle.loads(self._service.exposed_get_wavelengths(tuple(channels), units))
+
+        # Servers without batched readout
+        except AttributeError:
+            return super().get_wavelengths(channels, units=units)
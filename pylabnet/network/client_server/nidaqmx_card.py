@@ -21,6 +21,36 @@ class Service(ServiceBase):
         state = self._module.get_di_state(port=port, di_channel=di_channel)
         return pickle.dumps(state)
 
+    def exposed_start_ao_stream(self, ao_channel, voltage_pickle, rate, continuous=True):
+        voltages = pickle.loads(voltage_pickle)
+        return self._module.start_ao_stream(
+            ao_channel=ao_channel,
+            voltages=voltages,
+            rate=rate,
+            continuous=continuous
+        )
+
+    def exposed_stop_ao_stream(self, ao_channel):
+        return self._module.stop_ao_stream(ao_channel)
+
+    def exposed_start_ai_stream(self, ai_channel, rate, buffer_size, max_range):
+        return self._module.start_ai_stream(
+            ai_channel=ai_channel,
+            rate=rate,
+            buffer_size=buffer_size,
+            max_range=max_range
+        )
+
+    def exposed_read_ai_stream(self, ai_channel, num_samples=None):
+        voltages = self._module.read_ai_stream(ai_channel=ai_channel, num_samples=num_samples)
+        return self.encode_data(voltages)
+
+    def exposed_stop_ai_stream(self, ai_channel):
+        return self._module.stop_ai_stream(ai_channel)
+
+    def exposed_invalidate_tasks(self, channel=None):
+        return self._module.invalidate_tasks(channel)
+
     def exposed_create_timed_counter(
         self, counter_channel, physical_channel, duration=0.1, name=None
     ):
@@ -68,6 +98,49 @@ class Client(ClientBase):
         state_pickle = self._service.exposed_get_di_state(port=port, di_channel=di_channel)
         return pickle.loads(state_pickle)
 
+    def start_ao_stream(self, ao_channel, voltages, rate, continuous=True):
+        """Outputs a hardware-timed waveform on an analog output
+
+        :param ao_channel: (str) Name of output channel (e.g. 'ao1', 'ao2')
+        :param voltages: (list) voltages to output, sample by sample
+        :param rate: (float) sample rate in Hz
+        :param continuous: (bool) whether to regenerate the waveform until stopped
+        """
+        voltage_pickle = pickle.dumps(voltages)
+        return self._service.exposed_start_ao_stream(ao_channel, voltage_pickle, rate, continuous)
+
+    def stop_ao_stream(self, ao_channel):
+        return self._service.exposed_stop_ao_stream(ao_channel)
+
+    def start_ai_stream(self, ai_channel, rate, buffer_size=100000, max_range=10.0):
+        """Starts a continuous hardware-timed acquisition on an analog input
+
+        :param ai_channel: (str) Name of input channel (e.g. 'ai0')
+        :param rate: (float) sample rate in Hz
+        :param buffer_size: (int) number of samples to buffer
+        :param max_range: (float) Maximum range of voltage that will be measured
+        """
+        return self._service.exposed_start_ai_stream(ai_channel, rate, buffer_size, max_range)
+
+    def read_ai_stream(self, ai_channel, num_samples=None):
+        """Reads samples of a running acquisition
+
+        :param ai_channel: (str) Name of input channel (e.g. 'ai0')
+        :param num_samples: (int) number of samples to read, None for all available
+        :return: (np.ndarray) acquired voltages
+        """
+        return self.decode_data(self._service.exposed_read_ai_stream(ai_channel, num_samples))
+
+    def stop_ai_stream(self, ai_channel):
+        return self._service.exposed_stop_ai_stream(ai_channel)
+
+    def invalidate_tasks(self, channel=None):
+        """Closes cached tasks on the server, e.g. after a device reset
+
+        :param channel: (str) channel name (e.g. 'ao1'), None for all tasks
+        """
+        return self._service.exposed_invalidate_tasks(channel)
+
     def create_timed_counter(
         self, counter_channel, physical_channel, duration=0.1, name=None
     ):
@@ -1,4 +1,5 @@
 import pickle
+import numpy as np
 
 from pylabnet.network.core.service_base import ServiceBase
 from pylabnet.network.core.client_base import ClientBase
@@ -6,6 +7,9 @@ from pylabnet.network.core.client_base import ClientBase
 
 class Service(ServiceBase):
 
+    # Send count arrays as raw buffers instead of pickles
+    use_array_codec = True
+
     def exposed_start_trace(self, name, ch_list=[1], bin_width=1000000000,
                             n_bins=10000):
         ch_list = pickle.loads(ch_list)
@@ -21,19 +25,52 @@ class Service(ServiceBase):
 
     def exposed_get_counts(self, name):
         res_pickle = self._module.get_counts(name=name)
-        return pickle.dumps(res_pickle)
+        return self.encode_data(res_pickle)
 
-    def exposed_get_bin_widths(self, name):
-        res_pickle = self._module.get_bin_widths(name=name)
-        return pickle.dumps(res_pickle)
+    def exposed_get_counts_since(self, name, generation=None, cursor=None):
+        generation, cursor, counts = self._module.get_counts_since(
+            name=name,
+            generation=generation,
+            cursor=cursor
+        )
+        return generation, cursor, self.encode_data(counts)
+
+    def exposed_get_generation(self, name):
+        return self._module.get_generation(name=name)
+
+    def topic_counts(self, name, since=None):
+        """ Frames of the count trace name, see ClientBase.subscribe()
+
+        Frames only contain the bins completed since the oldest previous frame
+        of the subscribers, see get_counts_since().
+
+        :param since: (list) (generation, cursor) of the previous frame of each
+            subscriber, None for subscribers without a frame
+        :return: (tuple) (generation, cursor) of the frame and the frame
+            (generation, cursor, counts)
+        """
+
+        generation, cursor = None, None
+        if since and None not in since:
+            generations = {previous[0] for previous in since}
+            cursors = [previous[1] for previous in since]
+            if len(generations) == 1 and None not in cursors:
+                generation, cursor = generations.pop(), min(cursors)
+
+        generation, cursor, counts = self._module.get_counts_since(
+            name=name,
+            generation=generation,
+            cursor=cursor
+        )
+        return (generation, cursor), (generation, cursor, counts)
 
     def exposed_get_bin_widths(self, name):
         res_pickle = self._module.get_bin_widths(name=name)
-        return pickle.dumps(res_pickle)
+        return self.encode_data(res_pickle)
 
     def exposed_get_x_axis(self, name):
         res_pickle = self._module.get_x_axis(name=name)
-        return pickle.dumps(res_pickle)
+        return self.encode_data(res_pickle)
 
     def exposed_start_rate_monitor(self, name=None, ch_list=[1]):
         ch_list = pickle.loads(ch_list)
@@ -45,11 +82,32 @@ class Service(ServiceBase):
             ctr_index=ctr_index,
             integration=integration
         )
-        return pickle.dumps(res_pickle)
+        return self.encode_data(res_pickle)
 
     def exposed_get_timetag_stream_data(self, name):
-        res_pickle = self._module.get_timetag_stream_data(name=name)
-        return pickle.dumps(res_pickle)
+        channels, timestamps = self._module.get_timetag_stream_data(name=name)
+        return self.encode_data(channels), self.encode_data(timestamps)
+
+    def exposed_get_timetag_stream_chunk(self, name, cursor=None, max_events=1000000):
+        generation, index, channels, timestamps = self._module.get_timetag_stream_chunk(
+            name=name,
+            cursor=cursor,
+            max_events=max_events
+        )
+        return generation, index, self.encode_data(channels), self.encode_data(timestamps)
+
+    def exposed_start_stream_histogram(self, name, stream, click_ch, start_ch, binwidth=1000, n_bins=1000):
+        return self._module.start_stream_histogram(name, stream, click_ch, start_ch, binwidth, n_bins)
+
+    def exposed_start_stream_correlation(self, name, stream, ch_1, ch_2, binwidth=1000, n_bins=1000):
+        return self._module.start_stream_correlation(name, stream, ch_1, ch_2, binwidth, n_bins)
+
+    def exposed_start_stream_coincidences(self, name, stream, ch_1, ch_2, window=1000):
+        return self._module.start_stream_coincidences(name, stream, ch_1, ch_2, window)
+
+    def exposed_get_g2(self, name):
+        res_pickle = self._module.get_g2(name=name)
+        return self.encode_data(res_pickle)
 
     def exposed_start_gated_counter(self, name, click_ch, gate_ch, gated=True, bins=1000, end_channel=None):
         return self._module.start_gated_counter(name, click_ch, gate_ch, gated, bins, end_channel=end_channel)
@@ -92,6 +150,16 @@ class Service(ServiceBase):
 
 class Client(ClientBase):
 
+    use_array_codec = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Local copies of count traces and x axes, see get_counts_incremental()
+        # and get_x_axis()
+        self._count_traces = {}
+        self._x_axes = {}
+
     def start_trace(self, name=None, ch_list=[1], bin_width=1000000000, n_bins=10000):
         """Start counter - used for count-trace applications
 
@@ -128,17 +196,76 @@ class Client(ClientBase):
         """
 
         res_pickle = self._service.exposed_get_counts(name=name)
-        return pickle.loads(res_pickle)
+        return self.decode_data(res_pickle)
 
-    def get_bin_widths(self, name=None):
-        """Gets a 2D array of counts on all channels. See the
-            getData() method of Counter class in TT
+    def get_counts_since(self, name=None, generation=None, cursor=None):
+        """Gets the bins of a count trace completed since a previous call
 
         :param name: (str) identifier for the counter measurement
+        :param generation: (int) generation returned by the previous call
+        :param cursor: (int) cursor returned by the previous call
+        :return: (tuple) generation, cursor and 2D array of the new bins on
+            all channels, or of all bins if generation or cursor are outdated
         """
 
-        res_pickle = self._service.exposed_get_bin_widths(name=name)
-        return pickle.loads(res_pickle)
+        generation, cursor, res_pickle = self._service.exposed_get_counts_since(
+            name=name,
+            generation=generation,
+            cursor=cursor
+        )
+        return generation, cursor, self.decode_data(res_pickle)
+
+    def get_counts_incremental(self, name=None):
+        """Gets the same 2D array of counts as get_counts(), but only
+            transfers the bins completed since the previous call
+
+        The full trace is kept locally and shifted by the number of new bins,
+        such that the transferred data scales with the update rate instead of
+        the number of bins.
+
+        :param name: (str) identifier for the counter measurement
+        """
+
+        state = self._count_traces.get(name, (None, None, None))
+
+        try:
+            update = self.get_counts_since(
+                name=name,
+                generation=state[0],
+                cursor=state[1]
+            )
+
+        # Fall back to the full array for servers without incremental access
+        except AttributeError:
+            return self.get_counts(name=name)
+
+        self._count_traces[name] = _merge_counts(state, *update)
+        return self._count_traces[name][2].copy()
+
+    def get_generation(self, name=None):
+        """Gets the generation of a measurement, which changes whenever it
+            is created or cleared
+
+        :param name: (str) identifier for the measurement
+        """
+
+        return self._service.exposed_get_generation(name=name)
+
+    def _frame_decoder(self, topic):
+        """ Frames of the counts topic are merged into a local copy of the
+            trace, such that subscriptions get the full 2D array of counts """
+
+        if topic != 'counts':
+            return super()._frame_decoder(topic)
+
+        state = (None, None, None)
+
+        def decode(payload):
+            nonlocal state
+            state = _merge_counts(state, *self.decode_data(payload, copy=False))
+            return state[2].copy()
+
+        return decode
 
     def get_bin_widths(self, name=None):
         """Gets a 2D array of counts on all channels. See the
@@ -148,17 +275,34 @@ class Client(ClientBase):
         """
 
         res_pickle = self._service.exposed_get_bin_widths(name=name)
-        return pickle.loads(res_pickle)
+        return self.decode_data(res_pickle)
 
-    def get_x_axis(self, name=None):
+    def get_x_axis(self, name=None, cached=False):
         """Gets the x axis in picoseconds for the count array.
             See the getIndex() method of Counter class in TT
 
         :param name: (str) identifier for the counter measurement
+        :param cached: (bool) whether to reuse the axis of a previous call,
+            it is only transferred again if the measurement was re-created
+            or cleared in the meantime
         """
 
+        if cached:
+            try:
+                generation = self.get_generation(name=name)
+            except AttributeError:
+                generation = None
+
+            cached_generation, x_axis = self._x_axes.get(name, (None, None))
+            if x_axis is not None and generation is not None and generation == cached_generation:
+                return x_axis
+
         res_pickle = self._service.exposed_get_x_axis(name=name)
-        return pickle.loads(res_pickle)
+        x_axis = self.decode_data(res_pickle)
+
+        if cached:
+            self._x_axes[name] = (generation, x_axis)
+        return x_axis
 
     def start_rate_monitor(self, name=None, ch_list=[1]):
         """Sets up a measurement for count rates
@@ -183,15 +327,87 @@ class Client(ClientBase):
             ctr_index=ctr_index,
             integration=integration
         )
-        return pickle.loads(res_pickle)
+        return self.decode_data(res_pickle)
 
     def get_timetag_stream_data(self, name):
         """ returns channels and timestamps of TimeTagStream object in a tuple
         :param name: (str) name of TimeTagStream instance
         """
 
-        res_pickle = self._service.exposed_get_timetag_stream_data(name)
-        return pickle.loads(res_pickle)
+        channels, timestamps = self._service.exposed_get_timetag_stream_data(name)
+        return self.decode_data(channels), self.decode_data(timestamps)
+
+    def get_timetag_stream_chunk(self, name, cursor=None, max_events=1000000):
+        """ Gets a bounded chunk of tags of a TimeTagStream as raw arrays
+
+        Pass index + number of tags of the previous chunk as cursor to get
+        the following chunk:
+
+            index, channels, timestamps = ctr.get_timetag_stream_chunk(name)[1:]
+            cursor = index + len(timestamps)
+
+        :param name: (str) name of TimeTagStream instance
+        :param cursor: (int) index of the first tag to get, None to continue
+            with the oldest tag that was not discarded
+        :param max_events: (int) maximal number of tags in the chunk
+        :return: (tuple) generation of the stream, index of the first tag
+            (larger than cursor if tags were lost), channels and timestamps in ps
+        """
+
+        generation, index, channels, timestamps = self._service.exposed_get_timetag_stream_chunk(
+            name, cursor=cursor, max_events=max_events
+        )
+        return generation, index, self.decode_data(channels), self.decode_data(timestamps)
+
+    def start_stream_histogram(self, name, stream, click_ch, start_ch, binwidth=1000, n_bins=1000):
+        """ Sets up a start-stop histogram of the tags of a TimeTagStream,
+        evaluated on the server such that only the histogram is transferred
+
+        :param name: (str) name of measurement for future reference
+        :param stream: (str) name of TimeTagStream instance providing the tags
+        :param click_ch: (int or str) index of click channel, or name if virtual
+        :param start_ch: (int or str) index of start channel, or name if virtual
+        :param binwidth: (int) width of bins in ps
+        :param n_bins: (int) number of bins
+        """
+
+        return self._service.exposed_start_stream_histogram(name, stream, click_ch, start_ch, binwidth, n_bins)
+
+    def start_stream_correlation(self, name, stream, ch_1, ch_2, binwidth=1000, n_bins=1000):
+        """ Sets up a correlation of the tags of a TimeTagStream, evaluated
+        on the server, see get_g2()
+
+        :param name: (str) name of measurement for future reference
+        :param stream: (str) name of TimeTagStream instance providing the tags
+        :param ch_1: (int or str) index of first channel, or name if virtual
+        :param ch_2: (int or str) index of second channel, or name if virtual
+        :param binwidth: (int) width of bins in ps
+        :param n_bins: (int) number of bins
+        """
+
+        return self._service.exposed_start_stream_correlation(name, stream, ch_1, ch_2, binwidth, n_bins)
+
+    def start_stream_coincidences(self, name, stream, ch_1, ch_2, window=1000):
+        """ Sets up a coincidence counter for the tags of a TimeTagStream,
+        evaluated on the server. get_counts() returns the number of coincidences.
+
+        :param name: (str) name of measurement for future reference
+        :param stream: (str) name of TimeTagStream instance providing the tags
+        :param ch_1: (int or str) index of first channel, or name if virtual
+        :param ch_2: (int or str) index of second channel, or name if virtual
+        :param window: (int) coincidence window in ps
+        """
+
+        return self._service.exposed_start_stream_coincidences(name, stream, ch_1, ch_2, window)
+
+    def get_g2(self, name):
+        """ Gets the normalized correlation g2 of a correlation measurement
+
+        :param name: (str) name of the correlation or stream correlation
+        """
+
+        res_pickle = self._service.exposed_get_g2(name)
+        return self.decode_data(res_pickle)
 
     def start_gated_counter(self, name, click_ch, gate_ch, gated=True, bins=1000, end_channel=None):
         """ Starts a new gated counter
@@ -333,3 +549,27 @@ class Client(ClientBase):
 
     def set_trigger_level(self, channel, voltage):
         return self._service.exposed_set_trigger_level(channel, voltage)
+
+
+def _merge_counts(state, generation, cursor, counts):
+    """ Merges the bins returned by get_counts_since() into a local copy of a trace
+
+    :param state: (tuple) generation, cursor and trace of the previous merge,
+        (None, None, None) initially
+    :param generation: (int) generation of the new bins
+    :param cursor: (int) cursor of the new bins
+    :param counts: (np.ndarray) new bins on all channels
+    :return: (tuple) generation, cursor and updated trace
+    """
+
+    old_generation, old_cursor, trace = state
+    if (trace is None or generation != old_generation or old_cursor is None or cursor is None
+            or counts.shape[:-1] != trace.shape[:-1] or counts.shape[-1] >= trace.shape[-1]):
+        trace = np.array(counts)
+    else:
+        shift = cursor - old_cursor
+        if shift > 0:
+            trace[..., :-shift] = trace[..., shift:]
+        trace[..., -counts.shape[-1]:] = counts
+
+    return generation, cursor, trace
@@ -0,0 +1,172 @@
+""" Binary transport of NumPy arrays between pylabnet servers and clients
+
+By default, data-bearing services pickle their return values before sending them
+over the rpyc connection. For large NumPy arrays (e.g. histograms) this is
+wasteful, since the pickle stream is built and parsed in Python and the data is
+copied several times per call.
+
+This module provides a light-weight codec which transports an array as its raw
+buffer preceded by a small header containing the dtype and shape. Payloads can
+optionally be compressed with zlib. Decoding an uncompressed payload does not
+copy the data - the returned array is a read-only view into the received bytes.
+
+Only NumPy arrays are encoded with the binary format, all other objects are
+pickled as before. Since binary payloads are identified by a magic prefix,
+decode() accepts both formats, such that clients remain compatible with
+services that still send pickles.
+
+Services and clients opt in via the `use_array_codec` attribute of ServiceBase
+and ClientBase and then use their encode_data()/decode_data() methods.
+decode_data() returns writeable copies unless it is called with copy=False.
+"""
+
+import pickle
+import struct
+import time
+import zlib
+import numpy as np
+
+
+# Identifies payloads encoded with this codec (pickles start with b'\x80')
+MAGIC = b'PLNA\x01'
+
+# Flags stored in the header
+FLAG_COMPRESSED = 0b1
+
+# Header layout: magic, flags, length of dtype string, number of dimensions
+_HEADER_STRUCT = struct.Struct('<5sBBB')
+_SHAPE_ITEM_STRUCT = struct.Struct('<Q')
+
+
+def encode(data, compress=False, compress_level=1):
+    """ Encode data for transport over the network.
+
+    :param data: object to be sent. NumPy arrays are encoded as raw buffer
+        plus header, all other objects are pickled.
+    :param compress: (bool) whether to compress the array buffer with zlib
+    :param compress_level: (int) zlib compression level (1 is fastest)
+
+    :return: (bytes) encoded payload
+    """
+
+    # Object arrays cannot be represented by a raw buffer
+    if not isinstance(data, np.ndarray) or data.dtype.hasobject:
+        return pickle.dumps(data)
+
+    if not data.flags.c_contiguous:
+        data = np.ascontiguousarray(data)
+    dtype_str = data.dtype.str.encode('ascii')
+    buffer = data.reshape(-1).view(np.uint8).data
+
+    flags = 0
+    if compress:
+        buffer = zlib.compress(buffer, compress_level)
+        flags |= FLAG_COMPRESSED
+
+    header = _HEADER_STRUCT.pack(MAGIC, flags, len(dtype_str), data.ndim)
+    shape = b''.join(_SHAPE_ITEM_STRUCT.pack(dim) for dim in data.shape)
+
+    return b''.join((header, dtype_str, shape, buffer))
+
+
+def decode(payload, copy=False):
+    """ Decode a payload created by encode() or by pickle.dumps().
+
+    :param payload: (bytes) encoded payload
+    :param copy: (bool) if True, arrays are copied into a new writeable
+        array. Otherwise uncompressed arrays are read-only views into payload.
+
+    :return: decoded object
+    """
+
+    if not is_array_payload(payload):
+        return pickle.loads(payload)
+
+    _, flags, dtype_len, ndim = _HEADER_STRUCT.unpack_from(payload, 0)
+    offset = _HEADER_STRUCT.size
+
+    dtype = np.dtype(bytes(payload[offset:offset + dtype_len]).decode('ascii'))
+    offset += dtype_len
+
+    shape = tuple(
+        _SHAPE_ITEM_STRUCT.unpack_from(payload, offset + i * _SHAPE_ITEM_STRUCT.size)[0]
+        for i in range(ndim)
+    )
+    offset += ndim * _SHAPE_ITEM_STRUCT.size
+
+    if flags & FLAG_COMPRESSED:
+        buffer = zlib.decompress(payload[offset:])
+        offset = 0
+    else:
+        buffer = payload
+
+    data = np.reshape(np.frombuffer(
+        buffer,
+        dtype=dtype,
+        count=int(np.prod(shape, dtype=np.int64)),
+        offset=offset
+    ), shape)
+
+    if copy:
+        data = data.copy()
+
+    return data
+
+
+def is_array_payload(payload):
+    """ Returns True if payload was encoded as binary array by encode() """
+
+    return bytes(payload[:len(MAGIC)]) == MAGIC
+
+
+def benchmark(sizes=(int(1e3), int(1e4), int(1e5), int(1e6), int(1e7)), dtype=np.int32, repeats=5):
+    """ Compares the array codec with the pickle round-trip used by services.
+
+    Times encoding on the server side plus decoding on the client side, but
+    not the network transfer itself (which is the same for all methods up to
+    the payload size).
+
+    :param sizes: (iterable) array sizes to test
+    :param dtype: dtype of the test arrays
+    :param repeats: (int) number of round-trips averaged per measurement
+
+    :return: (list) of dicts with the results for each size
+    """
+
+    methods = dict(
+        pickle=(pickle.dumps, pickle.loads),
+        codec=(encode, decode),
+        codec_zlib=(lambda data: encode(data, compress=True), decode)
+    )
+
+    results = []
+    for size in sizes:
+        # Histogram-like data: mostly small counts, compresses well
+        data = np.random.poisson(lam=2, size=size).astype(dtype)
+        result = dict(size=size)
+
+        for method, (enc, dec) in methods.items():
+            start = time.perf_counter()
+            for _ in range(repeats):
+                payload = enc(data)
+                dec(payload)
+            result[f'{method}_ms'] = (time.perf_counter() - start) / repeats * 1e3
+            result[f'{method}_bytes'] = len(payload)
+
+        results.append(result)
+
+    return results
+
+
+def main():
+    print(f'{"size":>10} | {"method":>10} | {"time [ms]":>10} | {"payload [B]":>12}')
+    for result in benchmark():
+        for method in ('pickle', 'codec', 'codec_zlib'):
+            print(
+                f'{result["size"]:>10.0e} | {method:>10} | '
+                f'{result[f"{method}_ms"]:>10.3f} | {result[f"{method}_bytes"]:>12d}'
+            )
+
+
+if __name__ == "__main__":
+    main()
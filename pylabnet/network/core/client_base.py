@@ -1,11 +1,25 @@
 import rpyc
 import os
+import pickle
+import threading
 from socket import timeout
 from ssl import SSLError
+from pylabnet.network.core import array_codec, shm_transport
+from pylabnet.network.core.pubsub import Subscription
 from pylabnet.utils.helper_methods import get_os, UnsupportedOSException
 
 
 class ClientBase:
+
+    # Set to True in subclasses to send NumPy arrays as raw buffers
+    # (see array_codec) instead of pickles
+    use_array_codec = False
+    compress_arrays = False
+
+    # Exchange large arrays through shared memory if the server runs on the
+    # same host (only used together with use_array_codec)
+    use_shared_memory = True
+
     def __init__(self, host, port, key='pylabnet.pem'):
         """ Connects to server
 
@@ -23,6 +37,17 @@ class ClientBase:
         self._connection = None
         self._service = None
 
+        # Shared memory transport, set if the server runs on the same host
+        self._shm_transport = None
+
+        # Thread serving the frames pushed by the server, see subscribe()
+        self._bg_thread = None
+        self._bg_stop = threading.Event()
+        self._bg_lock = threading.Lock()
+
+        # Active subscriptions and their (topic, rate, kwargs), renewed on reconnection
+        self._subscriptions = {}
+
         # Connect to server
         self.connect(host=host, port=port, key=key)
 
@@ -41,6 +66,7 @@ class ClientBase:
             self._port = port
 
         # Clean-up old connection if it exists
+        self._stop_bg_thread()
         if self._connection is not None or self._service is not None:
             try:
                 self._connection.close()
@@ -50,6 +76,10 @@ class ClientBase:
             self._connection = None
             self._service = None
 
+        if self._shm_transport is not None:
+            self._shm_transport.close()
+            self._shm_transport = None
+
         # Connect to server
         try:
             if key is None:
@@ -76,6 +106,8 @@ class ClientBase:
                     certfile=key
                 )
             self._service = self._connection.root
+            self._setup_shared_memory()
+            self._resubscribe()
 
             return 0
 
@@ -120,6 +152,152 @@ class ClientBase:
             self._service = None
             raise exc_obj
 
+    def _setup_shared_memory(self):
+        """ Enables the shared memory transport if the server runs on the same host """
+
+        if not (self.use_array_codec and self.use_shared_memory and shm_transport.AVAILABLE):
+            return
+
+        try:
+            same_host = self._service.exposed_enable_shared_memory(shm_transport.get_host_token())
+        except AttributeError:
+            # Server does not support shared memory
+            same_host = False
+
+        if same_host:
+            self._shm_transport = shm_transport.SharedMemoryTransport()
+
+    def subscribe(self, topic, rate=10, callback=None, **kwargs):
+        """ Subscribes to a topic, whose frames are pushed by the server
+
+        Instead of polling the server, the returned Subscription waits for
+        frames, see Subscription.get(). Frames that are not read in time are
+        replaced by newer ones.
+
+        :param topic: (str) name of the topic, see the topic_<name>() methods of the service
+        :param rate: (float) rate of frames in Hz
+        :param callback: (callable) optional function called with every frame,
+            from a background thread
+        :param kwargs: keyword arguments for the topic method of the service
+        :return: (Subscription) subscription, to be closed with close()
+        """
+
+        subscription = Subscription(self, self._frame_decoder(topic), callback=callback)
+        self._start_subscription(subscription, topic, rate, kwargs)
+        self._subscriptions[subscription] = (topic, rate, kwargs)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """ Ends a subscription
+
+        :param subscription: (Subscription) subscription returned by subscribe()
+        """
+
+        self._subscriptions.pop(subscription, None)
+        if subscription.id is None:
+            return
+        try:
+            self._service.exposed_unsubscribe(subscription.id)
+        except EOFError:
+            # Connection closed, the server drops the subscription itself
+            pass
+        subscription.id = None
+
+    def _start_subscription(self, subscription, topic, rate, kwargs):
+        """ Subscribes to a topic on the current connection, see subscribe() """
+
+        # Serve the callbacks of the server in the background
+        with self._bg_lock:
+            if self._bg_thread is None:
+                self._bg_stop.clear()
+                self._bg_thread = threading.Thread(
+                    target=self._serve_requests,
+                    args=(self._connection,),
+                    name='ClientBase serving thread',
+                    daemon=True
+                )
+                self._bg_thread.start()
+
+        subscription.id = self._service.exposed_subscribe(
+            topic, subscription._receive, rate=rate, kwargs=pickle.dumps(kwargs)
+        )
+
+    def _resubscribe(self):
+        """ Renews the active subscriptions after connecting, since the server
+        drops the subscriptions of a closed connection """
+
+        for subscription, (topic, rate, kwargs) in list(self._subscriptions.items()):
+            subscription.id = None
+            try:
+                self._start_subscription(subscription, topic, rate, kwargs)
+            except Exception as exc_obj:
+                del self._subscriptions[subscription]
+                subscription._fail(exc_obj)
+                print(f'Failed to renew the subscription to {topic}: {exc_obj}')
+
+    def _frame_decoder(self, topic):
+        """ Returns the function decoding the frames of a topic, see subscribe()
+
+        Called once per subscription. Clients of incremental topics return a
+        function merging each frame into a local copy of the data.
+
+        :param topic: (str) name of the topic
+        :return: (callable) function converting a received payload into a frame
+        """
+
+        return self.decode_data
+
+    def _serve_requests(self, connection):
+        """ Serves the requests of the server (e.g. pushed frames) until stopped
+
+        Unlike rpyc.BgServingThread, this does not sleep between requests,
+        which would limit the rate of frames.
+        """
+
+        while not self._bg_stop.is_set():
+            try:
+                connection.serve(0.1)
+            except EOFError:
+                # Connection closed
+                break
+
+    def _stop_bg_thread(self):
+
+        with self._bg_lock:
+            if self._bg_thread is not None:
+                self._bg_stop.set()
+                self._bg_thread.join()
+                self._bg_thread = None
+
+    def encode_data(self, data):
+        """ Encodes data to be sent to the server
+
+        :param data: object to send, NumPy arrays are sent as raw buffers
+            if use_array_codec is set, and through shared memory if the
+            server additionally runs on the same host
+        :return: (bytes) encoded data
+        """
+
+        if self.use_array_codec:
+            if self._shm_transport is not None:
+                return self._shm_transport.encode(data, compress=self.compress_arrays)
+            return array_codec.encode(data, compress=self.compress_arrays)
+        return pickle.dumps(data)
+
+    def decode_data(self, payload, copy=True):
+        """ Decodes data received from the server (pickled, array_codec or shared memory)
+
+        :param payload: (bytes) data received from the server
+        :param copy: (bool) whether to return arrays as writeable copies. Otherwise
+            uncompressed arrays received through the socket are read-only views of
+            the payload, which saves a copy if the caller does not modify them
+        :return: decoded data
+        """
+
+        if self._shm_transport is not None:
+            return self._shm_transport.decode(payload, copy=copy)
+        return array_codec.decode(payload, copy=copy)
+
     def close_server(self):
         """ Closes the server to which the LogClient is connected"""
 
@@ -0,0 +1,261 @@
+""" Server-push subscriptions between pylabnet servers and clients
+
+Monitoring scripts usually poll their servers in a tight loop, which keeps a
+CPU core busy and transfers the same data many times per second. Instead, a
+client can subscribe to a topic of a service, and the server pushes new frames
+of data to it at a given rate:
+
+    subscription = client.subscribe('counts', rate=20, name='ctr')
+    while running:
+        counts = subscription.get(timeout=1)   # blocks until the next frame
+
+On the server side, a topic is a method topic_<name>(**kwargs) of the service
+returning the data of a frame. A Publisher produces the frames of a topic in a
+ControlLoop thread and sends them to all of its subscribers as asynchronous
+rpyc callbacks. The frames are encoded once per tick, however many clients
+are subscribed. Subscribers with the same topic and arguments share a
+publisher.
+
+Slow consumers are handled by coalescing, so a backlog never builds up:
+ - The server sends a subscriber a new frame only after the client has
+   received its previous frame. Frames produced in the meantime are skipped.
+ - The client only keeps the latest frame. Unread frames are replaced by
+   newer ones.
+
+Topics whose method takes a since argument are incremental, i.e. a frame only
+contains what changed since the previous frame of each subscriber. The method
+receives the positions of the previous frames of the due subscribers (None for
+subscribers without a frame yet) and returns the position of the new frame
+along with its data. The client merges every received frame into its own copy
+of the data, see ClientBase._frame_decoder().
+"""
+
+import itertools
+import threading
+import time
+
+import rpyc
+
+from pylabnet.utils.control_loop import ControlLoop
+from pylabnet.utils.logging.logger import LogHandler
+
+
+# Time in s after which a subscriber that does not receive its frames is removed
+SUBSCRIBER_TIMEOUT = 30
+
+_subscription_ids = itertools.count(1)
+
+
+class _Subscriber:
+    """ Server-side state of a subscribed client """
+
+    def __init__(self, callback, rate):
+
+        self.callback = rpyc.async_(callback)
+        self.rate = rate
+        self.next_time = 0
+        self.position = None
+        self.pending = None
+        self.pending_since = 0
+        self.sent = 0
+        self.skipped = 0
+
+
+class Publisher:
+    """ Pushes the frames of a topic to all of its subscribers """
+
+    def __init__(self, produce, encode, name='Publisher', logger=None, incremental=False):
+        """ Instantiates the publisher, which starts with the first subscriber
+
+        :param produce: (callable) function returning the data of a frame
+        :param encode: (callable) function encoding the data for the network
+        :param name: (str) name of the publisher thread
+        :param logger: (LogClient) instance of LogClient for error logging
+        :param incremental: (bool) whether produce takes the list of positions
+            of the previous frames of the due subscribers, and returns the
+            position of the new frame and its data
+        """
+
+        self.produce = produce
+        self.encode = encode
+        self.incremental = incremental
+        self.name = name
+        self.log = LogHandler(logger)
+
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def subscribe(self, callback, rate):
+        """ Adds a subscriber
+
+        :param callback: (callable) function called with every encoded frame
+        :param rate: (float) maximal rate of frames for this subscriber in Hz
+        :return: (int) subscription id
+        """
+
+        subscription_id = next(_subscription_ids)
+        with self._lock:
+            self._subscribers[subscription_id] = _Subscriber(callback, rate)
+
+            # The loop runs at the highest requested rate
+            if self._loop is None:
+                self._loop = ControlLoop(self._step, rate, logger=self.log, name=self.name, report_interval=None)
+                self._loop.start()
+            else:
+                self._loop.rate = max(self._loop.rate, rate)
+
+        return subscription_id
+
+    def unsubscribe(self, subscription_id):
+        """ Removes a subscriber, the publisher stops if it has none left
+
+        :param subscription_id: (int) id returned by subscribe()
+        :return: (bool) whether the publisher has subscribers left
+        """
+
+        loop = None
+        with self._lock:
+            self._subscribers.pop(subscription_id, None)
+            active = bool(self._subscribers)
+            if not active:
+                loop, self._loop = self._loop, None
+
+        # Stopped outside of the lock, which the current step might be waiting for
+        if loop is not None:
+            loop.stop()
+        return active
+
+    def has_subscriber(self, subscription_id):
+        return subscription_id in self._subscribers
+
+    def stats(self):
+        """ Returns the number of frames 'sent' to and 'skipped' for each subscriber """
+
+        with self._lock:
+            return {
+                subscription_id: dict(sent=subscriber.sent, skipped=subscriber.skipped)
+                for subscription_id, subscriber in self._subscribers.items()
+            }
+
+    def _step(self):
+        """ Produces a frame and sends it to all subscribers that are due """
+
+        now = time.monotonic()
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+
+        due = []
+        for subscription_id, subscriber in subscribers:
+            if now < subscriber.next_time:
+                continue
+
+            # Coalesce frames while the previous one has not been received yet
+            if subscriber.pending is not None and not subscriber.pending.ready:
+                if now - subscriber.pending_since > SUBSCRIBER_TIMEOUT:
+                    self.log.warn(f'{self.name}: removing unresponsive subscriber {subscription_id}')
+                    self.unsubscribe(subscription_id)
+                else:
+                    subscriber.skipped += 1
+                continue
+
+            if subscriber.pending is not None and subscriber.pending.error:
+                self.unsubscribe(subscription_id)
+                continue
+
+            due.append((subscription_id, subscriber))
+
+        if not due:
+            return
+
+        if self.incremental:
+            position, data = self.produce([subscriber.position for _, subscriber in due])
+        else:
+            position, data = None, self.produce()
+        payload = self.encode(data)
+
+        for subscription_id, subscriber in due:
+            try:
+                subscriber.pending = subscriber.callback(payload)
+            except Exception:
+                # The client disconnected
+                self.unsubscribe(subscription_id)
+                continue
+
+            subscriber.pending_since = now
+            subscriber.position = position
+            subscriber.sent += 1
+            subscriber.next_time = max(subscriber.next_time + 1 / subscriber.rate, now)
+
+
+class Subscription:
+    """ Client-side end of a subscription, keeps the latest received frame """
+
+    def __init__(self, client, decode, callback=None):
+        """ Instantiates the subscription, see ClientBase.subscribe()
+
+        :param client: (ClientBase) client which subscribed
+        :param decode: (callable) function decoding the received payloads
+        :param callback: (callable) optional function called with every frame,
+            from the thread serving the connection
+        """
+
+        self.client = client
+        self.id = None
+        self.received = 0
+        self.missed = 0
+
+        self._decode = decode
+        self._callback = callback
+        self._condition = threading.Condition()
+        self._frame = None
+        self._new_frame = False
+        self._error = None
+
+    @property
+    def latest(self):
+        """ Latest received frame, None if no frame was received yet """
+
+        return self._frame
+
+    def get(self, timeout=None):
+        """ Waits for a frame that was not returned before
+
+        :param timeout: (float) maximal time to wait in s, None to wait forever
+        :return: the latest frame, or None if no new frame arrived in time
+        """
+
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._new_frame or self._error is not None, timeout):
+                return None
+            if self._error is not None:
+                raise ConnectionError(f'Subscription could not be renewed after reconnecting: {self._error}')
+            self._new_frame = False
+            return self._frame
+
+    def close(self):
+        """ Ends the subscription """
+
+        self.client.unsubscribe(self)
+
+    def _fail(self, error):
+        """ Called by the client if the subscription could not be renewed after reconnecting """
+
+        with self._condition:
+            self._error = error
+            self._condition.notify_all()
+
+    def _receive(self, payload):
+        """ Called by the server with every frame """
+
+        frame = self._decode(payload)
+        with self._condition:
+            if self._new_frame:
+                self.missed += 1
+            self._frame = frame
+            self._new_frame = True
+            self.received += 1
+            self._condition.notify_all()
+
+        if self._callback is not None:
+            self._callback(frame)
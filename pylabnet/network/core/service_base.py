@@ -1,7 +1,12 @@
 import rpyc
 import os
+import pickle
 import ctypes
+import inspect
 import signal
+import threading
+from pylabnet.network.core import array_codec, shm_transport
+from pylabnet.network.core.pubsub import Publisher
 from pylabnet.utils.logging.logger import LogHandler
 from pylabnet.utils.helper_methods import get_os
 
@@ -11,6 +16,19 @@ class ServiceBase(rpyc.Service):
     _module = None
     log = LogHandler()
 
+    # Set to True in subclasses to send NumPy arrays as raw buffers
+    # (see array_codec) instead of pickles
+    use_array_codec = False
+    compress_arrays = False
+
+    # Per-connection state. The ThreadedServer serves each connection in its
+    # own thread, so thread-local storage is local to the connection.
+    _connection_local = threading.local()
+
+    # Maximal rate in Hz at which frames are pushed to subscribers, see
+    # exposed_subscribe(). Topics are provided by methods topic_<name>(**kwargs).
+    max_publish_rate = 100
+
     def on_connect(self, conn):
         # code that runs when a connection is created
         # (to init the service, if needed)
@@ -19,6 +37,12 @@ class ServiceBase(rpyc.Service):
     def on_disconnect(self, conn):
         # code that runs after the connection has already closed
         # (to finalize the service, if needed)
+        transport = getattr(self._connection_local, 'shm_transport', None)
+        if transport is not None:
+            transport.close()
+            self._connection_local.shm_transport = None
+        for subscription_id in list(getattr(self._connection_local, 'subscriptions', ())):
+            self.exposed_unsubscribe(subscription_id)
         self.log.info('Client disconnected')
 
     def assign_module(self, module):
@@ -27,6 +51,135 @@ class ServiceBase(rpyc.Service):
     def assign_logger(self, logger=None):
         self.log = LogHandler(logger=logger)
 
+    def exposed_enable_shared_memory(self, host_token):
+        """ Enables the shared memory transport for the calling connection if
+        the client runs on the same host
+
+        :param host_token: (str) host token of the client, see shm_transport.get_host_token()
+        :return: (bool) whether shared memory will be used
+        """
+
+        if not (self.use_array_codec and shm_transport.AVAILABLE):
+            return False
+        if host_token != shm_transport.get_host_token():
+            return False
+
+        if getattr(self._connection_local, 'shm_transport', None) is None:
+            self._connection_local.shm_transport = shm_transport.SharedMemoryTransport()
+        return True
+
+    def exposed_subscribe(self, topic, callback, rate=10, kwargs=None):
+        """ Subscribes to a topic, whose frames are pushed to the client
+
+        :param topic: (str) name of the topic, provided by the method topic_<topic>()
+        :param callback: (callable) client function called with every encoded frame
+        :param rate: (float) rate of frames in Hz, limited to max_publish_rate
+        :param kwargs: (bytes) pickled dict of keyword arguments for the topic method
+        :return: (int) subscription id
+        """
+
+        try:
+            produce = getattr(self, f'topic_{topic}')
+        except AttributeError:
+            raise ValueError(f'Unknown topic {topic}')
+
+        kwargs = {} if kwargs is None else pickle.loads(kwargs)
+        rate = min(float(rate), self.max_publish_rate)
+
+        # Subscribers with identical arguments share the frames of a publisher
+        key = (topic, repr(sorted(kwargs.items())))
+        with self._publishers_lock:
+            publisher = self._publishers.get(key)
+            if publisher is None:
+                # Incremental topics take the positions of the previous frames
+                if 'since' in inspect.signature(produce).parameters:
+                    publisher = Publisher(
+                        lambda since: produce(since=since, **kwargs),
+                        self._encode_frame,
+                        name=f'Publisher {topic}',
+                        logger=self.log,
+                        incremental=True
+                    )
+                else:
+                    publisher = Publisher(
+                        lambda: produce(**kwargs),
+                        self._encode_frame,
+                        name=f'Publisher {topic}',
+                        logger=self.log
+                    )
+                self._publishers[key] = publisher
+            subscription_id = publisher.subscribe(callback, rate)
+
+        # Remembered to end the subscriptions when the client disconnects
+        if getattr(self._connection_local, 'subscriptions', None) is None:
+            self._connection_local.subscriptions = []
+        self._connection_local.subscriptions.append(subscription_id)
+        return subscription_id
+
+    def exposed_unsubscribe(self, subscription_id):
+        """ Ends a subscription
+
+        :param subscription_id: (int) id returned by exposed_subscribe() to the
+            calling connection, ids of other connections are ignored
+        """
+
+        subscriptions = getattr(self._connection_local, 'subscriptions', None)
+        if subscriptions is None or subscription_id not in subscriptions:
+            return
+        subscriptions.remove(subscription_id)
+
+        with self._publishers_lock:
+            for publisher in self._publishers.values():
+                if publisher.has_subscriber(subscription_id):
+                    publisher.unsubscribe(subscription_id)
+                    break
+
+    @property
+    def _publishers(self):
+        # Created on first use, since subclasses do not call __init__ of ServiceBase
+        return self.__dict__.setdefault('_publisher_dict', {})
+
+    @property
+    def _publishers_lock(self):
+        return self.__dict__.setdefault('_publisher_lock', threading.RLock())
+
+    def _encode_frame(self, data):
+        """ Encodes a frame for all subscribers, without shared memory """
+
+        if self.use_array_codec:
+            return array_codec.encode(data, compress=self.compress_arrays)
+        return pickle.dumps(data)
+
+    def encode_data(self, data):
+        """ Encodes data to be returned to the client
+
+        :param data: object to send, NumPy arrays are sent as raw buffers
+            if use_array_codec is set, and through shared memory if the
+            client additionally runs on the same host
+        :return: (bytes) encoded data
+        """
+
+        if self.use_array_codec:
+            transport = getattr(self._connection_local, 'shm_transport', None)
+            if transport is not None:
+                return transport.encode(data, compress=self.compress_arrays)
+            return array_codec.encode(data, compress=self.compress_arrays)
+        return pickle.dumps(data)
+
+    def decode_data(self, payload, copy=True):
+        """ Decodes data received from the client (pickled, array_codec or shared memory)
+
+        :param payload: (bytes) data received from the client
+        :param copy: (bool) whether to return arrays as writeable copies, see
+            ClientBase.decode_data()
+        :return: decoded data
+        """
+
+        transport = getattr(self._connection_local, 'shm_transport', None)
+        if transport is not None:
+            return transport.decode(payload, copy=copy)
+        return array_codec.decode(payload, copy=copy)
+
     def close_server(self):
         """ Closes the server for which the service is running """
 
@@ -0,0 +1,220 @@
+""" Shared-memory transport of NumPy arrays for clients and servers on the same host
+
+Most device servers and scripts run on the same lab PC, in which case sending
+large arrays through the (SSL) socket of the rpyc connection is unnecessary.
+Instead, the sender copies the array into a `multiprocessing.shared_memory`
+segment and only sends a small descriptor (segment name, dtype and shape) over
+rpyc. The receiver attaches to the segment and copies the array out of it.
+
+Segments are owned by the sending SharedMemoryTransport and reused for
+subsequent calls (they are only re-created if a larger array has to be sent),
+such that no segment is created per call. Receivers keep their attachments
+open for the same reason. A segment is marked busy by the sender and released
+by the receiver once it has copied the array, such that concurrent calls never
+overwrite an array that has not been read yet. If all segments are busy, the
+array is sent through the socket.
+
+Whether client and server share a host is negotiated when the client connects:
+the client sends its host token (see get_host_token()) and the service enables
+the transport for this connection if it matches its own.
+
+Requires Python >= 3.8. On older versions AVAILABLE is False and all data is
+sent through the socket as before.
+"""
+
+import os
+import socket
+import struct
+import threading
+import uuid
+import numpy as np
+
+from pylabnet.network.core import array_codec
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+    AVAILABLE = True
+except ImportError:
+    shared_memory = None
+    AVAILABLE = False
+
+
+# Identifies payloads containing a shared memory descriptor
+MAGIC = b'PLNS\x01'
+
+# Arrays smaller than this (in bytes) are sent through the socket
+SHM_THRESHOLD = 1 << 16
+
+# Segments start with a flag which is set while the segment holds an unread array
+_BUSY = 1
+_FREE = 0
+_DATA_OFFSET = 16
+
+# Header layout: magic, segment index, length of segment name, length of dtype string, number of dimensions
+_HEADER_STRUCT = struct.Struct('<5sBBBB')
+_SHAPE_ITEM_STRUCT = struct.Struct('<Q')
+
+
+def get_host_token():
+    """ Returns a string identifying the current machine """
+
+    return f'{socket.gethostname()}-{uuid.getnode()}'
+
+
+def is_shm_payload(payload):
+    """ Returns True if payload contains a shared memory descriptor """
+
+    return bytes(payload[:len(MAGIC)]) == MAGIC
+
+
+class SharedMemoryTransport:
+    """ Sends and receives arrays through shared memory segments
+
+    Each transport owns a pool of segments used for sending, one per array that
+    has not been read by the receiver yet.
+    """
+
+    def __init__(self, max_segments=8, threshold=SHM_THRESHOLD):
+        """ Instantiates the transport
+
+        :param max_segments: (int) maximal number of send segments, i.e. of
+            arrays in flight, up to 255
+        :param threshold: (int) minimal array size in bytes to send through
+            shared memory
+        """
+
+        self.max_segments = max_segments
+        self.threshold = threshold
+
+        self._send_segments = []
+        self._recv_segments = {}
+        self._lock = threading.Lock()
+
+    def encode(self, data, compress=False):
+        """ Encode data for sending
+
+        Large arrays are copied into a shared memory segment and replaced by a
+        descriptor, everything else is encoded with array_codec.
+
+        :param data: object to send
+        :param compress: (bool) whether to compress arrays sent through the socket
+        :return: (bytes) payload
+        """
+
+        if (not isinstance(data, np.ndarray) or data.dtype.hasobject
+                or data.nbytes < self.threshold):
+            return array_codec.encode(data, compress=compress)
+
+        with self._lock:
+            index = self._get_send_segment(data.nbytes)
+            if index is not None:
+                segment = self._send_segments[index]
+                segment.buf[0] = _BUSY
+                np.ndarray(data.shape, dtype=data.dtype, buffer=segment.buf, offset=_DATA_OFFSET)[...] = data
+
+        # All segments hold arrays that have not been read yet
+        if index is None:
+            return array_codec.encode(data, compress=compress)
+
+        name = segment.name.encode('ascii')
+        dtype_str = data.dtype.str.encode('ascii')
+        header = _HEADER_STRUCT.pack(MAGIC, index, len(name), len(dtype_str), data.ndim)
+        shape = b''.join(_SHAPE_ITEM_STRUCT.pack(dim) for dim in data.shape)
+
+        return b''.join((header, name, dtype_str, shape))
+
+    def decode(self, payload, copy=False):
+        """ Decode a payload created by encode(), array_codec.encode() or pickle.dumps()
+
+        Arrays received through shared memory are always copied out of the
+        segment, which is then released for the sender to reuse.
+
+        :param payload: (bytes) payload
+        :param copy: (bool) whether to copy arrays of array_codec payloads,
+            see array_codec.decode()
+        :return: decoded object
+        """
+
+        if not is_shm_payload(payload):
+            return array_codec.decode(payload, copy=copy)
+
+        _, _, name_len, dtype_len, ndim = _HEADER_STRUCT.unpack_from(payload, 0)
+        offset = _HEADER_STRUCT.size
+
+        name = bytes(payload[offset:offset + name_len]).decode('ascii')
+        offset += name_len
+        dtype = np.dtype(bytes(payload[offset:offset + dtype_len]).decode('ascii'))
+        offset += dtype_len
+        shape = tuple(
+            _SHAPE_ITEM_STRUCT.unpack_from(payload, offset + i * _SHAPE_ITEM_STRUCT.size)[0]
+            for i in range(ndim)
+        )
+
+        with self._lock:
+            segment = self._get_recv_segment(name)
+            data = np.ndarray(shape, dtype=dtype, buffer=segment.buf, offset=_DATA_OFFSET).copy()
+            segment.buf[0] = _FREE
+
+        return data
+
+    def close(self):
+        """ Releases all segments, unlinking the ones owned by this transport """
+
+        with self._lock:
+            for segment in self._send_segments:
+                segment.close()
+                segment.unlink()
+            self._send_segments = []
+
+            for segment in self._recv_segments.values():
+                segment.close()
+            self._recv_segments = {}
+
+    def _get_send_segment(self, nbytes):
+        """ Returns the index of a free send segment with room for nbytes
+
+        A free segment that is too small is re-created if the pool is full.
+
+        :param nbytes: (int) size of the array
+        :return: (int) index of the segment, None if all segments are busy
+        """
+
+        size = nbytes + _DATA_OFFSET
+        free = [index for index, segment in enumerate(self._send_segments) if segment.buf[0] == _FREE]
+        for index in free:
+            if self._send_segments[index].size >= size:
+                return index
+
+        if len(self._send_segments) < self.max_segments:
+            self._send_segments.append(None)
+            index = len(self._send_segments) - 1
+        elif free:
+            index = free[0]
+            self._send_segments[index].close()
+            self._send_segments[index].unlink()
+        else:
+            return None
+
+        # Over-allocate to avoid re-creation for slowly growing arrays
+        self._send_segments[index] = shared_memory.SharedMemory(create=True, size=int(size * 1.25))
+        return index
+
+    def _get_recv_segment(self, name):
+        """ Returns attachment to the segment with the given name """
+
+        if name not in self._recv_segments:
+            segment = shared_memory.SharedMemory(name=name)
+
+            # Only the sender may unlink the segment, but on POSIX the resource
+            # tracker would unlink it when the receiving process exits (bpo-39959)
+            if os.name == 'posix':
+                resource_tracker.unregister(segment._name, 'shared_memory')
+
+            self._recv_segments[name] = segment
+
+            # Segments of the sender that have been re-created are stale
+            if len(self._recv_segments) > 2 * self.max_segments:
+                stale_name = next(iter(self._recv_segments))
+                self._recv_segments.pop(stale_name).close()
+
+        return self._recv_segments[name]
@@ -14,6 +14,9 @@ import pyqtgraph as pg
 from PyQt5 import QtWidgets
 
 
+# Default rate in Hz at which the server pushes histograms to the display
+FRAME_RATE = 20
+
 class TimeTrace:
     """ Convenience class for handling time-trace measurements """
 
@@ -288,6 +291,9 @@ class TimeTraceGui(TimeTrace):
         self.gui.apply_stylesheet()
         self.fitting = False
 
+        # Subscriptions to the histograms, see _subscribe()
+        self._subscriptions = {}
+
     def clear_all(self):
         """ Clears all plots """
 
@@ -371,20 +377,25 @@ class TimeTraceGui(TimeTrace):
         self.is_paused = False
         last_save = time.time()
         last_clear = last_save
-        while not self.is_paused:
-
-            if self.gui.autosave.isChecked():
-                current_time = time.time()
-                if current_time - last_save > self.gui.save_time.value():
-                    self.save()
-                    last_save = current_time
-            if self.gui.auto_clear.isChecked():
-                current_time = time.time()
-                if current_time - last_clear > self.gui.clear_time.value():
-                    self.clear_all()
-                    last_clear = current_time
-            self._update_data()
-            self.gui.force_update()
+        self._subscribe()
+        try:
+            while not self.is_paused:
+
+                if self.gui.autosave.isChecked():
+                    current_time = time.time()
+                    if current_time - last_save > self.gui.save_time.value():
+                        self.save()
+                        last_save = current_time
+                if self.gui.auto_clear.isChecked():
+                    current_time = time.time()
+                    if current_time - last_clear > self.gui.clear_time.value():
+                        self.clear_all()
+                        last_clear = current_time
+                if self._wait_for_data():
+                    self._update_data()
+                self.gui.force_update()
+        finally:
+            self._unsubscribe()
 
     def init_plot(self):
         """ Initializes the plot """
@@ -409,12 +420,57 @@ class TimeTraceGui(TimeTrace):
                 self.gates[gate_name].ctr.get_counts(self.gates[gate_name].hist)[0]
             )
 
+    def _subscribe(self):
+        """ Subscribes to the histograms, which are then pushed by the server """
+
+        frame_rate = float(self.config.get('frame_rate', FRAME_RATE))
+        traces = [self] + list(self.gates.values())
+        for trace in traces:
+            try:
+                self._subscriptions[trace.hist] = trace.ctr.subscribe('counts', rate=frame_rate, name=trace.hist)
+
+            # Servers without subscriptions are polled
+            except AttributeError:
+                pass
+
+    def _unsubscribe(self):
+        """ Ends the subscriptions to the histograms """
+
+        for subscription in self._subscriptions.values():
+            subscription.close()
+        self._subscriptions = {}
+
+    def _wait_for_data(self):
+        """ Waits for the next frame of the histogram, limiting the update rate
+
+        :return: (bool) whether new data is available
+        """
+
+        subscription = self._subscriptions.get(self.hist)
+        if subscription is None:
+            time.sleep(1 / float(self.config.get('frame_rate', FRAME_RATE)))
+            return True
+
+        # Short timeout to keep the GUI responsive
+        return subscription.get(timeout=0.1) is not None
+
+    def _get_counts(self, trace):
+        """ Returns the latest counts of a histogram
+
+        :param trace: (TimeTrace) histogram measurement, e.g. self or a gate
+        """
+
+        subscription = self._subscriptions.get(trace.hist)
+        if subscription is None or subscription.latest is None:
+            return trace.ctr.get_counts(trace.hist)
+        return subscription.latest
+
     def _update_data(self):
         """ Adds latest data to the plot """
 
         self.curve.setData(
-            self.ctr.get_x_axis(self.hist) / 1e12,
-            self.ctr.get_counts(self.hist)[0]
+            self.ctr.get_x_axis(self.hist, cached=True) / 1e12,
+            self._get_counts(self)[0]
         )
 
         if self.fitting:
@@ -422,21 +478,21 @@ class TimeTraceGui(TimeTrace):
 
         for gate_name, gate_curve in self.gate_curves.items():
             gate_curve.setData(
-                self.gates[gate_name].ctr.get_x_axis(self.gates[gate_name].hist) / 1e12,
-                self.gates[gate_name].ctr.get_counts(self.gates[gate_name].hist)[0]
+                self.gates[gate_name].ctr.get_x_axis(self.gates[gate_name].hist, cached=True) / 1e12,
+                self._get_counts(self.gates[gate_name])[0]
             )
 
     def _update_fit(self):
         """ Updates fits """
         if self.fit_popup.mod is not None and self.fit_popup.mod.init_params is not None:
-            self.fit_popup.data = np.array(self.ctr.get_counts(self.hist)[0])
-            self.fit_popup.x = np.array(self.ctr.get_x_axis(self.hist) / 1e12)
+            self.fit_popup.data = np.array(self._get_counts(self)[0])
+            self.fit_popup.x = np.array(self.ctr.get_x_axis(self.hist, cached=True) / 1e12)
             if self.p0 is not None:
                 self.fit_popup.p0 = self.p0
             self.fit, self.p0 = self.fit_popup.fit_mod()
             if self.fit_popup.fit_suc:
                 self.fit_curve.setData(
-                    self.ctr.get_x_axis(self.hist) / 1e12,
+                    self.ctr.get_x_axis(self.hist, cached=True) / 1e12,
                     self.fit
                 )
 
@@ -11,6 +11,9 @@ from pylabnet.network.client_server import si_tt
 from pylabnet.utils.helper_methods import load_script_config, get_ip, unpack_launcher, load_config, get_gui_widgets, get_legend_from_graphics_view, find_client, load_script_config
 
 
+# Default rate in Hz at which the server pushes counts to the display
+FRAME_RATE = 20
+
 # Static methods
 
 # def generate_widgets():
@@ -48,6 +51,7 @@ class CountMonitor:
         self._n_bins = None
         self._ch_list = None
         self._plot_list = None  # List of channels to assign to each plot (e.g. [[1,2], [3,4]])
+        self._frame_rate = FRAME_RATE
         self._plots_assigned = []  # List of plots on the GUI that have been assigned
 
         if self.combined_channel:
@@ -101,13 +105,14 @@ class CountMonitor:
         # Initialize counter instance
         self._ctr = ctr
 
-    def set_params(self, bin_width=1e9, n_bins=1e4, ch_list=[1], plot_list=None):
+    def set_params(self, bin_width=1e9, n_bins=1e4, ch_list=[1], plot_list=None, frame_rate=FRAME_RATE):
         """ Sets counter parameters
 
         :param bin_width: bin width in ps
         :param n_bins: number of bins to display on graph
         :param ch_list: (list) channels to record
         :param plot_list: list of channels to assign to each plot (e.g. [[1,2], [3,4]])
+        :param frame_rate: (float) rate in Hz at which the display is updated
         """
 
         # Save params to internal variables
@@ -115,6 +120,7 @@ class CountMonitor:
         self._n_bins = int(n_bins)
         self._ch_list = ch_list
         self._plot_list = plot_list
+        self._frame_rate = float(frame_rate)
 
     def run(self):
         """ Runs the counter from scratch"""
@@ -136,9 +142,7 @@ class CountMonitor:
             )
 
             # Continuously update data until paused
-            while self._is_running:
-                self._update_output()
-                self.gui.force_update()
+            self._monitor()
 
         except Exception as exc_obj:
             self._is_running = False
@@ -160,8 +164,7 @@ class CountMonitor:
 
             # Clear counter and resume plotting
             self._ctr.clear_ctr(name=self.config['name'])
-            while self._is_running:
-                self._update_output()
+            self._monitor()
 
         except Exception as exc_obj:
             self._is_running = False
@@ -169,6 +172,32 @@ class CountMonitor:
 
     # Technical methods
 
+    def _monitor(self):
+        """ Updates the display with the counts pushed by the server until paused """
+
+        try:
+            subscription = self._ctr.subscribe('counts', rate=self._frame_rate, name=self.config['name'])
+
+        # Servers without subscriptions are polled at the frame rate
+        except AttributeError:
+            subscription = None
+
+        try:
+            while self._is_running:
+                if subscription is None:
+                    time.sleep(1 / self._frame_rate)
+                    counts = self._ctr.get_counts_incremental(name=self.config['name'])
+                else:
+                    # Short timeout to keep the GUI responsive
+                    counts = subscription.get(timeout=0.1)
+
+                if counts is not None:
+                    self._update_output(counts)
+                self.gui.force_update()
+        finally:
+            if subscription is not None:
+                subscription.close()
+
     def _initialize_display(self):
         """ Initializes the display (configures all plots) """
 
@@ -258,13 +287,19 @@ class CountMonitor:
 
         self._ctr.clear_ctr(name=self.config['name'])
 
-    def _update_output(self):
-        """ Updates the output to all current values"""
+    def _update_output(self, counts=None):
+        """ Updates the output to all current values
+
+        :param counts: (np.ndarray) counts of all channels, fetched from the
+            counter if not given
+        """
 
         # Update all active channels
         # x_axis = self._ctr.get_x_axis()/1e12
 
-        counts = self._ctr.get_counts(name=self.config['name'])
+        # Only transfers the bins completed since the last update
+        if counts is None:
+            counts = self._ctr.get_counts_incremental(name=self.config['name'])
         counts_per_sec = counts * (1e12 / self._bin_width)
         # noise = np.sqrt(counts)*(1e12/self._bin_width)
         # plot_index = 0
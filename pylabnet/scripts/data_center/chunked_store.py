@@ -0,0 +1,266 @@
+""" Chunked, append-only persistence of Dataset trees
+
+Dataset.save() writes every array of a dataset (and of its children) to a
+separate .txt/.npy file, rewriting the complete history at every autosave. For
+long experiments the cost of an autosave therefore grows with the experiment
+duration.
+
+ChunkedDatasetStore instead keeps one HDF5 file per run containing the full
+dataset tree:
+
+    /<dataset name>/data, /<dataset name>/x
+    /<dataset name>/children/<child name>/data, ...
+
+with the logger metadata stored as JSON in the root attributes. Arrays are
+stored in resizable, chunked HDF5 datasets. On every save, rows added since the
+previous save are appended. Only arrays whose previously saved content changed
+(e.g. histograms accumulated in place or rolling windows) are rewritten, which
+costs the size of the array, not of the experiment history. Changes are
+detected from the first and last saved rows at every save, and from a checksum
+of all saved rows every verify_interval saves.
+
+Requires h5py. If it is not installed, AVAILABLE is False and the DataTaker
+falls back to Dataset.save().
+"""
+
+import json
+import time
+import zlib
+import numpy as np
+
+from pylabnet.utils.logging.logger import LogHandler
+from pylabnet.utils.helper_methods import generate_filepath
+
+try:
+    import h5py
+    AVAILABLE = True
+except ImportError:
+    h5py = None
+    AVAILABLE = False
+
+
+class ChunkedDatasetStore:
+    """ Append-only HDF5 container for a Dataset, its children and metadata """
+
+    def __init__(self, filename=None, directory=None, date_dir=True, unique_id=None,
+                 chunk_rows=4096, verify_interval=10, logger=None):
+        """ Instantiates the store, the file is created on the first save
+
+        :param filename: (str) name of the file (without extension)
+        :param directory: (str) directory to save to
+        :param date_dir: (bool) whether or not to use date sub-directory
+        :param unique_id: (str) identifier appended to the filename
+        :param chunk_rows: (int) number of rows per HDF5 chunk
+        :param verify_interval: (int) number of saves after which the previously
+            saved rows of an array are compared to their checksum before
+            appending, 1 to compare them at every save
+        :param logger: (LogClient) instance of LogClient for error logging
+        """
+
+        if not AVAILABLE:
+            raise ImportError('h5py is required for chunked dataset persistence')
+
+        self.log = LogHandler(logger)
+
+        if unique_id is not None:
+            filename = f'{filename}_{unique_id}'
+        self.filepath = generate_filepath(filename, directory, date_dir)
+        if not self.filepath.endswith('.h5'):
+            self.filepath += '.h5'
+
+        self.chunk_rows = chunk_rows
+        self.verify_interval = verify_interval
+
+        # Stores the _SavedArray of each array at the last save, used to detect
+        # whether new rows can simply be appended
+        self._saved = {}
+
+    def save(self, dataset, metadata=None):
+        """ Saves the rows added since the last save
+
+        The file is opened and closed for every save, such that it is always
+        in a consistent state in between saves.
+
+        :param dataset: (Dataset) root dataset to save, including children
+        :param metadata: (dict) experiment metadata to store
+        :return: (dict) with number of 'appended' and 'rewritten' rows and the
+            'duration' of the save in s
+        """
+
+        start_time = time.time()
+        stats = dict(appended=0, rewritten=0)
+
+        with h5py.File(self.filepath, 'a') as h5file:
+            self._save_dataset(h5file, dataset, stats)
+
+            if metadata is not None:
+                try:
+                    h5file.attrs['metadata'] = json.dumps(metadata)
+                except TypeError:
+                    self.log.warn('Did not save metadata')
+
+            h5file.attrs['last_save'] = time.strftime('%Y-%m-%d, %H:%M:%S')
+
+        stats['duration'] = time.time() - start_time
+        return stats
+
+    def _save_dataset(self, parent, dataset, stats):
+        """ Recursively saves a dataset and its children into a group of parent """
+
+        group = parent.require_group(_group_name(dataset.name))
+        group.attrs['class'] = dataset.__class__.__name__
+        group.attrs['is_important'] = dataset.is_important
+
+        for key, value in dataset.get_save_arrays().items():
+            if value is not None:
+                self._save_array(group, key, value, stats)
+
+        if dataset.children:
+            children = group.require_group('children')
+            for child in dataset.children.values():
+                self._save_dataset(children, child, stats)
+
+    def _save_array(self, group, key, value, stats):
+        """ Appends new rows of value to group[key], rewriting it if old rows changed """
+
+        try:
+            array = np.atleast_1d(np.asarray(value))
+        except ValueError:
+            array = None
+        if array is None or array.dtype.hasobject:
+            self.log.warn(f'Cannot save {group.name}/{key} in chunked format, array is not numeric')
+            return
+
+        path = f'{group.name}/{key}'
+        h5dataset = group.get(key)
+        num_rows = len(array)
+
+        if (h5dataset is None or h5dataset.shape[1:] != array.shape[1:]
+                or not np.can_cast(array.dtype, h5dataset.dtype, casting='safe')):
+            if h5dataset is not None:
+                del group[key]
+            if 0 in array.shape[1:]:
+                chunks = True
+            else:
+                chunks = (self.chunk_rows,) + array.shape[1:]
+            group.create_dataset(
+                key,
+                data=array,
+                maxshape=(None,) + array.shape[1:],
+                chunks=chunks
+            )
+            stats['rewritten'] += num_rows
+
+        elif self._can_append(path, array):
+            saved = self._saved[path]
+            if num_rows > saved.rows:
+                h5dataset.resize(num_rows, axis=0)
+                h5dataset[saved.rows:] = array[saved.rows:]
+                stats['appended'] += num_rows - saved.rows
+            saved.update(array)
+            return
+
+        else:
+            h5dataset.resize(num_rows, axis=0)
+            h5dataset[...] = array
+            stats['rewritten'] += num_rows
+
+        self._saved[path] = _SavedArray(array)
+
+    def _can_append(self, path, array):
+        """ Checks whether array only has new rows compared to the last save
+
+        Compares the first and the last previously saved row, which detects
+        rolling and re-initialized arrays without comparing the full history.
+        Arrays modified in place (e.g. averaged histograms) keep their length
+        and are therefore rewritten. Rows modified in between are detected by
+        the checksum of the saved rows, which is compared every verify_interval
+        saves.
+        """
+
+        if path not in self._saved:
+            return False
+
+        saved = self._saved[path]
+        if saved.rows == 0:
+            return True
+        if len(array) <= saved.rows:
+            return False
+
+        if not (_rows_equal(array[0], saved.first_row)
+                and _rows_equal(array[saved.rows - 1], saved.last_row)):
+            return False
+
+        saved.unverified_saves += 1
+        if saved.unverified_saves < self.verify_interval:
+            return True
+        saved.unverified_saves = 0
+        return _checksum(array[:saved.rows]) == saved.checksum
+
+
+def load(filepath):
+    """ Loads a file written by ChunkedDatasetStore
+
+    :param filepath: (str) path to the .h5 file
+    :return: (dict) nested dictionary of the dataset tree, with the arrays of
+        each dataset, its 'children' and the 'metadata' of the experiment
+    """
+
+    if not AVAILABLE:
+        raise ImportError('h5py is required to load chunked datasets')
+
+    def load_group(group):
+        content = {key: value[()] for key, value in group.items() if isinstance(value, h5py.Dataset)}
+        content.update(dict(group.attrs))
+        if 'children' in group:
+            content['children'] = {
+                name: load_group(child) for name, child in group['children'].items()
+            }
+        return content
+
+    with h5py.File(filepath, 'r') as h5file:
+        data = {name: load_group(group) for name, group in h5file.items()}
+        data['metadata'] = json.loads(h5file.attrs.get('metadata', '{}'))
+
+    return data
+
+
+class _SavedArray:
+    """ Rows of an array at the last save, see ChunkedDatasetStore._can_append() """
+
+    def __init__(self, array):
+
+        self.rows = 0
+        self.first_row = None
+        self.last_row = None
+        self.checksum = 0
+        self.unverified_saves = 0
+        self.update(array)
+
+    def update(self, array):
+        """ Records array, whose first self.rows rows were already recorded """
+
+        if len(array) > self.rows:
+            self.checksum = _checksum(array[self.rows:], self.checksum)
+            self.rows = len(array)
+            self.first_row = array[0].copy()
+            self.last_row = array[-1].copy()
+
+
+def _checksum(rows, checksum=0):
+    """ Continues the CRC-32 checksum of previous rows with rows """
+
+    return zlib.crc32(np.ascontiguousarray(rows), checksum)
+
+
+def _rows_equal(row, saved_row):
+    """ Compares rows bitwise, such that NaN values are equal """
+
+    row = np.asarray(row, dtype=saved_row.dtype)
+    return row.shape == saved_row.shape and row.tobytes() == saved_row.tobytes()
+
+
+def _group_name(name):
+    """ Returns a valid HDF5 group name for a dataset name """
+
+    return str(name).replace('/', '_')
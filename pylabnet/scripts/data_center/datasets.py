@@ -3,12 +3,14 @@ import pyqtgraph as pg
 import numpy as np
 import copy
 import time
+import functools
 from PyQt5 import QtWidgets, QtCore
 
 from pyqtgraph.widgets.MatplotlibWidget import MatplotlibWidget
 from pylabnet.gui.pyqt.external_gui import Window, ParameterPopup, GraphPopup, Confluence_support_GraphPopup, Confluence_Handler, GraphPopupTabs, Confluence_support_GraphPopupTabs
 from pylabnet.utils.logging.logger import LogClient, LogHandler
 from pylabnet.utils.helper_methods import save_metadata, generic_save, npy_generic_save, pyqtgraph_save, fill_2dlist, TimeAxisItem
+from pylabnet.utils.ring_buffer import RingBuffer
 
 import sys
 
@@ -40,6 +42,87 @@ def get_color_index(dataset, kwargs):
     return color_index
 
 
+def append_rolling_data(dataset, values, attr='data', capacity=None):
+    """ Appends values to a rolling attribute of a dataset without re-allocation
+
+    The values are stored in a RingBuffer and the attribute is set to an
+    ordered view of it. If the attribute was modified from outside (e.g.
+    cleared by clear_data()), the buffer is re-initialized with its content.
+
+    :param dataset: (Dataset) dataset to update
+    :param values: (scalar or array) values to add
+    :param attr: (str) name of the attribute, e.g. 'data' or 'x'
+    :param capacity: (int) number of points to keep, None to keep all points
+    """
+
+    if not isinstance(capacity, (int, np.integer)):
+        capacity = None
+
+    if not hasattr(dataset, '_ring_buffers'):
+        dataset._ring_buffers = {}
+    buffer, buffer_view = dataset._ring_buffers.get(attr, (None, None))
+
+    current = getattr(dataset, attr)
+    if buffer is None or current is not buffer_view:
+        buffer = RingBuffer(capacity=capacity)
+        if current is not None:
+            buffer.append(current)
+    else:
+        buffer.set_capacity(capacity)
+
+    buffer.append(values)
+    buffer_view = buffer.view()
+
+    dataset._ring_buffers[attr] = (buffer, buffer_view)
+    setattr(dataset, attr, buffer_view)
+
+
+def marks_dirty(method):
+    """ Decorator for methods modifying the data of a dataset
+
+    Marks the dataset and its children (whose data is derived from it by the
+    mappings) as changed, such that they are redrawn in the next frame.
+    Applied to set_data() and clear_data() of every dataset class. Data
+    modified elsewhere, e.g. in place by an experiment, is only redrawn after
+    calling mark_dirty().
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self.mark_dirty()
+        return result
+
+    return wrapper
+
+
+def redraws_if_dirty(update):
+    """ Decorator for update() methods, skipping the redraw of unchanged datasets
+
+    Children are still visited, since they may have been changed independently.
+    Calls of the parent class update() from within update() are passed through.
+    """
+
+    @functools.wraps(update)
+    def wrapper(self, *args, **kwargs):
+        if getattr(self, '_in_update', False):
+            return update(self, *args, **kwargs)
+
+        if not getattr(self, '_dirty', True):
+            for child in self.children.values():
+                child.update(*args, **kwargs)
+            return
+
+        # Reset before drawing, such that data set while drawing is drawn in the next frame
+        self._dirty = False
+        self._in_update = True
+        try:
+            return update(self, *args, **kwargs)
+        finally:
+            self._in_update = False
+
+    return wrapper
+
 
 class Dataset():
 
@@ -169,6 +252,7 @@ class Dataset():
         if mapping is not None:
             self.mapping[name] = mapping
 
+    @marks_dirty
     def set_data(self, data=None, x=None):
         """ Sets data
 
@@ -209,6 +293,7 @@ class Dataset():
         )
         # self.update(**kwargs)
 
+    @marks_dirty
     def clear_data(self):
         self.data = None
         self.curve.setData([])
@@ -225,6 +310,24 @@ class Dataset():
         for child in self.children.values():
             child.clear_all_data()
 
+    def mark_dirty(self):
+        """ Marks the dataset and its children for redrawing in the next frame
+
+        Call this after modifying data in place outside of set_data().
+        """
+
+        self._dirty = True
+        for child in getattr(self, 'children', {}).values():
+            child.mark_dirty()
+
+    def is_dirty(self):
+        """ Returns whether the dataset or any of its children needs redrawing """
+
+        return getattr(self, '_dirty', True) or any(
+            child.is_dirty() for child in getattr(self, 'children', {}).values()
+        )
+
+    @redraws_if_dirty
     def update(self, **kwargs):
         """ Updates current data to plot"""
 
@@ -253,6 +356,16 @@ class Dataset():
             self.gui.presel_status.setText(status)
             self.gui.presel_status.setStyleSheet('background-color: gray;')
 
+    def get_save_arrays(self):
+        """ Returns the arrays to store with chunked persistence
+
+        Override in datasets holding additional arrays.
+
+        :return: (dict) of arrays, keyed by name
+        """
+
+        return dict(data=self.data, x=self.x)
+
     def save(self, filename=None, directory=None, date_dir=True, unique_id=None):
 
         if(not self.save_as_npy):
@@ -497,6 +610,7 @@ class Dataset():
 class AveragedHistogram(Dataset):
     """ Subclass for plotting averaged histogram """
 
+    @marks_dirty
     def set_data(self, data=None, x=None):
         """ Sets data by adding to previous histogram
 
@@ -610,6 +724,7 @@ class PreselectedHistogram(AveragedHistogram):
             else:
                 self.presel_success_value = np.mean(presel_trace[-self.presel_params['avg_values']:])
 
+    @marks_dirty
     def set_data(self, data=None, x=None, preselection_data=None):
         """ Sets the data for a new round of acquisition
 
@@ -634,6 +749,7 @@ class PreselectedHistogram(AveragedHistogram):
                 else:
                     vb.setBackgroundColor(0.0)
 
+    @redraws_if_dirty
     def update(self, **kwargs):
 
         self.presel_success_indicator.setValue(self.presel_success_value)
@@ -667,18 +783,13 @@ class InvisibleRollingData(Dataset):
     def visualize(self, graph, **kwargs):
         self.curve = pg.PlotDataItem()
 
+    @marks_dirty
     def set_data(self, data):
         """ Updates data
         :param data: (scalar or array) data to add
         """
 
-        if self.data is None:
-            if np.isscalar(data):
-                self.data = np.array([data])
-            else:
-                self.data = np.array(data)
-        else:
-            self.data = np.append(self.data, data)
+        append_rolling_data(self, data)
 
 
 class RollingLine(Dataset):
@@ -701,20 +812,14 @@ class RollingLine(Dataset):
         self.data_length = params['data_length']
         self.waiting = False
 
+    @marks_dirty
     def set_data(self, data):
         """ Updates data
 
         :param data: (scalar) data to add
         """
 
-        if self.data is None:
-            self.data = np.array([data])
-
-        else:
-            if len(self.data) == self.data_length:
-                self.data = np.append(self.data, data)[1:]
-            else:
-                self.data = np.append(self.data, data)
+        append_rolling_data(self, data, capacity=self.data_length)
 
         for name, child in self.children.items():
             # If we need to process the child data, do it
@@ -726,20 +831,16 @@ class InfiniteRollingLine(RollingLine):
     """ Extension of RollingLine that stores the data
         indefinitely, but still only plots a finite amount """
 
+    @marks_dirty
     def set_data(self, data):
         """ Updates data
 
         :param data: (scalar or array) data to add
         """
 
-        if self.data is None:
-            if(np.isscalar(data)):
-                self.data = np.array([data])
-            else:
-                self.data = np.array(data)
-        else:
-            self.data = np.append(self.data, data)
+        append_rolling_data(self, data)
 
+    @redraws_if_dirty
     def update(self, **kwargs):
         """ Updates current data to plot"""
 
@@ -767,6 +868,7 @@ class time_trace_monitor(RollingLine):
         kwargs['datetime_axis'] = True
         super().__init__(*args, **kwargs)
 
+    @marks_dirty
     def set_data(self, data):
         """ Updates data
 
@@ -774,23 +876,8 @@ class time_trace_monitor(RollingLine):
         """
         dt_timestamp = time.time()
 
-        if self.data is None:
-            self.data = np.array([data])
-
-        else:
-            if len(self.data) >= self.data_length:
-                self.data = np.append(self.data, data)[-1 * self.data_length:]
-            else:
-                self.data = np.append(self.data, data)
-
-        if self.x is None:
-            self.x = np.array([dt_timestamp])
-
-        else:
-            if len(self.x) >= self.data_length:
-                self.x = np.append(self.x, dt_timestamp)[-1 * self.data_length:]
-            else:
-                self.x = np.append(self.x, dt_timestamp)
+        append_rolling_data(self, data, capacity=self.data_length)
+        append_rolling_data(self, dt_timestamp, attr='x', capacity=self.data_length)
 
         for name, child in self.children.items():
             # If we need to process the child data, do it
@@ -865,6 +952,7 @@ class ManualOpenLoopScan(Dataset):
         )
         self.update(**kwargs)
 
+    @marks_dirty
     def set_data(self, data=None, x=None, wavelength=None):
         """ Sets the data for a new round of acquisition
 
@@ -1034,6 +1122,7 @@ class Scatterplot(Dataset):
         self.graph.addItem(self.curve)
         self.update(**kwargs)
 
+    @marks_dirty
     def clear_data(self):
         self.data = None
         self.curve.setData([])
@@ -1143,6 +1232,7 @@ class TriangleScan1D(Dataset):
         else:
             prev_dataset.data = dataset.data
 
+    @marks_dirty
     def set_data(self, value):
 
         if self.data is None:
@@ -1170,6 +1260,7 @@ class TriangleScan1D(Dataset):
 
         self.set_children_data()
 
+    @redraws_if_dirty
     def update(self, **kwargs):
         """ Updates current data to plot"""
 
@@ -1193,6 +1284,7 @@ class TriangleScan1D(Dataset):
                 except ValueError:
                     prev_dataset.data = np.flip(prev_dataset.data)
 
+    @marks_dirty
     def clear_data(self):
 
         self.data = None
@@ -1274,6 +1366,7 @@ class SawtoothScan1D(Dataset):
         else:
             prev_dataset.data = dataset.data
 
+    @marks_dirty
     def set_data(self, value):
 
         if self.data is None:
@@ -1301,6 +1394,7 @@ class SawtoothScan1D(Dataset):
 
         self.set_children_data()
 
+    @redraws_if_dirty
     def update(self, **kwargs):
         """ Updates current data to plot"""
 
@@ -1318,6 +1412,7 @@ class SawtoothScan1D(Dataset):
         if dataset.update_hmap:
             prev_dataset.data = dataset.all_data
 
+    @marks_dirty
     def clear_data(self):
 
         self.data = None
@@ -1341,6 +1436,7 @@ class SawtoothScan1D_array_update(SawtoothScan1D):
         else:
             prev_dataset.data = dataset.data
 
+    @marks_dirty
     def set_data(self, value):
 
         if(np.isscalar(value)):
@@ -1400,6 +1496,7 @@ class SawtoothScan1D_array_update(SawtoothScan1D):
 
             self.set_children_data()
 
+    @redraws_if_dirty
     def update(self, **kwargs):
         """ Updates current data to plot"""
 
@@ -1427,6 +1524,7 @@ class HeatMap(Dataset):
             self.min, self.max, self.pts = kwargs['min'], kwargs['max'], kwargs['pts']
             self.graph.view.setLimits(xMin=kwargs['min'], xMax=kwargs['max'])
 
+    @redraws_if_dirty
     def update(self, **kwargs):
 
         if 'update_hmap' in kwargs and kwargs['update_hmap']:
@@ -1503,6 +1601,7 @@ class HeatMap(Dataset):
             self.graph = pg.ImageView(view=pg.PlotItem())
             self.gui.graph_layout.addWidget(self.graph)
 
+    @marks_dirty
     def clear_data(self):
 
         self.data = None
@@ -1530,6 +1629,7 @@ class Plot2D(Dataset):
 
         self.graph.view.setLimits(xMin=kwargs['min_x'], xMax=kwargs['max_x'], yMin=kwargs['min_y'], yMax=kwargs['max_y'])
 
+    @redraws_if_dirty
     def update(self, **kwargs):
 
         if not np.isnan(self.data).all():
@@ -1543,6 +1643,7 @@ class Plot2D(Dataset):
         for child in self.children.values():
             child.update(**kwargs)
 
+    @marks_dirty
     def set_data(self, value):
 
         try: # check if data is an array and what its shape is
@@ -1664,6 +1765,7 @@ class Plot2D(Dataset):
             self.graph = pg.ImageView(view=pg.PlotItem())
             self.gui.graph_layout.addWidget(self.graph)
 
+    @marks_dirty
     def clear_data(self):
 
         self.data = np.zeros([self.pts_y, self.pts_x])
@@ -1722,6 +1824,7 @@ class Plot2DWithAvg(Plot2D):
 
         self.children[config['name'] + 'avg'].update_colormap('grey')
 
+    @marks_dirty
     def set_data(self, value):
 
         try: # check if data is an array and what its shape is
@@ -1864,6 +1967,7 @@ class Plot2DWithAvg(Plot2D):
                     n = (self.position - self.pts_x * self.pts_y) // (self.pts_x * self.pts_y)
                     prev_dataset.data[:, :] = (dataset.data[:, :] + n * prev_dataset.data[:, :]) / (n + 1)
 
+    @marks_dirty
     def clear_data(self):
 
         self.data = np.zeros([self.pts_y, self.pts_x])
@@ -1922,6 +2026,7 @@ class LockedCavityScan1D(TriangleScan1D):
         self.children['Cavity history'].set_data(self.v)
         self.children['Max count history'].set_data(counts)
 
+    @marks_dirty
     def clear_data(self):
 
         # Clear forward/backward scan line
@@ -2005,6 +2110,7 @@ class ErrorBarGraph(Dataset):
         self.graph.addItem(self.error_curve)
         self.update(**kwargs)
 
+    @redraws_if_dirty
     def update(self, **kwargs):
         """ Updates current data to plot"""
 
@@ -2032,6 +2138,7 @@ class ErrorBarGraph(Dataset):
         for child in self.children.values():
             child.update(**kwargs)
 
+    @marks_dirty
     def clear_data(self):
 
         self.data = None
@@ -2052,6 +2159,7 @@ class ErrorBarGraph(Dataset):
 class ErrorBarAveragedHistogram(ErrorBarGraph):
     """ ErrorBar graph version of AveragedHistogram"""
 
+    @marks_dirty
     def set_data(self, data=None, x=None):
         """ Sets data by adding to previous histogram
 
@@ -2092,6 +2200,7 @@ class ErrorBarPlot(Dataset):
         self.graph.addItem(self.curve)
         self.update(**kwargs)
 
+    @redraws_if_dirty
     def update(self, **kwargs):
         """ Updates current data to plot"""
 
@@ -2108,6 +2217,7 @@ class ErrorBarPlot(Dataset):
         for child in self.children.values():
             child.update(**kwargs)
 
+    @marks_dirty
     def clear_data(self):
 
         self.data = None
@@ -2157,6 +2267,7 @@ class InterpolatedMap(Dataset):
             self.log.warn("This import requires SciPy >=1.7.0.")
             raise(e)
 
+    @marks_dirty
     def set_data(self, data):
         """ Updates data stored in the data dict.
 
@@ -2181,6 +2292,7 @@ class InterpolatedMap(Dataset):
         self.handle_new_window(graph, **kwargs)
         self.update(**kwargs)
 
+    @redraws_if_dirty
     def update(self, **kwargs):
         """ Updates current data to plot"""
 
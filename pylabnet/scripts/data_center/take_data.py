@@ -14,11 +14,13 @@ from PyQt5.QtCore import Qt
 from pylabnet.utils.logging.logger import LogHandler
 from pylabnet.gui.pyqt.external_gui import Window
 from pylabnet.utils.helper_methods import load_config, generic_save, unpack_launcher, save_metadata, load_script_config, find_client, get_ip
-from pylabnet.scripts.data_center import datasets
+from pylabnet.scripts.data_center import datasets, chunked_store
 from PyQt5.QtWidgets import QLabel, QLineEdit, QPushButton
 
 
-REFRESH_RATE = 150   # refresh rate in ms, try increasing if GUI lags
+REFRESH_RATE = 150   # minimum refresh interval in ms
+MAX_REFRESH_RATE = 2000   # maximum refresh interval in ms
+RENDER_LOAD = 0.25   # maximum fraction of time the GUI thread spends redrawing
 
 
 class DataTaker:
@@ -53,6 +55,10 @@ class DataTaker:
         # Keep track of valid init dict
         self.valid_init_dict = False
 
+        # Chunked (HDF5) persistence of the current run, if enabled in the config
+        self.store = None
+        self.store_filename = None
+
         # Setup Autosave
         # First check whether autosave is specified in config file
         if 'auto_save' in self.config:
@@ -316,12 +322,15 @@ class DataTaker:
             self.gui.run.setText('Stop')
             self.log.info('Experiment started')
 
+            # Save each run to a new file
+            self.store = None
+
             # Run update thread
             self.update_thread = UpdateThread(
                 autosave=self.gui.autosave.isChecked(),
                 save_time=self.gui.autosave_interval.value()
             )
-            self.update_thread.data_updated.connect(self.dataset.update)
+            self.update_thread.data_updated.connect(self.render_frame)
             self.update_thread.save_flag.connect(self.save)
             self.gui.autosave.toggled.connect(self.update_thread.update_autosave)
             self.gui.autosave_interval.valueChanged.connect(self.update_thread.update_autosave_interval)
@@ -389,6 +398,16 @@ class DataTaker:
             # self.experiment_thread.running = False
             self.experiment_worker.running = False
 
+    def render_frame(self):
+        """ Redraws the datasets which changed since the last frame """
+
+        start_time = time.time()
+        try:
+            if self.dataset.is_dirty():
+                self.dataset.update()
+        finally:
+            self.update_thread.frame_done(time.time() - start_time)
+
     def stop(self):
         """ Stops the experiment"""
 
@@ -413,6 +432,13 @@ class DataTaker:
         self.log.update_metadata(notes=self.gui.notes.toPlainText())
         filename = self.gui.save_name.text()
         directory = self.config['save_path']
+
+        if self.config.get('save_format', None) == 'hdf5':
+            if chunked_store.AVAILABLE:
+                self.save_chunked(filename, directory, unique_id)
+                return
+            self.log.warn('h5py is not installed, saving data in legacy format')
+
         self.dataset.save(
             filename=filename,
             directory=directory,
@@ -422,6 +448,35 @@ class DataTaker:
         save_metadata(self.log, filename, directory, True, unique_id)
         self.log.info('Data saved')
 
+    def save_chunked(self, filename, directory, unique_id):
+        """ Appends data added since the last save to the HDF5 file of the current run
+
+        :param filename: (str) name of the file
+        :param directory: (str) directory to save to
+        :param unique_id: (str) identifier appended to the filename of a new file
+        """
+
+        # Start a new file for a new run or if the filename was changed
+        if self.store is None or self.store_filename != filename:
+            self.store = chunked_store.ChunkedDatasetStore(
+                filename=filename,
+                directory=directory,
+                date_dir=True,
+                unique_id=unique_id,
+                logger=self.log
+            )
+            self.store_filename = filename
+
+        metadata = self.log.get_metadata()
+        if not isinstance(metadata, dict):
+            metadata = None
+
+        stats = self.store.save(self.dataset, metadata=metadata)
+        self.log.info(
+            f'Data saved to {self.store.filepath} '
+            f'({stats["appended"]} rows appended, {stats["rewritten"]} rows rewritten)'
+        )
+
     def reload_config(self):
         """ Loads a new config file """
 
@@ -483,7 +538,13 @@ class ExperimentWorker(QtCore.QObject):
 
 
 class UpdateThread(QtCore.QThread):
-    """ Thread that continuously signals GUI to update data """
+    """ Thread that continuously signals GUI to update data
+
+    A new frame is only requested once the previous one has been drawn, such
+    that frames do not queue up in the GUI thread. The refresh interval is
+    adapted to the measured render time, keeping the time spent redrawing
+    below RENDER_LOAD.
+    """
 
     data_updated = QtCore.pyqtSignal()
     save_flag = QtCore.pyqtSignal()
@@ -492,9 +553,25 @@ class UpdateThread(QtCore.QThread):
         self.running = True
         self.autosave = kwargs['autosave']
         self.save_time = kwargs['save_time']
+        self.frame_pending = False
+        self.render_time = 0
+        self.refresh_interval = REFRESH_RATE
         super().__init__()
         self.start()
 
+    def frame_done(self, render_time):
+        """ Called by the GUI thread after drawing a frame
+
+        :param render_time: (float) time in s it took to draw the frame
+        """
+
+        # Smooth out fluctuations of the render time
+        self.render_time = 0.8 * self.render_time + 0.2 * render_time
+        self.refresh_interval = int(np.clip(
+            self.render_time * 1e3 / RENDER_LOAD, REFRESH_RATE, MAX_REFRESH_RATE
+        ))
+        self.frame_pending = False
+
     def update_autosave(self, status: bool):
         """ Updates whether or not to autosave
 
@@ -514,11 +591,13 @@ class UpdateThread(QtCore.QThread):
     def run(self):
         last_save = time.time()
         while self.running:
-            self.data_updated.emit()
+            if not self.frame_pending:
+                self.frame_pending = True
+                self.data_updated.emit()
             if self.autosave and np.abs(time.time() - last_save) > self.save_time:
                 self.save_flag.emit()
                 last_save = time.time()
-            self.msleep(REFRESH_RATE)
+            self.msleep(self.refresh_interval)
 
 
 def main():
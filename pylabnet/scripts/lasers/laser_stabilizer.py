@@ -250,7 +250,11 @@ class LaserStabilizer:
     def _update_PID(self):
         """Creates a new PID object based on the current PID member variables to be used for power
         feedbacking"""
-        self.pid = PID(p=self.paramP, i=self.paramI, d=self.paramD, setpoint=self.voltageSetpoint, memory=self.paramMemory)
+        # The gains are tuned for an integral over the newest sample only
+        self.pid = PID(
+            p=self.paramP, i=self.paramI, d=self.paramD, setpoint=self.voltageSetpoint,
+            memory=self.paramMemory, integrate_window=False
+        )
 
     def _update_feedback(self):
         """ Runs the actual feedback loop"""
@@ -6,18 +6,31 @@ from pylabnet.utils.helper_methods import (unpack_launcher, create_server,
                                            load_config, get_gui_widgets, get_legend_from_graphics_view, add_to_legend, find_client,
                                            load_script_config, get_ip)
 from pylabnet.utils.logging.logger import LogClient, LogHandler
+from pylabnet.utils.ring_buffer import TraceStore, decimate_minmax
+from pylabnet.utils.control_loop import ControlLoop
 
 import numpy as np
 import time
+import threading
 import copy
 import pickle
 import pyqtgraph as pg
 
 
+# Minimal time in s between redraws of the traces
+PLOT_INTERVAL = 0.05
+
+# Minimal time in s between GUI updates if the control loop is running
+FRAME_INTERVAL = 0.02
+
+# Default rate of the control loop in Hz
+LOOP_RATE = 50
+
+
 class WlmMonitor:
     """ A script class for monitoring and locking lasers based on the wavemeter """
 
-    def __init__(self, wlm_client, logger_client, gui='wavemeter_monitor', ao_clients=None, display_pts=5000, threshold=0.0002, port=None, params=None, three_lasers=False):
+    def __init__(self, wlm_client, logger_client, gui='wavemeter_monitor', ao_clients=None, display_pts=5000, plot_pts=1000, threshold=0.0002, port=None, params=None, three_lasers=False):
         """ Instantiates WlmMonitor script object for monitoring wavemeter
 
         :param wlm_client: (obj) instance of wavemeter client
@@ -26,6 +39,8 @@ class WlmMonitor:
         :param ao_clients: (dict, optional) dictionary of ao client objects with keys to identify. Exmaple:
             {'ni_usb_1': nidaqmx_usb_client_1, 'ni_usb_2': nidaqmx_usb_client_2, 'ni_pxi_multi': nidaqmx_pxi_client}
         :param display_pts: (int, optional) number of points to display on plot
+        :param plot_pts: (int, optional) maximal number of points sent to each curve,
+            the traces are decimated with their extrema kept
         :param threshold: (float, optional) threshold in THz for lock error signal
         :param port: (int) port number for update server
         :param params: (dict) see set_parameters below for details
@@ -39,6 +54,13 @@ class WlmMonitor:
         self.wlm_client = wlm_client
         self.ao_clients = ao_clients
         self.display_pts = display_pts
+        self.plot_pts = plot_pts
+        self._last_plot = 0
+        self._last_frame = 0
+
+        # Control loop thread, see start_control_loop()
+        self.control_loop = None
+        self._lock = threading.RLock()
         self.threshold = threshold
         self.log = LogHandler(logger_client)
 
@@ -127,72 +149,74 @@ class WlmMonitor:
         :param parameters: (list) list of dictionaries, see set_parameters() for details
         """
 
-        if not isinstance(parameters, list):
-            parameters = [parameters]
+        with self._lock:
+            if not isinstance(parameters, list):
+                parameters = [parameters]
 
-        for parameter in parameters:
+            for parameter in parameters:
 
-            # Make sure a channel is given
-            if 'channel' in parameter:
+                # Make sure a channel is given
+                if 'channel' in parameter:
 
-                # Check if it is a channel that is already logged
-                channel_list = self._get_channels()
-                if parameter['channel'] in channel_list:
+                    # Check if it is a channel that is already logged
+                    channel_list = self._get_channels()
+                    if parameter['channel'] in channel_list:
 
-                    # Find index of the desired channel
-                    index = channel_list.index(parameter['channel'])
-                    channel = self.channels[channel_list.index(parameter['channel'])]
+                        # Find index of the desired channel
+                        index = channel_list.index(parameter['channel'])
+                        channel = self.channels[channel_list.index(parameter['channel'])]
 
-                    # Set all other parameters for this channel
-                    if 'name' in parameter:
-                        channel.name = parameter['name']
+                        # Set all other parameters for this channel
+                        if 'name' in parameter:
+                            channel.name = parameter['name']
 
-                    if 'setpoint' in parameter:
+                        if 'setpoint' in parameter:
 
-                        # self.widgets['sp'][index].setValue(parameter['setpoint'])
-                        # channel.setpoint = parameter['setpoint']
+                            # self.widgets['sp'][index].setValue(parameter['setpoint'])
+                            # channel.setpoint = parameter['setpoint']
 
-                        # Mark that we should override GUI setpoint, since it has been updated by the script
-                        channel.setpoint_override = parameter['setpoint']
+                            # Mark that we should override GUI setpoint, since it has been updated by the script
+                            channel.setpoint_override = parameter['setpoint']
 
-                    if 'lock' in parameter:
+                        if 'lock' in parameter:
 
-                        self.widgets['lock'][index].setChecked(parameter['lock'])
-                        # channel.lock = parameter['lock']
+                            self.widgets['lock'][index].setChecked(parameter['lock'])
+                            # channel.lock = parameter['lock']
 
-                        # Mark that we should override the GUI lock since it has been updated by the script
-                        # channel.lock_override = True
+                            # Mark that we should override the GUI lock since it has been updated by the script
+                            # channel.lock_override = True
 
-                    if 'memory' in parameter:
-                        channel.memory = parameter['memory']
-                    if 'pid' in parameter:
-                        channel.pid.set_parameters(
-                            p=parameter['pid']['p'],
-                            i=parameter['pid']['i'],
-                            d=parameter['pid']['d'],
-                        )
+                        if 'memory' in parameter:
+                            channel.memory = parameter['memory']
+                            channel.pid.set_parameters(memory=channel.memory)
+                        if 'pid' in parameter:
+                            channel.pid.set_parameters(
+                                p=parameter['pid']['p'],
+                                i=parameter['pid']['i'],
+                                d=parameter['pid']['d'],
+                            )
 
-                    # Ignore ao requests if clients have not been assigned
-                    if 'ao' in parameter and self.ao_clients is not None:
-
-                        # Convert ao from string to object using lookup
-                        try:
-                            channel.ao = {
-                                'client': self.ao_clients[parameter['ao']['client']],
-                                'channel': parameter['ao']['channel']
-                            }
-
-                        # Handle case where the ao client does not exist
-                        except KeyError:
-                            channel.ao = None
-
-                # Otherwise, it is a new channel so we should add it
-                else:
-                    self.channels.append(Channel(parameter))
-                    self._initialize_channel(
-                        index=len(self.channels) - 1,
-                        channel=self.channels[-1]
-                    )
+                        # Ignore ao requests if clients have not been assigned
+                        if 'ao' in parameter and self.ao_clients is not None:
+
+                            # Convert ao from string to object using lookup
+                            try:
+                                channel.ao = {
+                                    'client': self.ao_clients[parameter['ao']['client']],
+                                    'channel': parameter['ao']['channel']
+                                }
+
+                            # Handle case where the ao client does not exist
+                            except KeyError:
+                                channel.ao = None
+
+                    # Otherwise, it is a new channel so we should add it
+                    else:
+                        self.channels.append(Channel(parameter))
+                        self._initialize_channel(
+                            index=len(self.channels) - 1,
+                            channel=self.channels[-1]
+                        )
 
     def initialize_channels(self):
         """Initializes all channels and outputs to the GUI"""
@@ -207,7 +231,8 @@ class WlmMonitor:
         """
 
         try:
-            channel.initialize(channel.data[-1])
+            with self._lock:
+                channel.initialize(channel.data[-1])
 
         # If the channel isn't monitored
         except:
@@ -222,9 +247,14 @@ class WlmMonitor:
     def run(self):
         """Runs the WlmMonitor
 
-        Can be stopped using the pause() method
+        Can be stopped using the pause() method. If the control loop is running,
+        only the GUI is updated, at most every FRAME_INTERVAL.
         """
 
+        if self.control_loop is not None:
+            time.sleep(max(self._last_frame + FRAME_INTERVAL - time.time(), 0))
+            self._last_frame = time.time()
+
         self._get_gui_data()
         self._update_channels()
         self.gui.force_update()
@@ -236,7 +266,8 @@ class WlmMonitor:
         """
 
         try:
-            channel.zero_voltage()
+            with self._lock:
+                channel.zero_voltage()
             self.log.info(f'Voltage centered for channel {channel.name}')
 
         # If the channel isn't monitored
@@ -253,11 +284,12 @@ class WlmMonitor:
         """
 
         try:
-            channel.pid.set_parameters(
-                p=p,
-                i=i,
-                d=d
-            )
+            with self._lock:
+                channel.pid.set_parameters(
+                    p=p,
+                    i=i,
+                    d=d
+                )
             self.log.info('New P, I, D values = ' + str(p) + ', ' + str(i) + ', ' + str(d))
 
         # Catch error
@@ -286,6 +318,43 @@ class WlmMonitor:
             )])
             time.sleep(hold_time)
 
+    def start_control_loop(self, rate=LOOP_RATE):
+        """ Runs the channel updates and locks in a dedicated thread
+
+        The GUI is then only refreshed by run(), with a snapshot of the latest data.
+
+        :param rate: (float) loop rate in Hz
+        """
+
+        if self.control_loop is not None:
+            self.control_loop.stop()
+
+        self.control_loop = ControlLoop(
+            step=self._update_locks,
+            rate=rate,
+            lock=self._lock,
+            logger=self.log,
+            name='WlmMonitor control loop'
+        )
+        self.control_loop.start()
+
+    def stop_control_loop(self):
+        """ Stops the control loop, channels are then updated inside run() again """
+
+        if self.control_loop is not None:
+            self.control_loop.stop()
+            self.control_loop = None
+
+    def get_loop_stats(self):
+        """ Returns the timing statistics of the control loop
+
+        :return: (dict) see ControlLoop.stats(), empty if the loop is not running
+        """
+
+        if self.control_loop is None:
+            return dict()
+        return self.control_loop.stats()
+
     # Technical methods
 
     def _initialize_channel(self, index, channel):
@@ -378,9 +447,30 @@ class WlmMonitor:
     def _update_channels(self):
         """ Updates all channels + displays
 
-        Called continuously inside run() method to refresh WLM data and output on GUI
+        Called continuously inside run() method to refresh WLM data and output on GUI.
+        If the control loop is running, the channels are updated there and only
+        the displays are refreshed.
         """
 
+        if self.control_loop is None:
+            self._update_locks()
+        self._update_display()
+
+    def _update_locks(self):
+        """ Reads all channels from the wavemeter in a single call and updates their locks """
+
+        wavelengths = self.wlm_client.get_wavelengths([channel.number for channel in self.channels])
+        for channel, wavelength in zip(self.channels, wavelengths):
+            channel.update(wavelength)
+
+    def _update_display(self):
+        """ Outputs the latest channel data on the GUI """
+
+        # The traces are redrawn at most every PLOT_INTERVAL
+        redraw = time.time() - self._last_plot >= PLOT_INTERVAL
+        if redraw:
+            self._last_plot = time.time()
+
         for index, channel in enumerate(self.channels):
 
             # Check for override
@@ -388,37 +478,30 @@ class WlmMonitor:
                 self.widgets['sp'][index].setValue(channel.setpoint_override)
                 channel.setpoint_override = 0
 
-            # Update data with the new wavelength
-            channel.update(self.wlm_client.get_wavelength(channel.number))
+            snapshot = self._get_snapshot(channel, traces=redraw)
 
             # Update frequency
-            self.widgets['curve'][4 * index].setData(channel.data)
-            self.widgets['freq'][index].setValue(channel.data[-1])
+            if redraw:
+                self.widgets['curve'][4 * index].setData(*snapshot['data_trace'])
+            self.widgets['freq'][index].setValue(snapshot['data'])
 
             # Update setpoints
-            self.widgets['curve'][4 * index + 1].setData(channel.sp_data)
-
-            # Update the setpoint to GUI directly if it has been changed
-            # if channel.setpoint_override:
-
-            #     # Tell GUI to pull data provided by script and overwrite direct GUI input
-            #     self.widgets['sp'][index].setValue(channel.setpoint)
-
-            # If the lock has been updated, override the GUI
-            # if channel.lock_override:
-            #     self.widgets['lock'][index].setChecked(channel.lock)
+            if redraw:
+                self.widgets['curve'][4 * index + 1].setData(*snapshot['sp_data_trace'])
 
             # Set the error boolean (true if the lock is active and we are outside the error threshold)
-            if channel.lock and np.abs(channel.data[-1] - channel.setpoint) > self.threshold:
+            if snapshot['lock'] and np.abs(snapshot['data'] - snapshot['setpoint']) > self.threshold:
                 self.widgets['error_status'][index].setChecked(True)
             else:
                 self.widgets['error_status'][index].setChecked(False)
 
             # Now update lock + voltage plots
-            self.widgets['curve'][4 * index + 2].setData(channel.voltage)
-            self.widgets['voltage'][index].setValue(channel.voltage[-1])
-            self.widgets['curve'][4 * index + 3].setData(channel.error)
-            self.widgets['error'][index].setValue(channel.error[-1])
+            if redraw:
+                self.widgets['curve'][4 * index + 2].setData(*snapshot['voltage_trace'])
+            self.widgets['voltage'][index].setValue(snapshot['voltage'])
+            if redraw:
+                self.widgets['curve'][4 * index + 3].setData(*snapshot['error_trace'])
+            self.widgets['error'][index].setValue(snapshot['error'])
 
     def _get_gui_data(self):
         """ Updates setpoint and lock parameters with data pulled from GUI
@@ -432,6 +515,29 @@ class WlmMonitor:
             channel.gui_setpoint = self.widgets['sp'][index].value()
             channel.gui_lock = self.widgets['lock'][index].isChecked()
 
+    def _get_snapshot(self, channel, traces=True):
+        """ Copies the latest data of a channel for display
+
+        Holds the lock, such that the control loop does not update the channel meanwhile.
+
+        :param channel: (Channel) channel to copy
+        :param traces: (bool) whether to include the decimated traces
+        :return: (dict) containing the 'lock' state, the 'setpoint', the latest
+            value of each trace keyed by its name and, if traces is True, the
+            decimated (x, y) traces keyed by '<name>_trace'
+        """
+
+        with self._lock:
+            snapshot = dict(lock=channel.lock, setpoint=channel.setpoint)
+            for name in channel.traces.names:
+                trace = channel.traces.view(name)
+                snapshot[name] = trace[-1]
+                if traces:
+                    x, y = decimate_minmax(trace, self.plot_pts)
+                    snapshot[f'{name}_trace'] = (x, np.array(y))
+
+        return snapshot
+
     def _get_channels(self):
         """ Returns all active channel numbers
 
@@ -487,6 +593,9 @@ class Service(ServiceBase):
     def exposed_get_wavelength(self, channel):
         return self._module.get_wavelength(channel)
 
+    def exposed_get_loop_stats(self):
+        return pickle.dumps(self._module.get_loop_stats())
+
 
 class Client(ClientBase):
 
@@ -498,6 +607,11 @@ class Client(ClientBase):
     def get_wavelength(self, channel):
         return self._service.exposed_get_wavelength(channel)
 
+    def get_loop_stats(self):
+        """ Returns the timing statistics of the control loop, see ControlLoop.stats() """
+
+        return pickle.loads(self._service.exposed_get_loop_stats())
+
     def clear_channel(self, channel):
         return self._service.exposed_clear_channel(channel)
 
@@ -542,11 +656,9 @@ class Channel:
         self.ao_clients = ao_clients
         self.log = log
         self.ao = None  # Dict with client name and channel for ao to use
-        self.voltage = None  # Array of voltage values for ao, used for plotting/monitoring voltage
         self.current_voltage = 0
         self.setpoint = None
         self.lock = False
-        self.error = None  # Array of error values, used for plotting/monitoring lock error
         self.labels_updated = False  # Flag to check if we have updated all labels
         self.setpoint_override = 0  # Flag to check if setpoint has been updated + GUI should be overridden
         # self.lock_override = True  # Flag to check if lock has been updated + GUI should be overridden
@@ -562,8 +674,27 @@ class Channel:
         self._overwrite_parameters(channel_params)
 
         # Initialize relevant placeholders
-        self.data = np.array([])
-        self.sp_data = np.array([])
+        self.traces = TraceStore(('data', 'sp_data', 'voltage', 'error'))
+
+    @property
+    def data(self):
+        """ Wavelength trace, see TraceStore.view() """
+        return self.traces.view('data')
+
+    @property
+    def sp_data(self):
+        """ Setpoint trace, see TraceStore.view() """
+        return self.traces.view('sp_data')
+
+    @property
+    def voltage(self):
+        """ Trace of ao voltages, used for plotting/monitoring voltage """
+        return self.traces.view('voltage')
+
+    @property
+    def error(self):
+        """ Trace of lock errors, used for plotting/monitoring lock error """
+        return self.traces.view('error')
 
     def initialize(self, wavelength, display_pts=5000):
         """
@@ -573,25 +704,26 @@ class Channel:
         :param display_pts: number of points to display on the plot
         """
 
-        self.data = np.ones(display_pts) * wavelength
-
         # if self.sp_data already exists, keep its last value so that the
         # clear data functionality doesn't override the setpoint
         if len(self.sp_data) > 0:
-            self.sp_data = np.ones(display_pts) * self.sp_data[-1]
+            self.setpoint = self.sp_data[-1]
         else:
-            self.sp_data = np.ones(display_pts) * self.data[-1]
-
-        self.setpoint = self.sp_data[-1]
-
-        # Initialize voltage and error
-        self.voltage = np.ones(display_pts) * self.current_voltage
+            self.setpoint = wavelength
+
+        self.traces.reset(
+            capacity=display_pts,
+            data=wavelength,
+            sp_data=self.setpoint,
+            voltage=self.current_voltage,
+            error=wavelength - self.setpoint
+        )
 
-        # Check that setpoint is reasonable, otherwise set error to 0
-        self.error = np.ones(display_pts) * (wavelength - self.setpoint)
+        # Restart the PID history from the current wavelength
+        self.pid.set_pv(pv=self.data)
 
     def initialize_sp_data(self, display_pts=5000):
-        self.sp_data = np.ones(display_pts) * self.data[-1]
+        self.traces.append('sp_data', np.full(display_pts, self.data[-1]))
 
     def update(self, wavelength):
         """
@@ -600,7 +732,7 @@ class Channel:
         :param wavelength: (float) current wavelength
         """
 
-        self.data = np.append(self.data[1:], wavelength)
+        self.traces.append('data', wavelength)
 
         # Pick which setpoint to use
         # If the setpoint override is on, this means we need to try and set the GUI value to self.setpoint
@@ -626,14 +758,14 @@ class Channel:
 
         # Store the latest GUI setpoint
         self.prev_gui_setpoint = copy.deepcopy(self.gui_setpoint)
-        self.sp_data = np.append(self.sp_data[1:], self.setpoint)
+        self.traces.append('sp_data', self.setpoint)
 
         # Now deal with pid stuff
         self.pid.set_parameters(setpoint=0 if self.setpoint is None else self.setpoint)
 
         # Implement lock
-        # Set process variable
-        self.pid.set_pv(pv=self.data[len(self.data) - self.memory:])
+        # Add the new sample to the process variable
+        self.pid.set_pv(pv=wavelength)
         # Set control variable
         self.pid.set_cv()
 
@@ -664,8 +796,8 @@ class Channel:
                 self.ao = None
 
         # Update voltage and error data
-        self.voltage = np.append(self.voltage[1:], self.current_voltage)
-        self.error = np.append(self.error[1:], self.pid.error * self._gain)
+        self.traces.append('voltage', self.current_voltage)
+        self.traces.append('error', self.pid.error * self._gain)
 
     def zero_voltage(self):
         """Zeros the voltage (if applicable)"""
@@ -762,9 +894,7 @@ class Channel:
         else:
             self.ao = None
 
-        # Configure voltage monitor arrays if desired
-        self.voltage = np.array([])
-        self.error = np.array([])
+        # Configure voltage monitor curves
         self.aux_name = '{} Auxiliary Monitor'.format(self.name)
         self.voltage_curve = '{} Voltage'.format(self.name)
         self.error_curve = '{} Lock Error'.format(self.name)
@@ -830,6 +960,11 @@ def launch(**kwargs):
     logger.update_data(data=dict(device_id=device_id))
     wlm_monitor.gui.set_network_info(port=kwargs['server_port'])
 
+    # Run the channel updates and locks in a dedicated thread, unless disabled in the config
+    loop_rate = config.get('loop_rate', LOOP_RATE)
+    if loop_rate:
+        wlm_monitor.start_control_loop(rate=loop_rate)
+
     # Run continuously
     # Note that the actual operation inside run() can be paused using the update server
     while True:
@@ -2,9 +2,14 @@ import numpy as np
 
 
 class PID:
-    """Generic class for PID locking"""
+    """Generic class for PID locking
 
-    def __init__(self, p=0, i=0, d=0, setpoint=0, memory=20):
+    The process variable history is stored in a circular buffer of length
+    memory together with its running sum, such that a step with a new sample
+    costs O(1) independent of the memory.
+    """
+
+    def __init__(self, p=0, i=0, d=0, setpoint=0, memory=20, windup_limit=None, d_filter=0, integrate_window=True):
         """ Constructor for PID class
 
         :rtype: object
@@ -13,6 +18,13 @@ class PID:
         :param d: differential
         :param setpoint: setpoint for process variable
         :param memory: number of samples for integral memory
+        :param windup_limit: maximal magnitude of the integral term (anti-windup),
+            None for no limit
+        :param d_filter: smoothing factor of the low-pass filter applied to the
+            derivative, between 0 (no filtering) and 1
+        :param integrate_window: whether the integral term sums the errors of the whole
+            history, otherwise only the newest error is used with the same 1/memory
+            scaling, as callers pushing single samples got before the history was kept
         """
 
         self.p = p
@@ -20,11 +32,29 @@ class PID:
         self.d = d
         self.memory = memory
         self.setpoint = setpoint
-        self._pv = np.zeros(self.memory)
+        self.windup_limit = windup_limit
+        self.d_filter = d_filter
+        self.integrate_window = integrate_window
         self.cv = 0
         self.error = 0
 
-    def set_parameters(self, p=None, i=None, d=None, setpoint=None, memory=None):
+        # Circular buffer of the process variable, _head points to the oldest sample.
+        # It is filled with the first sample, such that the integral does not start
+        # with a kick from a history of zeros.
+        self._buffer = np.zeros(self.memory)
+        self._head = 0
+        self._sum = 0.0
+        self._derivative = 0.0
+        self._filled = False
+
+    @property
+    def _pv(self):
+        """ Process variable history, from the oldest to the newest sample """
+
+        return np.roll(self._buffer, -self._head)
+
+    def set_parameters(self, p=None, i=None, d=None, setpoint=None, memory=None, windup_limit=None, d_filter=None,
+                       integrate_window=None):
         """ Sets parameters of PID controller
 
         :param p: proportional gain
@@ -32,6 +62,9 @@ class PID:
         :param d: differential
         :param setpoint: setpoint for process variable
         :param memory: number of samples for integral memory
+        :param windup_limit: maximal magnitude of the integral term
+        :param d_filter: smoothing factor of the derivative filter
+        :param integrate_window: whether the integral term sums the whole history
         """
 
         if p is not None:
@@ -40,46 +73,148 @@ class PID:
             self.i = i
         if d is not None:
             self.d = d
-        if memory is not None:
-            self.memory = memory
         if setpoint is not None:
             self.setpoint = setpoint
+        if windup_limit is not None:
+            self.windup_limit = windup_limit
+        if d_filter is not None:
+            self.d_filter = d_filter
+        if integrate_window is not None:
+            self.integrate_window = integrate_window
+
+        if memory is not None and memory != self.memory and not self._filled:
+            self.memory = memory
+            self._buffer = np.zeros(self.memory)
+            self._head = 0
 
-        # Update process variable history to have appropriate length if too short
-        pv_length = len(self._pv)
-        if pv_length < self.memory:
+        elif memory is not None and memory != self.memory:
+            pv = self._pv
+
+            # Pad constants onto the beginning of the history if it is too short,
+            # otherwise keep the newest samples
+            if len(pv) < memory:
+                pv = np.hstack((np.ones(memory - len(pv)) * pv[0], pv))
+            else:
+                pv = pv[len(pv) - memory:]
 
-            # Pad constants onto the beginning of the array
-            self._pv = np.hstack((np.ones(self.memory - pv_length) * self._pv[0], self._pv))
+            self.memory = memory
+            self._set_window(pv)
 
     def set_pv(self, pv=np.zeros(10)):
         """ Sets process variable
 
         :param pv: process variable (measured value of process to be locked).
-            This should ideally be a numpy array of recent data points
+            This should ideally be a numpy array of recent data points, or a
+            single new data point
         """
 
+        pv = np.atleast_1d(pv)
+
         # Check the length of the input
         pv_length = len(pv)
 
         # If it's too short, append it onto the current pv
         if pv_length < self.memory:
-            self._pv = np.append(self._pv[self.memory - pv_length:], pv)
+            for value in pv:
+                self._push(value)
 
         # Otherwise just take the last elements
         else:
-            self._pv = pv[pv_length - self.memory:]
+            self._set_window(pv[pv_length - self.memory:])
 
     def set_cv(self):
         """Calculates the appropriate value of the control variable"""
 
         # Calculate error
-        error = self._pv - self.setpoint
-        self.error = error[-1]
+        last = self._buffer[self._head - 1]
+        self.error = last - self.setpoint
 
         # Calculate response
-        if len(error) > 1:
-            self.cv = self.p * error[-1] + self.i * np.sum(error) / self.memory + self.d * (error[-1] - error[-2])
+        if self.integrate_window:
+            integral = self.i * (self._sum - self.memory * self.setpoint) / self.memory
+        else:
+            integral = self.i * self.error / self.memory
+        if self.windup_limit is not None:
+            integral = min(max(integral, -self.windup_limit), self.windup_limit)
+        self.cv = self.p * self.error + integral
+
+        # if only have a single error so far, then derivative is undefined so do not calculate it
+        if self.memory > 1:
+            derivative = last - self._buffer[self._head - 2]
+            self._derivative = self.d_filter * self._derivative + (1 - self.d_filter) * derivative
+            self.cv += self.d * self._derivative
+
+    def step(self, pv):
+        """ Adds new process variable samples and calculates the control variable
+
+        :param pv: new data point(s) of the process variable
+        :return: control variable
+        """
+
+        self.set_pv(pv)
+        self.set_cv()
+        return self.cv
+
+    def step_many(self, pv):
+        """ Equivalent to calling step() for each sample, e.g. for simulations
+
+        Without anti-windup and derivative filtering, all steps are calculated
+        at once.
+
+        :param pv: (array) process variable samples
+        :return: (np.ndarray) control variable after each sample
+        """
+
+        pv = np.asarray(pv, dtype=float).reshape(-1)
+        num_samples = len(pv)
+        if num_samples == 0:
+            return np.empty(0)
+
+        if self.windup_limit is not None or self.d_filter:
+            return np.array([self.step(value) for value in pv])
+        if not self._filled:
+            self._set_window(np.full(self.memory, pv[0]))
+
+        # Work with errors to avoid precision loss in the cumulative sum
+        history = np.concatenate((self._pv, pv)) - self.setpoint
+        cumsum = np.concatenate(([0], np.cumsum(history)))
+        window_sums = cumsum[self.memory + 1:] - cumsum[1:num_samples + 1]
+        errors = history[self.memory:]
+
+        if self.integrate_window:
+            cv = self.p * errors + self.i * window_sums / self.memory
         else:
-            #if only have a single error so far, then derivative is undefined so do not calculate it
-            self.cv = self.p * error[-1] + self.i * np.sum(error) / self.memory
+            cv = (self.p + self.i / self.memory) * errors
+        if self.memory > 1:
+            derivatives = errors - history[self.memory - 1:-1]
+            cv += self.d * derivatives
+            self._derivative = derivatives[-1]
+
+        self._set_window(history[num_samples:] + self.setpoint)
+        self.error = errors[-1]
+        self.cv = cv[-1]
+        return cv
+
+    def _push(self, value):
+        """ Replaces the oldest sample of the history by value """
+
+        if not self._filled:
+            self._set_window(np.full(self.memory, value, dtype=float))
+            return
+
+        self._sum += value - self._buffer[self._head]
+        self._buffer[self._head] = value
+        self._head += 1
+        if self._head == self.memory:
+            self._head = 0
+
+            # Avoid accumulating rounding errors in the running sum
+            self._sum = float(np.sum(self._buffer))
+
+    def _set_window(self, pv):
+        """ Replaces the history by pv, which has to contain memory samples """
+
+        self._buffer = np.array(pv, dtype=float)
+        self._head = 0
+        self._sum = float(np.sum(self._buffer))
+        self._filled = True
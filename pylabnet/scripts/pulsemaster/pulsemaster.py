@@ -16,6 +16,7 @@ from simpleeval import simple_eval, NameNotDefined
 
 import pylabnet.utils.pulseblock.pulse as po
 import pylabnet.utils.pulseblock.pulse_block as pb
+from pylabnet.utils.pulseblock.pb_sample import sample_cache
 from pylabnet.hardware.awg.zi_hdawg import Driver
 from pylabnet.utils.helper_methods import slugify
 from pylabnet.gui.pyqt.external_gui import Window
@@ -567,10 +568,16 @@ class PulseMaster:
 
                     t1, t2 = new_t1, new_t2
 
-                    # Draw the current pulse at high grid density
+                    # Draw the current pulse at high grid density, unchanged
+                    # pulses are taken from the sample cache
                     t_ar = np.linspace(t1, t2, self.plot_points)
                     x_ar.extend(t_ar)
-                    y_ar.extend(p_item.get_value(t_ar))
+                    y_ar.extend(sample_cache.get(
+                        p_item,
+                        t_start=t1,
+                        t_step=(t2 - t1) / (self.plot_points - 1),
+                        n_pts=self.plot_points
+                    ))
 
                 # Put zero-point after the last pulse
                 x_ar.append(new_t2)
@@ -7,11 +7,11 @@ import importlib
 import pyqtgraph as pg
 import numpy as np
 
-from pylabnet.scripts.sweeper.sweeper import MultiChSweep1D
+from pylabnet.scripts.sweeper.sweeper import MultiChSweep1D, SweepStore
 from pylabnet.network.client_server.sweeper import Service
 from pylabnet.gui.pyqt.external_gui import Window, Popup
 from pylabnet.utils.helper_methods import (get_gui_widgets, load_script_config,
-                                           get_legend_from_graphics_view, add_to_legend, fill_2dlist, generic_save,
+                                           get_legend_from_graphics_view, add_to_legend, generic_save,
                                            unpack_launcher, create_server, pyqtgraph_save, get_ip, set_graph_background, find_client)
 from pylabnet.scripts.sweeper.scan_fit import FitPopup
 
@@ -54,12 +54,7 @@ class Controller(MultiChSweep1D):
         self.pts = self.widgets['pts'].value()
         self.reps = self.widgets['reps'].value()
 
-        self.data_fwd = []
-        self.data_fwd_2nd_reading = [] ### ADDED
-        self.data_bwd = []
-        self.avg_fwd = []
-        self.avg_fwd_2nd_reading = [] ### ADDED
-        self.avg_bwd = []
+        self._init_stores()
         self.fit_popup = None
         self.p0_fwd = None
         self.p0_bwd = None
@@ -178,6 +173,9 @@ class Controller(MultiChSweep1D):
         spec.loader.exec_module(self.module)
 
         self.experiment = self.module.experiment
+
+        # Optional separate parameter setting, called before each experiment
+        self.set_parameter = getattr(self.module, 'set_parameter', None)
         self.min = self.widgets['p_min'].value()
         self.max = self.widgets['p_max'].value()
         self.pts = self.widgets['pts'].value()
@@ -246,7 +244,7 @@ class Controller(MultiChSweep1D):
 
         # Save heatmap
         generic_save(
-            data=fill_2dlist(self.data_fwd),
+            data=self.store_fwd.scans,
             filename=f'{filename}_fwd_scans',
             directory=directory,
             date_dir=date_dir
@@ -260,7 +258,7 @@ class Controller(MultiChSweep1D):
 
         # Save average
         generic_save(
-            data=np.vstack((self.x_fwd, np.array([self.avg_fwd]))),
+            data=np.vstack((self.x_fwd, np.array([self.store_fwd.average]))),
             filename=f'{filename}_fwd_avg',
             directory=directory,
             date_dir=date_dir
@@ -276,7 +274,7 @@ class Controller(MultiChSweep1D):
 
             # Save heatmap
             generic_save(
-                data=fill_2dlist(self.data_bwd),
+                data=self.store_bwd.scans,
                 filename=f'{filename}_bwd_scans',
                 directory=directory,
                 date_dir=date_dir
@@ -289,7 +287,7 @@ class Controller(MultiChSweep1D):
             )
             # Save average
             generic_save(
-                data=np.vstack((self.x_bwd, np.array([self.avg_bwd]))),
+                data=np.vstack((self.x_bwd, np.array([self.store_bwd.average]))),
                 filename=f'{filename}_bwd_avg',
                 directory=directory,
                 date_dir=date_dir
@@ -342,9 +340,9 @@ class Controller(MultiChSweep1D):
         if status:
             self.fit_popup = FitPopup(ui='fit_popup',
                                       x_fwd=self.x_fwd,
-                                      data_fwd=self.avg_fwd,
+                                      data_fwd=self.store_fwd.average,
                                       x_bwd=self.x_bwd,
-                                      data_bwd=self.avg_bwd,
+                                      data_bwd=self.store_bwd.average,
                                       p0_fwd=None,
                                       p0_bwd=None,
                                       config=self.config,
@@ -378,10 +376,6 @@ class Controller(MultiChSweep1D):
             self.widgets['curve_avg'][1].clear()
             self.widgets['fit_avg'][0].clear()
             self.widgets['fit_avg'][1].clear()
-            self.data_fwd = []
-            self.data_bwd = []
-            self.avg_fwd = []
-            self.avg_bwd = []
             self.fit_fwd = []
             self.fit_bwd = []
             self.p0_fwd = None
@@ -456,207 +450,120 @@ class Controller(MultiChSweep1D):
         for hmap in self.widgets['hmap']:
             hmap.view.setLimits(xMin=self.min, xMax=self.max)
 
-    def _reset_plots(self):
-        """ Resets things after a rep """
-        self.data_bwd.append([])
-        self.data_fwd.append([])
+    def _init_stores(self):
+        """ Creates empty data stores for a new sweep
 
-    def _run_and_plot(self, x_value, backward=False):
+        In sawtooth mode, the backward store holds the second reading (if any)
+        """
 
-        if self.sweep_type != 'sawtooth':
-            if backward:
+        self.store_fwd = SweepStore(self.pts, reps=self.reps)
+        self.store_bwd = SweepStore(self.pts, reps=self.reps)
 
-                # Single trace
-                self.data_bwd[-1].append(self.experiment(x_value, self, gui=self.gui))
-                cur_ind = len(self.data_bwd[-1])
-                self.widgets['curve'][1].setData(
-                    self.x_bwd[:cur_ind],
-                    self.data_bwd[-1]
-                )
+    def _reset_plots(self):
+        """ Resets things after a rep """
+        self.store_bwd.new_rep()
+        self.store_fwd.new_rep()
 
-                # Update average and plot
-                try:
-                    cur_rep = len(self.data_bwd)
-                    self.avg_bwd[cur_ind - 1] = (
-                        (cur_rep - 1) * self.avg_bwd[cur_ind - 1]
-                        + self.data_bwd[-1][-1]
-                    ) / cur_rep
-                    self.widgets['curve_avg'][1].setData(
-                        self.x_bwd,
-                        self.avg_bwd
-                    )
+    def _acquire(self, x_value):
+        """ Runs the experiment script for an x value
 
-                # If it is the first run, just add the data
-                except IndexError:
-                    self.avg_bwd.append(self.data_bwd[-1][-1])
-
-                # Heat map
-                if not self.fast:
-                    self.widgets['hmap'][1].setImage(
-                        img=np.transpose(np.fliplr(fill_2dlist(self.data_bwd))),
-                        pos=(self.min, 0),
-                        scale=((self.max - self.min) / self.pts, 1),
-                        autoRange=False
-                    )
-            else:
+        :param x_value: (double) experiment parameter
+        :return: reading(s) returned by the experiment
+        """
 
-                self.data_fwd[-1].append(self.experiment(x_value, self, gui=self.gui))
-                cur_ind = len(self.data_fwd[-1])
-                self.widgets['curve'][0].setData(
-                    self.x_fwd[:cur_ind],
-                    self.data_fwd[-1]
-                )
+        return self.experiment(x_value, self, gui=self.gui)
 
-                # Update average and plot
-                try:
-                    cur_rep = len(self.data_fwd)
-                    self.avg_fwd[cur_ind - 1] = (
-                        (cur_rep - 1) * self.avg_fwd[cur_ind - 1]
-                        + self.data_fwd[-1][-1]
-                    ) / cur_rep
-                    self.widgets['curve_avg'][0].setData(
-                        self.x_fwd,
-                        self.avg_fwd
-                    )
+    def _process_point(self, x_value, reading, backward=False):
+        """ Stores and plots the reading(s) of a point
 
-                # If it is the first run, just add the data
-                except IndexError:
-                    self.avg_fwd.append(self.data_fwd[-1][-1])
-
-                # Heat map
-                if not self.fast:
-                    self.widgets['hmap'][0].setImage(
-                        img=np.transpose(fill_2dlist(self.data_fwd)),
-                        pos=(self.min, 0),
-                        scale=((self.max - self.min) / self.pts, 1),
-                        autoRange=False
-                    )
+        :param x_value: (double) experiment parameter
+        :param reading: reading returned by the experiment, in sawtooth mode
+            optionally a pair of readings
+        :param backward: (bool) whether or not backward or forward
+        """
+
+        if self.sweep_type != 'sawtooth':
+            if backward:
+                self._add_point(reading, index=1)
+            else:
+                self._add_point(reading, index=0)
 
         else:
-            reading = self.experiment(x_value, self, gui=self.gui)
             try:
                 n_readings = len(reading)
-                self.data_fwd[-1].append(reading[0])
-                cur_ind = len(self.data_fwd[-1])
-                self.widgets['curve'][0].setData(
-                    self.x_fwd[:cur_ind],
-                    self.data_fwd[-1]
-                )
+                self._add_point(reading[0], index=0)
+                self._add_point(reading[1], index=1)
+            except TypeError:
+                self._add_point(reading, index=0)
 
-                # Update average and plot
-                try:
-                    cur_rep = len(self.data_fwd)
-                    self.avg_fwd[cur_ind - 1] = (
-                        (cur_rep - 1) * self.avg_fwd[cur_ind - 1]
-                        + self.data_fwd[-1][-1]
-                    ) / cur_rep
-                    self.widgets['curve_avg'][0].setData(
-                        self.x_fwd,
-                        self.avg_fwd
-                    )
+        self.gui.force_update()
 
-                # If it is the first run, just add the data
-                except IndexError:
-                    self.avg_fwd.append(self.data_fwd[-1][-1])
-
-                # Heat map
-                if not self.fast:
-                    self.widgets['hmap'][0].setImage(
-                        img=np.transpose(fill_2dlist(self.data_fwd)),
-                        pos=(self.min, 0),
-                        scale=((self.max - self.min) / self.pts, 1),
-                        autoRange=False
-                    )
-                    self.widgets['hmap'][1].setImage(
-                        img=np.transpose(fill_2dlist(self.data_bwd)),
-                        pos=(self.min, 0),
-                        scale=((self.max - self.min) / self.pts, 1),
-                        autoRange=False
-                    )
+    def _add_point(self, value, index):
+        """ Stores a new point and updates the plots
 
-                self.data_bwd[-1].append(reading[1])
-                cur_ind = len(self.data_bwd[-1])
-                self.widgets['curve'][1].setData(
-                    self.x_bwd[:cur_ind],
-                    self.data_bwd[-1]
-                )
+        :param value: (float) measured value
+        :param index: (int) 0 for forward (or first reading), 1 for backward (or second reading)
+        """
 
-                # Update average and plot
-                try:
-                    cur_rep = len(self.data_bwd)
-                    self.avg_bwd[cur_ind - 1] = (
-                        (cur_rep - 1) * self.avg_bwd[cur_ind - 1]
-                        + self.data_bwd[-1][-1]
-                    ) / cur_rep
-                    self.widgets['curve_avg'][1].setData(
-                        self.x_bwd,
-                        self.avg_bwd
-                    )
+        store = self.store_bwd if index == 1 else self.store_fwd
+        x_axis = self.x_bwd if index == 1 else self.x_fwd
+        store.add_point(value)
 
-                # If it is the first run, just add the data
-                except IndexError:
-                    self.avg_bwd.append(self.data_bwd[-1][-1])
-
-                # Heat map
-                if not self.fast:
-                    self.widgets['hmap'][1].setImage(
-                        img=np.transpose(np.fliplr(fill_2dlist(self.data_bwd))),
-                        pos=(self.min, 0),
-                        scale=((self.max - self.min) / self.pts, 1),
-                        autoRange=False
-                    )
-            except TypeError:
-                self.data_fwd[-1].append(reading)
-                cur_ind = len(self.data_fwd[-1])
-                self.widgets['curve'][0].setData(
-                    self.x_fwd[:cur_ind],
-                    self.data_fwd[-1]
-                )
+        # Single trace
+        self.widgets['curve'][index].setData(
+            x_axis[:store.index],
+            store.trace
+        )
 
-                # Update average and plot
-                try:
-                    cur_rep = len(self.data_fwd)
-                    self.avg_fwd[cur_ind - 1] = (
-                        (cur_rep - 1) * self.avg_fwd[cur_ind - 1]
-                        + self.data_fwd[-1][-1]
-                    ) / cur_rep
-                    self.widgets['curve_avg'][0].setData(
-                        self.x_fwd,
-                        self.avg_fwd
-                    )
+        # Average is only plotted once the first scan is complete
+        if store.rep > 0:
+            self.widgets['curve_avg'][index].setData(
+                x_axis,
+                store.average
+            )
 
-                # If it is the first run, just add the data
-                except IndexError:
-                    self.avg_fwd.append(self.data_fwd[-1][-1])
-
-                # Heat map
-                if not self.fast:
-                    self.widgets['hmap'][0].setImage(
-                        img=np.transpose(fill_2dlist(self.data_fwd)),
-                        pos=(self.min, 0),
-                        scale=((self.max - self.min) / self.pts, 1),
-                        autoRange=False
-                    )
+        # Heat map, fully redrawn only during the first scan and once a scan completes
+        if not self.fast:
+            self._set_hmap(index, redraw=(store.rep == 0 or store.index == store.pts))
 
-        self.gui.force_update()
+    def _set_hmap(self, index, redraw=True):
+        """ Shows all scans of a direction in its heat map
+
+        :param index: (int) 0 for forward, 1 for backward
+        :param redraw: (bool) whether to redraw the heat map with its levels and histogram,
+            otherwise only its image is refreshed
+        """
+
+        if index == 1:
+            scans = self.store_bwd.scans
+
+            # Backward scans run from max to min
+            if self.sweep_type == 'triangle':
+                scans = np.fliplr(scans)
+        else:
+            scans = self.store_fwd.scans
+
+        if not redraw:
+            self.widgets['hmap'][index].getImageItem().setImage(
+                np.transpose(scans),
+                autoLevels=False
+            )
+            return
+
+        self.widgets['hmap'][index].setImage(
+            img=np.transpose(scans),
+            pos=(self.min, 0),
+            scale=((self.max - self.min) / self.pts, 1),
+            autoRange=False
+        )
 
     def _update_hmaps(self, reps_done):
         """ Updates hmap if in fast mode """
 
         if self.fast:
             if self.sweep_type == 'triangle':
-                self.widgets['hmap'][1].setImage(
-                    img=np.transpose(np.fliplr(fill_2dlist(self.data_bwd))),
-                    pos=(self.min, 0),
-                    scale=((self.max - self.min) / self.pts, 1),
-                    autoRange=False
-                )
-            self.widgets['hmap'][0].setImage(
-                img=np.transpose(fill_2dlist(self.data_fwd)),
-                pos=(self.min, 0),
-                scale=((self.max - self.min) / self.pts, 1),
-                autoRange=False
-            )
+                self._set_hmap(1)
+            self._set_hmap(0)
 
     def _update_integrated(self, reps_done):
         """ Update repetition counter """
@@ -666,11 +573,11 @@ class Controller(MultiChSweep1D):
 
     def _update_fits(self):
         """ Updates fits """
-        if len(self.avg_fwd) != 0 and self.fit_popup is not None:
+        if len(self.store_fwd.average) != 0 and self.fit_popup is not None:
             if self.fit_popup.mod is not None and\
                     self.fit_popup.mod.init_params is not None:
-                self.fit_popup.data_fwd = np.array(self.avg_fwd)
-                self.fit_popup.data_bwd = np.array(self.avg_bwd)
+                self.fit_popup.data_fwd = np.array(self.store_fwd.average)
+                self.fit_popup.data_bwd = np.array(self.store_bwd.average)
                 if self.p0_fwd is not None and self.p0_bwd is not None:
                     self.fit_popup.p0_fwd = self.p0_fwd
                     self.fit_popup.p0_bwd = self.p0_bwd
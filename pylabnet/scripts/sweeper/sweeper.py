@@ -12,8 +12,25 @@ Currently only supported in notebook format. Example usage:
 
 Note that some client-server functionality for termination is implemented,
 see pylabnet.network.client_server.sweeper
+
+Pipelined sweeps: each point consists of the stages
+ - 'set': set the sweep parameter (optional, see configure_experiment())
+ - 'acquire': run the experiment for the current parameter value
+ - 'process': store and plot the value
+With exp.set_parameters(pipelined=True), the set and acquire stages run in a
+worker thread, such that processing a point overlaps with acquiring the next
+one. With overlap_set=True, setting the next parameter additionally overlaps
+with the acquisition of the current point, which is only safe if the
+experiment has latched its parameter once the acquisition started. Sweeps
+with a GUI attached (exp.gui) always run serially, since their experiments
+may update widgets, which is only possible from the GUI thread. The time
+spent in each stage is recorded in exp.timing.
 """
 
+import time
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 
 from pylabnet.utils.logging.logger import LogHandler
@@ -21,6 +38,154 @@ from pylabnet.utils.helper_methods import generic_save, plotly_figure_save
 from pylabnet.gui.igui.iplot import MultiTraceFig, HeatMapFig
 
 
+class SweepStore:
+    """ Preallocated storage of repeated 1D sweeps
+
+    Scans are stored in a (reps, pts) array, or (reps, pts, channels) for
+    multiple channels, together with a running mean of every point. Adding a
+    point therefore has a constant cost, independent of the number of
+    repetitions. If the number of repetitions is not known in advance, the
+    storage is doubled whenever it is full.
+    """
+
+    def __init__(self, pts, reps=0, channels=None):
+        """ Instantiates an empty store
+
+        :param pts: (int) number of points per scan
+        :param reps: (int) expected number of repetitions, 0 if unknown
+        :param channels: (int) number of channels, None for scalar points
+        """
+
+        self.pts = pts
+        self.channels = channels
+        self._point_shape = () if channels is None else (channels,)
+
+        # Grow the storage later for a large or unknown number of repetitions
+        initial_reps = min(reps, 1024) if reps > 0 else 16
+        self._data = np.zeros((initial_reps, pts) + self._point_shape)
+        self._average = np.zeros((pts,) + self._point_shape)
+
+        # Index of the current repetition and number of points in it
+        self.rep = -1
+        self.index = 0
+
+    def new_rep(self):
+        """ Starts a new scan """
+
+        self.rep += 1
+        self.index = 0
+
+        if self.rep >= len(self._data):
+            data = np.zeros((2 * len(self._data), self.pts) + self._point_shape)
+            data[:len(self._data)] = self._data
+            self._data = data
+
+    def add_point(self, value):
+        """ Adds the next point of the current scan and updates its running mean
+
+        :param value: (float or array) measured value, one per channel
+        """
+
+        if self.rep < 0:
+            self.new_rep()
+        if self.index >= self.pts:
+            raise IndexError(f'Scan {self.rep} already contains {self.pts} points')
+
+        # Pad a new scan with its first point once, so the heat map of an incomplete scan is defined
+        if self.index == 0:
+            self._data[self.rep] = value
+        else:
+            self._data[self.rep, self.index] = value
+        self._average[self.index] += (self._data[self.rep, self.index] - self._average[self.index]) / (self.rep + 1)
+        self.index += 1
+
+    @property
+    def reps_done(self):
+        """ Number of completed scans """
+
+        return self.rep + (self.index == self.pts)
+
+    @property
+    def trace(self):
+        """ Points of the current scan """
+
+        return self._data[max(self.rep, 0), :self.index]
+
+    @property
+    def average(self):
+        """ Running mean of all scans, only covers the measured points during the first scan """
+
+        if self.rep <= 0:
+            return self._average[:self.index]
+        return self._average
+
+    @property
+    def scans(self):
+        """ All scans as (reps, pts) array, for heat maps
+
+        Missing points of the current scan are padded with its first point.
+        """
+
+        if self.rep < 0:
+            return self._data[:0]
+        if self.rep == 0:
+            return self._data[:1, :self.index]
+        if self.index == 0:
+            return self._data[:self.rep]
+        return self._data[:self.rep + 1]
+
+
+class SweepTiming:
+    """ Records the time spent in each stage of a sweep """
+
+    # 'wait' is the time the sweep waits for an acquisition running in the background
+    STAGES = ('set', 'acquire', 'process', 'wait')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """ Clears all recorded durations """
+
+        self.durations = {stage: [] for stage in self.STAGES}
+        self.start_time = time.perf_counter()
+
+    def record(self, stage, duration):
+        """ Records the duration of a stage
+
+        :param stage: (str) name of the stage
+        :param duration: (float) duration in s
+        """
+
+        self.durations[stage].append(duration)
+
+    def summary(self):
+        """ Returns the total and mean time per stage
+
+        :return: (dict) containing a dict with 'total', 'mean' and 'count' for
+            each stage, and the 'elapsed' wall time in s
+        """
+
+        summary = dict(elapsed=time.perf_counter() - self.start_time)
+        for stage, durations in self.durations.items():
+            summary[stage] = dict(
+                total=float(np.sum(durations)),
+                mean=float(np.mean(durations)) if durations else 0.0,
+                count=len(durations)
+            )
+        return summary
+
+    def report(self):
+        """ Returns a human-readable summary of the timing """
+
+        summary = self.summary()
+        stages = ', '.join(
+            f'{stage}: {summary[stage]["total"]:.3f} s ({summary[stage]["mean"] * 1e3:.2f} ms/point)'
+            for stage in self.STAGES if summary[stage]['count'] > 0
+        )
+        return f'Sweep took {summary["elapsed"]:.3f} s - {stages}'
+
+
 class Sweep1D:
 
     def __init__(self, logger=None, sweep_type='triangle'):
@@ -48,6 +213,19 @@ class Sweep1D:
         self.y_label = None
         self.autosave = False
 
+        # Data of the forward and backward sweeps
+        self.store_fwd = None
+        self.store_bwd = None
+
+        # GUI window of GUI-based sweeps
+        self.gui = None
+
+        # Pipelined execution
+        self.set_parameter = None
+        self.pipelined = False
+        self.overlap_set = False
+        self.timing = SweepTiming()
+
         # Setup stylesheet.
         #self.gui.apply_stylesheet()
 
@@ -62,6 +240,10 @@ class Sweep1D:
             :sweep_type: (str) 'triangle' or 'sawtooth' supported
             :x_label: (str) Label of x axis
             :y_label: (str) label of y axis
+            :pipelined: (bool) whether to acquire the next point while
+                processing the current one
+            :overlap_set: (bool) whether setting the next parameter may
+                overlap with the acquisition of the current point
         """
 
         if 'min' in kwargs:
@@ -83,19 +265,28 @@ class Sweep1D:
             self.x_label = kwargs['x_label']
         if 'y_label' in kwargs:
             self.y_label = kwargs['y_label']
+        if 'pipelined' in kwargs:
+            self.pipelined = kwargs['pipelined']
+        if 'overlap_set' in kwargs:
+            self.overlap_set = kwargs['overlap_set']
 
     def configure_experiment(
-        self, experiment, experiment_params={}
+        self, experiment, experiment_params={}, set_parameter=None
     ):
         """ Sets the experimental script to a provided module
 
         :param experiment: (callable) method to run
         :param experiment_params: (dict) containing name and value of
             fixed parameters
+        :param set_parameter: (callable) optional method setting the sweep
+            parameter, called with the parameter value before experiment.
+            Separating it from the experiment allows pipelined sweeps to
+            overlap it with the previous acquisition.
         """
 
         self.experiment = experiment
         self.fixed_params = experiment_params
+        self.set_parameter = set_parameter
 
     def run_once(self, param_value):
         """ Runs the experiment once for a parameter value
@@ -109,13 +300,8 @@ class Sweep1D:
             **self.fixed_params
         )
 
+        # May be called from a worker thread, the GUI is reset once run() returns
         if not result:
-            self.widgets['rep_tracker'].setValue(0)
-            self.widgets['reps'].setValue(0)
-            for button in self.widgets['avg']:
-                button.setText('Avg only')
-            self.widgets['run'].setStyleSheet('background-color: green')
-            self.widgets['run'].setText('Run')
             self.stop()
             self.log.info('Sweep experiment auto-aborted')
 
@@ -138,23 +324,21 @@ class Sweep1D:
         if self.sweep_type != 'sawtooth':
             bw_sweep_points = self._generate_x_axis(backward=True)
         self._configure_plots(plot)
+        self._init_stores()
 
         reps_done = 0
         self.stop_flag = False
+        self.timing.reset()
+        if self.pipelined and self.gui is not None:
+            self.log.warn('Pipelined sweeps are not supported with a GUI, running serially')
         while (reps_done < self.reps or self.reps <= 0 and not self.stop_flag):
 
             self._reset_plots()
 
-            for x_value in sweep_points:
-                if self.stop_flag:
-                    break
-                self._run_and_plot(x_value)
+            self._sweep(sweep_points)
 
             if self.sweep_type != 'sawtooth':
-                for x_value in bw_sweep_points:
-                    if self.stop_flag:
-                        break
-                    self._run_and_plot(x_value, backward=True)
+                self._sweep(bw_sweep_points, backward=True)
 
             if self.stop_flag:
                 break
@@ -169,6 +353,8 @@ class Sweep1D:
             # Print progress
             print(f'Finished {reps_done} out of {self.reps} sweeps.')
 
+        self.log.info(self.timing.report())
+
     def stop(self):
         """ Terminates the sweeper immediately """
 
@@ -240,6 +426,12 @@ class Sweep1D:
                 date_dir=date_dir
             )
 
+    def _init_stores(self):
+        """ Creates empty data stores for a new sweep """
+
+        self.store_fwd = SweepStore(self.pts, reps=self.reps)
+        self.store_bwd = SweepStore(self.pts, reps=self.reps)
+
     def _generate_x_axis(self, backward=False):
         """ Generates an x-axis based on the type of sweep
 
@@ -306,6 +498,124 @@ class Sweep1D:
             self.iplot_bwd.show()
             self.hplot_bwd.show()
 
+    def _sweep(self, sweep_points, backward=False):
+        """ Runs the experiment for all points of a single scan
+
+        :param sweep_points: (np.array) parameter values to scan over
+        :param backward: (bool) whether or not backward or forward
+        """
+
+        if self.pipelined and self.gui is None:
+            self._sweep_pipelined(sweep_points, backward)
+            return
+
+        for x_value in sweep_points:
+            if self.stop_flag:
+                break
+            self._run_and_plot(x_value, backward=backward)
+
+    def _sweep_pipelined(self, sweep_points, backward=False):
+        """ Runs a scan, acquiring the next point while processing the current one
+
+        Setting and acquiring run in worker threads, processing runs in the
+        calling thread.
+
+        :param sweep_points: (np.array) parameter values to scan over
+        :param backward: (bool) whether or not backward or forward
+        """
+
+        overlap_set = self.overlap_set and self.set_parameter is not None
+        acquire_pool = ThreadPoolExecutor(max_workers=1)
+        set_pool = ThreadPoolExecutor(max_workers=1) if overlap_set else None
+
+        def acquire(x_value, set_future, started):
+            if set_future is not None:
+                set_future.result()
+            started.set()
+            return self._acquire_point(x_value, set_parameter=set_future is None)
+
+        # (x value, future of the acquisition, event set when the acquisition started)
+        pending = None
+        try:
+            for x_value in itertools.chain(sweep_points, [None]):
+                if self.stop_flag:
+                    break
+
+                # Start acquiring the next point
+                next_point = None
+                if x_value is not None:
+                    set_future = None
+                    if overlap_set:
+
+                        # The current point must have started before its parameter is changed
+                        if pending is not None:
+                            pending[2].wait()
+                        set_future = set_pool.submit(self._timed, 'set', self.set_parameter, x_value)
+
+                    started = threading.Event()
+                    next_point = (x_value, acquire_pool.submit(acquire, x_value, set_future, started), started)
+
+                # Process the current point in the meantime
+                if pending is not None:
+                    self._process_pending(pending, backward)
+                pending = next_point
+
+            # Process a point which was already started before stopping
+            if pending is not None:
+                self._process_pending(pending, backward)
+
+        finally:
+            acquire_pool.shutdown(wait=True)
+            if set_pool is not None:
+                set_pool.shutdown(wait=True)
+
+    def _process_pending(self, pending, backward):
+        """ Waits for a point acquired in the background and processes it
+
+        :param pending: (tuple) x value, future and started event of the point
+        :param backward: (bool) whether or not backward or forward
+        """
+
+        x_value, future, _ = pending
+        start_time = time.perf_counter()
+        y_value = future.result()
+        self.timing.record('wait', time.perf_counter() - start_time)
+        self._timed('process', self._process_point, x_value, y_value, backward)
+
+    def _timed(self, stage, method, *args, **kwargs):
+        """ Calls method and records its duration for a stage
+
+        :param stage: (str) name of the stage
+        :param method: (callable) method to call
+        :return: return value of method
+        """
+
+        start_time = time.perf_counter()
+        result = method(*args, **kwargs)
+        self.timing.record(stage, time.perf_counter() - start_time)
+        return result
+
+    def _acquire_point(self, x_value, set_parameter=True):
+        """ Sets the parameter (if configured) and acquires a point
+
+        :param x_value: (double) experiment parameter
+        :param set_parameter: (bool) whether to set the parameter first
+        :return: measured value
+        """
+
+        if set_parameter and self.set_parameter is not None:
+            self._timed('set', self.set_parameter, x_value)
+        return self._timed('acquire', self._acquire, x_value)
+
+    def _acquire(self, x_value):
+        """ Runs the experiment for an x value
+
+        :param x_value: (double) experiment parameter
+        :return: measured value
+        """
+
+        return self.run_once(x_value)
+
     def _run_and_plot(self, x_value, backward=False):
         """ Runs the experiment for an x value and adds to plot
 
@@ -313,10 +623,22 @@ class Sweep1D:
         :param backward: (bool) whether or not backward or forward
         """
 
-        y_value = self.run_once(x_value)
+        y_value = self._acquire_point(x_value)
+        self._timed('process', self._process_point, x_value, y_value, backward)
+
+    def _process_point(self, x_value, y_value, backward=False):
+        """ Stores and plots a measured point
+
+        :param x_value: (double) experiment parameter
+        :param y_value: (double) measured value
+        :param backward: (bool) whether or not backward or forward
+        """
+
         if backward:
+            self.store_bwd.add_point(y_value)
             self.iplot_bwd.append_data(x_ar=x_value, y_ar=y_value, ind=0)
         else:
+            self.store_fwd.add_point(y_value)
             self.iplot_fwd.append_data(x_ar=x_value, y_ar=y_value, ind=0)
 
     def _update_hmaps(self, reps_done):
@@ -328,21 +650,23 @@ class Sweep1D:
         if reps_done == 1:
             self.hplot_fwd.set_data(
                 y_ar=np.array([1]),
-                z_ar=[self.iplot_fwd._y_ar]
+                z_ar=[self.store_fwd.trace]
             )
             if self.sweep_type != 'sawtooth':
                 self.hplot_bwd.set_data(
                     y_ar=np.array([1]),
-                    z_ar=[self.iplot_bwd._y_ar]
+                    z_ar=[self.store_bwd.trace]
                 )
         else:
-            self.hplot_fwd.append_row(y_val=reps_done, z_ar=self.iplot_fwd._fig.data[0].y)
+            self.hplot_fwd.append_row(y_val=reps_done, z_ar=self.store_fwd.trace)
             if self.sweep_type != 'sawtooth':
-                self.hplot_bwd.append_row(y_val=reps_done, z_ar=self.iplot_bwd._fig.data[0].y)
+                self.hplot_bwd.append_row(y_val=reps_done, z_ar=self.store_bwd.trace)
 
     def _reset_plots(self):
         """ Resets single scan traces """
 
+        self.store_fwd.new_rep()
+        self.store_bwd.new_rep()
         self.iplot_fwd.set_data(x_ar=np.array([]), y_ar=np.array([]))
         if self.sweep_type != 'sawtooth':
             self.iplot_bwd.set_data(x_ar=np.array([]), y_ar=np.array([]))
@@ -353,35 +677,18 @@ class Sweep1D:
         :param reps_done: (int) number of repetitions completed
         """
 
-        if reps_done == 1:
-            self.iplot_fwd.set_data(
-                x_ar=np.linspace(self.min, self.max, self.pts),
-                y_ar=self.iplot_fwd._fig.data[0].y,
-                ind=1
-            )
-            if self.sweep_type != 'sawtooth':
-                self.iplot_bwd.set_data(
-                    x_ar=np.linspace(self.max, self.min, self.pts),
-                    y_ar=self.iplot_bwd._fig.data[0].y,
-                    ind=1
-                )
-
-        else:
-            self.iplot_fwd.set_data(
-                x_ar=np.linspace(self.min, self.max, self.pts),
-                y_ar=((self.iplot_fwd._fig.data[1].y * (reps_done - 1) / reps_done)
-                      + self.iplot_fwd._fig.data[0].y / reps_done),
+        self.iplot_fwd.set_data(
+            x_ar=np.linspace(self.min, self.max, self.pts),
+            y_ar=self.store_fwd.average,
+            ind=1
+        )
+        if self.sweep_type != 'sawtooth':
+            self.iplot_bwd.set_data(
+                x_ar=np.linspace(self.max, self.min, self.pts),
+                y_ar=self.store_bwd.average,
                 ind=1
             )
 
-            if self.sweep_type != 'sawtooth':
-                self.iplot_bwd.set_data(
-                    x_ar=np.linspace(self.max, self.min, self.pts),
-                    y_ar=((self.iplot_bwd._fig.data[1].y * (reps_done - 1) / reps_done)
-                          + self.iplot_bwd._fig.data[0].y / reps_done),
-                    ind=1
-                )
-
 
 class MultiChSweep1D(Sweep1D):
 
@@ -395,6 +702,13 @@ class MultiChSweep1D(Sweep1D):
         super().__init__(logger, sweep_type=sweep_type)
         self.channels = channels
 
+    def _init_stores(self):
+        """ Creates empty data stores for a new sweep, holding all channels """
+
+        channels = 1 if self.channels is None else len(self.channels)
+        self.store_fwd = SweepStore(self.pts, reps=self.reps, channels=channels)
+        self.store_bwd = SweepStore(self.pts, reps=self.reps, channels=channels)
+
     def save(self, filename=None, directory=None, date_dir=False):
         """ Saves the dataset
 
@@ -502,19 +816,25 @@ class MultiChSweep1D(Sweep1D):
     def _reset_plots(self):
         """ Resets single scan traces """
 
+        self.store_fwd.new_rep()
+        self.store_bwd.new_rep()
         for index, plot in enumerate(self.iplot_fwd):
             plot.set_data(x_ar=np.array([]), y_ar=np.array([]))
             if self.sweep_type != 'sawtooth':
                 self.iplot_bwd[index].set_data(x_ar=np.array([]), y_ar=np.array([]))
 
-    def _run_and_plot(self, x_value, backward=False):
-        """ Runs the experiment for an x value and adds to plot
+    def _process_point(self, x_value, y_values, backward=False):
+        """ Stores and plots a measured point
 
         :param x_value: (double) experiment parameter
+        :param y_values: (list) measured value of each channel
         :param backward: (bool) whether or not backward or forward
         """
 
-        y_values = self.run_once(x_value)
+        if backward:
+            self.store_bwd.add_point(y_values)
+        else:
+            self.store_fwd.add_point(y_values)
         for index, y_value in enumerate(y_values):
             if backward:
                 self.iplot_bwd[index].append_data(x_ar=x_value, y_ar=y_value, ind=0)
@@ -532,22 +852,22 @@ class MultiChSweep1D(Sweep1D):
             if reps_done == 1:
                 self.hplot_fwd[index].set_data(
                     y_ar=np.array([1]),
-                    z_ar=[fwd_plot._y_ar]
+                    z_ar=[self.store_fwd.trace[:, index]]
                 )
                 if self.sweep_type != 'sawtooth':
                     self.hplot_bwd[index].set_data(
                         y_ar=np.array([1]),
-                        z_ar=[self.iplot_bwd[index]._y_ar]
+                        z_ar=[self.store_bwd.trace[:, index]]
                     )
             else:
                 self.hplot_fwd[index].append_row(
                     y_val=reps_done,
-                    z_ar=fwd_plot._fig.data[0].y
+                    z_ar=self.store_fwd.trace[:, index]
                 )
                 if self.sweep_type != 'sawtooth':
                     self.hplot_bwd[index].append_row(
                         y_val=reps_done,
-                        z_ar=self.iplot_bwd[index]._fig.data[0].y
+                        z_ar=self.store_bwd.trace[:, index]
                     )
 
     def _update_integrated(self, reps_done):
@@ -558,31 +878,14 @@ class MultiChSweep1D(Sweep1D):
 
         for index, fwd_plot in enumerate(self.iplot_fwd):
 
-            if reps_done == 1:
-                fwd_plot.set_data(
-                    x_ar=np.linspace(self.min, self.max, self.pts),
-                    y_ar=fwd_plot._fig.data[0].y,
-                    ind=1
-                )
-                if self.sweep_type != 'sawtooth':
-                    self.iplot_bwd[index].set_data(
-                        x_ar=np.linspace(self.max, self.min, self.pts),
-                        y_ar=self.iplot_bwd[index]._fig.data[0].y,
-                        ind=1
-                    )
-
-            else:
-                fwd_plot.set_data(
-                    x_ar=np.linspace(self.min, self.max, self.pts),
-                    y_ar=((fwd_plot._fig.data[1].y * (reps_done - 1) / reps_done)
-                          + fwd_plot._fig.data[0].y / reps_done),
+            fwd_plot.set_data(
+                x_ar=np.linspace(self.min, self.max, self.pts),
+                y_ar=self.store_fwd.average[:, index],
+                ind=1
+            )
+            if self.sweep_type != 'sawtooth':
+                self.iplot_bwd[index].set_data(
+                    x_ar=np.linspace(self.max, self.min, self.pts),
+                    y_ar=self.store_bwd.average[:, index],
                     ind=1
                 )
-
-                if self.sweep_type != 'sawtooth':
-                    self.iplot_bwd[index].set_data(
-                        x_ar=np.linspace(self.max, self.min, self.pts),
-                        y_ar=((self.iplot_bwd[index]._fig.data[1].y * (reps_done - 1) / reps_done)
-                              + self.iplot_bwd[index]._fig.data[0].y / reps_done),
-                        ind=1
-                    )
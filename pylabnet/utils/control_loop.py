@@ -0,0 +1,184 @@
+""" Fixed-rate control loop running in a background thread
+
+Feedback loops (e.g. wavemeter locks) that run inside a GUI loop are slowed
+down by rendering and event processing, and their update rate fluctuates with
+the GUI load. ControlLoop calls a step function at a fixed rate in a dedicated
+thread instead:
+
+ - Iterations are scheduled at absolute times (start + n / rate), such that
+   timing errors do not accumulate.
+ - If a step takes longer than the period, the missed iterations are skipped
+   (counted as overruns) instead of being executed in a burst.
+ - The lateness of each iteration with respect to its scheduled time (the
+   loop jitter) and the duration of each step are recorded, see stats().
+
+Data shared with other threads (e.g. the GUI) should be protected with the lock
+passed to the loop, which is held during every step.
+"""
+
+import threading
+import time
+import numpy as np
+
+from pylabnet.utils.logging.logger import LogHandler
+from pylabnet.utils.ring_buffer import RingBuffer
+
+
+class ControlLoop:
+    """ Calls a function at a fixed rate in a background thread """
+
+    def __init__(self, step, rate, lock=None, logger=None, name='ControlLoop',
+                 history=1000, report_interval=300):
+        """ Instantiates the loop, which is started with start()
+
+        :param step: (callable) function to call in every iteration
+        :param rate: (float) loop rate in Hz
+        :param lock: (threading.Lock) lock held during every step, a new one
+            is created if not given
+        :param logger: (LogClient) instance of LogClient for error logging
+        :param name: (str) name of the thread, used in log messages
+        :param history: (int) number of iterations used for the timing statistics
+        :param report_interval: (float) interval in s in which the timing
+            statistics are logged, None to disable
+        """
+
+        self.step = step
+        self.rate = rate
+        self.lock = threading.Lock() if lock is None else lock
+        self.log = LogHandler(logger)
+        self.name = name
+        self.report_interval = report_interval
+
+        self.iterations = 0
+        self.overruns = 0
+        self._jitter = RingBuffer(capacity=history, dtype=float)
+        self._step_time = RingBuffer(capacity=history, dtype=float)
+        self._stats_lock = threading.Lock()
+
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        self._last_error = None
+
+    @property
+    def period(self):
+        return 1 / self.rate
+
+    def is_alive(self):
+        """ Returns whether the loop thread is running """
+
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """ Starts the loop thread """
+
+        if self.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        self.log.info(f'{self.name} started at {self.rate} Hz')
+
+    def stop(self, timeout=None):
+        """ Stops the loop after the current step
+
+        :param timeout: (float) maximal time in s to wait for the thread
+        """
+
+        self._stop_event.set()
+        self._running.set()
+        # The loop can also be stopped from within a step
+        if self.is_alive() and threading.current_thread() is not self._thread:
+            self._thread.join(timeout)
+        self.log.info(self.report())
+
+    def pause(self):
+        """ Pauses the loop after the current step """
+
+        self._running.clear()
+
+    def resume(self):
+        """ Resumes a paused loop """
+
+        self._running.set()
+
+    def stats(self):
+        """ Returns timing statistics of the recent iterations
+
+        :return: (dict) with the number of 'iterations' and 'overruns', the
+            'rate' in Hz and the mean, standard deviation and maximum of the
+            'jitter' and the 'step' duration in s
+        """
+
+        with self._stats_lock:
+            jitter = self._jitter.view().copy()
+            step_time = self._step_time.view().copy()
+
+        stats = dict(iterations=self.iterations, overruns=self.overruns, rate=self.rate)
+        for key, values in (('jitter', jitter), ('step', step_time)):
+            if len(values) > 0:
+                stats[f'{key}_mean'] = float(np.mean(values))
+                stats[f'{key}_std'] = float(np.std(values))
+                stats[f'{key}_max'] = float(np.max(values))
+            else:
+                stats[f'{key}_mean'] = stats[f'{key}_std'] = stats[f'{key}_max'] = 0.0
+
+        return stats
+
+    def report(self):
+        """ Returns a human-readable summary of stats() """
+
+        stats = self.stats()
+        return (
+            f'{self.name}: {stats["iterations"]} iterations at {stats["rate"]} Hz, '
+            f'{stats["overruns"]} overruns, jitter {stats["jitter_mean"] * 1e3:.3f} '
+            f'+/- {stats["jitter_std"] * 1e3:.3f} ms (max {stats["jitter_max"] * 1e3:.3f} ms), '
+            f'step {stats["step_mean"] * 1e3:.3f} ms (max {stats["step_max"] * 1e3:.3f} ms)'
+        )
+
+    def _run(self):
+        """ Loop executed in the thread """
+
+        next_time = time.perf_counter()
+        next_report = time.monotonic() + self.report_interval if self.report_interval else None
+
+        while not self._stop_event.is_set():
+
+            if not self._running.is_set():
+                self._running.wait()
+                next_time = time.perf_counter()
+                continue
+
+            start_time = time.perf_counter()
+            jitter = start_time - next_time
+
+            try:
+                with self.lock:
+                    self.step()
+                self._last_error = None
+
+            # Keep the loop running, but only log repeated errors once
+            except Exception as error:
+                if repr(error) != self._last_error:
+                    self.log.warn(f'{self.name} step failed: {error}')
+                    self._last_error = repr(error)
+
+            end_time = time.perf_counter()
+            with self._stats_lock:
+                self._jitter.append(jitter)
+                self._step_time.append(end_time - start_time)
+            self.iterations += 1
+
+            next_time += self.period
+            if end_time > next_time:
+                missed = int((end_time - next_time) / self.period) + 1
+                self.overruns += missed
+                next_time += missed * self.period
+
+            if next_report is not None and time.monotonic() > next_report:
+                self.log.info(self.report())
+                next_report += self.report_interval
+
+            self._stop_event.wait(max(next_time - time.perf_counter(), 0))
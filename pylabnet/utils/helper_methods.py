@@ -9,6 +9,7 @@ import copy
 import numpy as np
 import socket
 import subprocess
+import threading
 import paramiko
 import platform
 import decouple
@@ -753,7 +754,93 @@ def find_client(clients, settings, client_type, client_config=None, logger=None)
         return found_clients[0]
 
 
-def launch_device_server(server, dev_config, log_ip, log_port, server_port, debug=False, logger=None):
+class SSHConnectionPool:
+    """ Keeps one SSH connection per remote host, such that launching several
+    servers on a host only connects once. Can be used from several threads,
+    connections to different hosts are made concurrently. """
+
+    def __init__(self):
+
+        self._connections = {}
+        self._host_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, host_ip, username, logger=None):
+        """ Returns an open SSH connection, connecting if needed
+
+        :param host_ip: (str) IP address of the host
+        :param username: (str) user name on the host
+        :param logger: (LogHandler)
+        :return: (paramiko.SSHClient) connection
+        """
+
+        key = (host_ip, username)
+        with self._lock:
+            host_lock = self._host_locks.setdefault(key, threading.Lock())
+
+        # Only held by threads connecting to the same host
+        with host_lock:
+            with self._lock:
+                ssh = self._connections.get(key)
+            transport = None if ssh is None else ssh.get_transport()
+            if transport is not None and transport.is_active():
+                return ssh
+
+            ssh = paramiko.SSHClient()
+            ssh.load_system_host_keys()
+            try:
+                ssh.connect(host_ip, username=username, password=decouple.config('LOCALHOST_PW'))
+                msg_str = f'Successfully connected via SSH to {username}@{host_ip}'
+                if logger is None:
+                    print(msg_str)
+                else:
+                    logger.info(msg_str)
+                with self._lock:
+                    self._connections[key] = ssh
+            except TimeoutError:
+                msg_str = f'Failed to setup SSH connection to {username}@{host_ip}'
+                if logger is None:
+                    print(msg_str)
+                else:
+                    logger.error(msg_str)
+            return ssh
+
+    def close(self):
+        """ Closes all connections """
+
+        with self._lock:
+            connections, self._connections = self._connections, {}
+        for ssh in connections.values():
+            ssh.close()
+
+
+def wait_for_server(connect, timeout=30, interval=0.05, max_interval=1):
+    """ Calls connect until the server accepts the connection
+
+    Retries with increasing intervals while the connection is refused, i.e.
+    while the server is still starting.
+
+    :param connect: (callable) connects to the server, raising ConnectionRefusedError
+        while the server is not ready
+    :param timeout: (float) maximal time to wait in s
+    :param interval: (float) initial time between attempts in s
+    :param max_interval: (float) maximal time between attempts in s
+    :return: result of connect
+    """
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return connect()
+        except ConnectionRefusedError:
+            if time.monotonic() + interval > deadline:
+                raise
+            time.sleep(interval)
+            interval = min(2 * interval, max_interval)
+
+
+def launch_device_server(server, dev_config, log_ip, log_port, server_port, debug=False, logger=None,
+                         ssh_pool=None):
     """ Launches a new device server
 
     :param server: (str) name of the server. Should be the directory in which the
@@ -766,6 +853,8 @@ def launch_device_server(server, dev_config, log_ip, log_port, server_port, debu
     :param server_port: (int) port number of server to use
     :param debug: (bool) whether or not to debug the server launching
     :param logger: (LogHandler)
+    :param ssh_pool: (SSHConnectionPool) pool of SSH connections to reuse,
+        a new connection is made if not given
     """
     # First load device config into dict
     config_dict = load_device_config(server, dev_config)
@@ -788,21 +877,9 @@ def launch_device_server(server, dev_config, log_ip, log_port, server_port, debu
         host_ip = ssh_params['ip']
 
         # SSH in
-        ssh = paramiko.SSHClient()
-        ssh.load_system_host_keys()
-        try:
-            ssh.connect(host_ip, username=hostname, password=decouple.config('LOCALHOST_PW'))
-            msg_str = f'Successfully connected via SSH to {hostname}@{host_ip}'
-            if logger is None:
-                print(msg_str)
-            else:
-                logger.info(msg_str)
-        except TimeoutError:
-            msg_str = f'Failed to setup SSH connection to {hostname}@{host_ip}'
-            if logger is None:
-                print(msg_str)
-            else:
-                logger.error(msg_str)
+        if ssh_pool is None:
+            ssh_pool = SSHConnectionPool()
+        ssh = ssh_pool.get(host_ip, hostname, logger=logger)
 
         # Set command arguments
         python_path = ssh_params['python_path']
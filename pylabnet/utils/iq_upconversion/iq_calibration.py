@@ -1,4 +1,6 @@
+import bisect
 import csv
+import os
 import time
 import numpy as np
 from pylabnet.utils.iq_upconversion.optimizer import IQOptimizer, IQOptimizer_GD
@@ -18,10 +20,13 @@ from pylabnet.utils.logging.logger import LogService
 from pylabnet.network.core.generic_server import GenericServer
 from pylabnet.utils.iq_upconversion.optimizer import IQOptimizer
 from pylabnet.network.client_server import HMC_T2220
-from scipy import interpolate
 from pylabnet.network.client_server.agilent_83732b import Client
 
 
+# Order of the calibrated parameters in the values of the interpolator
+CAL_PARAMETERS = ['q', 'phase', 'dc_i', 'dc_q', 'H-1', 'H0', 'H1', 'H2', 'H3']
+
+
 class IQ_Calibration():
 
     def __init__(self, log=None):
@@ -55,19 +60,109 @@ class IQ_Calibration():
 
         #Also loading the harmoincs like that
 
+        self._build_grid()
+
+    def _build_grid(self):
+        '''Stores all calibrated parameters on a common (LO, IF) grid, such that
+        queries do not need to construct interpolators from the dataframes'''
+
+        self._lo = np.array(self.q.index, dtype=float)
+        self._if = np.array(self.q.columns.get_level_values(1), dtype=float)
+
+        grids = [self.q.values, self.phase.values, self.dc_i.values, self.dc_q.values]
+        grids += [self.harms.iloc[:, i].unstack().values for i in range(5)]
+
+        # Values have shape (LO, IF, parameter)
+        self._grid_values = np.stack(grids, axis=-1).astype(float)
+
+    def interpolate(self, if_freq, lo_freq, parameters=CAL_PARAMETERS):
+        '''Interpolates calibrated parameters at (IF, LO) frequencies
+
+        Interpolation is bilinear on the calibration grid (as
+        scipy.interpolate.RegularGridInterpolator), frequencies outside the
+        calibrated range are clipped to its boundary. The grid cells are looked
+        up directly, which avoids the per-call overhead of scipy interpolators.
+
+        :param if_freq: (float or array) IF frequencies
+        :param lo_freq: (float or array) LO frequencies, broadcast with if_freq
+        :param parameters: (list) names of parameters, see CAL_PARAMETERS
+
+        :return: (tuple) array of values for each parameter, with the broadcast
+            shape of the frequencies (shape (1,) for scalar frequencies)
+        '''
+
+        if (not self.initialized):
+            raise ValueError("No calibration loaded!")
+
+        values = self._grid_values
+
+        # Scalar lookups, e.g. when setting a single frequency, avoid array overhead
+        if np.ndim(if_freq) == 0 and np.ndim(lo_freq) == 0:
+            i_lo, w_lo = _grid_cell_scalar(self._lo, float(lo_freq))
+            i_if, w_if = _grid_cell_scalar(self._if, float(if_freq))
+            result = (
+                ((1 - w_lo) * (1 - w_if)) * values[i_lo, i_if]
+                + ((1 - w_lo) * w_if) * values[i_lo, i_if + 1]
+                + (w_lo * (1 - w_if)) * values[i_lo + 1, i_if]
+                + (w_lo * w_if) * values[i_lo + 1, i_if + 1]
+            )[np.newaxis]
+
+        else:
+            if_freq, lo_freq = np.broadcast_arrays(
+                np.asarray(if_freq, dtype=float),
+                np.asarray(lo_freq, dtype=float)
+            )
+            i_lo, w_lo = _grid_cell(self._lo, lo_freq)
+            i_if, w_if = _grid_cell(self._if, if_freq)
+            w_lo = w_lo[..., np.newaxis]
+            w_if = w_if[..., np.newaxis]
+            result = (
+                (1 - w_lo) * (1 - w_if) * values[i_lo, i_if]
+                + (1 - w_lo) * w_if * values[i_lo, i_if + 1]
+                + w_lo * (1 - w_if) * values[i_lo + 1, i_if]
+                + w_lo * w_if * values[i_lo + 1, i_if + 1]
+            )
+
+        return tuple(result[..., CAL_PARAMETERS.index(parameter)] for parameter in parameters)
+
     def run_calibration(self, filename, mw_source, hd, sa, lo_low, lo_high, lo_num_points, if_low, if_high, if_num_points, lo_power, if_volts,
                         max_iterations=3, phase_window=50, q_window=0.34, dc_i_window=0.2, dc_q_window=0.2, plot_traces=False,
-                        awg_delay_time=0.01, averages=4, min_rounds=1):
+                        awg_delay_time=0.01, averages=4, min_rounds=1, method='grid', max_evaluations=60,
+                        resume=False, warm_start=False, warm_start_window=0.5):
+        '''Optimizes the IQ parameters on a grid of LO and IF frequencies and
+        saves them to filename
+
+        Every finished (LO, IF) point is appended to the file immediately, such
+        that an interrupted calibration can be continued with resume=True.
+
+        :param method: (str) optimization method of the IQOptimizer, 'grid' or
+            'nelder-mead'
+        :param max_evaluations: (int) maximal number of evaluations per
+            iteration of the 'nelder-mead' search
+        :param resume: (bool) whether to continue the calibration in an
+            existing file, skipping the points it already contains
+        :param warm_start: (bool) whether to start the optimization of each
+            point from the optimum of the nearest finished point
+        :param warm_start_window: (float) factor applied to the scan windows
+            when warm starting
+        '''
+
         self.initialized = True
 
-        #Initial setup of the file, including header information
-        with open(filename, 'x', newline='') as cal_file:
-            csv_writer = csv.writer(cal_file, delimiter=',',
-                                    quotechar='|', quoting=csv.QUOTE_MINIMAL)
-            csv_writer.writerow(['LO_Power', str(lo_power)])
-            csv_writer.writerow(['IF_volt', str(if_volts)])
-            csv_writer.writerow(['Note: '])
-            csv_writer.writerow(['LO_F', 'IF_F', 'q', 'phase', 'dc_i', 'dc_q', 'H-1', 'H0', 'H1', 'H2', 'H3'])
+        if resume and os.path.exists(filename):
+            finished = _load_checkpoint(filename, lo_power, if_volts)
+            print(f'Resuming calibration, {len(finished)} points already calibrated')
+        else:
+            finished = {}
+
+            #Initial setup of the file, including header information
+            with open(filename, 'x', newline='') as cal_file:
+                csv_writer = csv.writer(cal_file, delimiter=',',
+                                        quotechar='|', quoting=csv.QUOTE_MINIMAL)
+                csv_writer.writerow(['LO_Power', str(lo_power)])
+                csv_writer.writerow(['IF_volt', str(if_volts)])
+                csv_writer.writerow(['Note: '])
+                csv_writer.writerow(['LO_F', 'IF_F', 'q', 'phase', 'dc_i', 'dc_q', 'H-1', 'H0', 'H1', 'H2', 'H3'])
 
         #Now setting up the hardware correctly
 
@@ -85,25 +180,57 @@ class IQ_Calibration():
         #Now we are ready to begin our sweep
         lo_frequencies = np.linspace(lo_low, lo_high, lo_num_points)
         if_frequencies = np.linspace(if_low, if_high, if_num_points)
+        total_evaluations = 0
+
+        # Grid indices of the finished points, used to find warm start neighbours
+        finished_cells = {}
+        for i, j in it.product(range(lo_num_points), range(if_num_points)):
+            key = _cell_key(lo_frequencies[i], if_frequencies[j])
+            if key in finished:
+                finished_cells[(i, j)] = finished[key]
 
         for i in range(lo_num_points):
             for j in range(if_num_points):
+                if (i, j) in finished_cells:
+                    continue
+
                 lo_freq = lo_frequencies[i].item()
                 if_freq = if_frequencies[j].item()
                 print(":O: " + str(lo_freq / 1E9) + " GHz, IF: " + str(if_freq / 1E6) + " MHz")
 
+                param_guess = [90, 1, if_volts, -0.002, 0.006]
+                window_scale = 1
+                neighbour = _nearest_cell((i, j), finished_cells) if warm_start else None
+                if neighbour is not None:
+                    q, phase, dc_i, dc_q = finished_cells[neighbour]
+                    param_guess = [phase, q, if_volts, dc_i, dc_q]
+                    window_scale = warm_start_window
+
                 t1 = time.time()
-                opt = IQOptimizer(mw_source, hd, sa, lo_freq, if_freq, param_guess=([90, 1, if_volts, -0.002, 0.006]), dc_i_window=dc_i_window, dc_q_window=dc_q_window, awg_delay_time=awg_delay_time, averages=averages,
-                                  min_rounds=min_rounds, max_iterations=max_iterations, phase_window=phase_window, q_window=q_window, plot_traces=False)
+                opt = IQOptimizer(mw_source, hd, sa, lo_freq, if_freq, param_guess=param_guess,
+                                  dc_i_window=dc_i_window * window_scale, dc_q_window=dc_q_window * window_scale,
+                                  awg_delay_time=awg_delay_time, averages=averages, min_rounds=min_rounds, max_iterations=max_iterations,
+                                  phase_window=phase_window * window_scale, q_window=q_window * window_scale, plot_traces=False,
+                                  method=method, max_evaluations=max_evaluations)
                 opt.opt()
+                total_evaluations += opt.evaluations
 
                 harm = ium.get_power_at_harmonics(sa, lo_freq, if_freq, [-1, 0, 1, 2, 3])
                 with open(filename, 'a', newline='') as cal_file:
                     csv_writer = csv.writer(cal_file, delimiter=',',
                                             quotechar='|', quoting=csv.QUOTE_MINIMAL)
                     csv_writer.writerow([str(lo_freq), str(if_freq), str(opt.opt_q), str(opt.opt_phase), str(opt.dc_offset_i_opt), str(opt.dc_offset_q_opt), harm[0], harm[1], harm[2], harm[3], harm[4]])
+
+                    # Make sure the point survives a crash of the computer
+                    cal_file.flush()
+                    os.fsync(cal_file.fileno())
+
+                finished_cells[(i, j)] = (float(opt.opt_q), float(opt.opt_phase), float(opt.dc_offset_i_opt), float(opt.dc_offset_q_opt))
                 print(harm)
                 print(time.time() - t1)
+                print(f'{opt.evaluations} evaluations')
+
+        print(f'Calibration used {total_evaluations} evaluations')
 
         #Having writtent he file, load the callibration into memory now
         #We do it this way as opposed to loading the values into memory during the
@@ -173,73 +300,13 @@ class IQ_Calibration():
         self.load_calibration(filename)
 
     def get_ampl_phase(self, if_freq, lo_freq):
-        if (not self.initialized):
-            raise ValueError("No calibration loaded!")
-        q_vals = self.q.values
-        q_lo = np.array(self.q.index)
-        q_if = np.array(self.q.columns.get_level_values(1))
-        f = interpolate.interp2d(q_if, q_lo, q_vals)
-        q_ret = f(if_freq, lo_freq)
-
-        phase_vals = self.phase.values
-        phase_lo = np.array(self.phase.index)
-        phase_if = np.array(self.phase.columns.get_level_values(1))
-        f = interpolate.interp2d(phase_if, phase_lo, phase_vals)
-        phase_ret = f(if_freq, lo_freq)
-
-        return q_ret, phase_ret
+        return self.interpolate(if_freq, lo_freq, ['q', 'phase'])
 
     def get_dc_offsets(self, if_freq, lo_freq):
-        if (not self.initialized):
-            raise ValueError("No calibration loaded!")
-        dc_i_vals = self.dc_i.values
-        dc_i_lo = np.array(self.dc_i.index)
-        dc_i_if = np.array(self.dc_i.columns.get_level_values(1))
-        f = interpolate.interp2d(dc_i_if, dc_i_lo, dc_i_vals)
-        dc_i_ret = f(if_freq, lo_freq)
-
-        dc_q_vals = self.dc_q.values
-        dc_q_lo = np.array(self.dc_q.index)
-        dc_q_if = np.array(self.dc_q.columns.get_level_values(1))
-        f = interpolate.interp2d(dc_q_if, dc_q_lo, dc_q_vals)
-        dc_q_ret = f(if_freq, lo_freq)
-
-        return dc_i_ret, dc_q_ret
+        return self.interpolate(if_freq, lo_freq, ['dc_i', 'dc_q'])
 
     def get_harmonic_powers(self, if_freq, lo_freq):
-
-        if (not self.initialized):
-            raise ValueError("No calibration loaded!")
-
-        Hm1 = self.harms.iloc[:, 0].unstack()
-        LO = np.array(Hm1.index)
-        IF = np.array(Hm1.columns.get_level_values(0))
-
-        h_m1 = Hm1.values
-        f = interpolate.interp2d(IF, LO, h_m1)
-        h_m1_val = f(if_freq, lo_freq)
-
-        H0 = self.harms.iloc[:, 1].unstack()
-        h_0 = H0.values
-        f = interpolate.interp2d(IF, LO, h_0)
-        h_0_val = f(if_freq, lo_freq)
-
-        H1 = self.harms.iloc[:, 2].unstack()
-        h_1 = H1.values
-        f = interpolate.interp2d(IF, LO, h_1)
-        h_1_val = f(if_freq, lo_freq)
-
-        H2 = self.harms.iloc[:, 3].unstack()
-        h_2 = H2.values
-        f = interpolate.interp2d(IF, LO, h_2)
-        h_2_val = f(if_freq, lo_freq)
-
-        H3 = self.harms.iloc[:, 4].unstack()
-        h_3 = H3.values
-        f = interpolate.interp2d(IF, LO, h_3)
-        h_3_val = f(if_freq, lo_freq)
-
-        return h_m1_val, h_0_val, h_1_val, h_2_val, h_3_val
+        return self.interpolate(if_freq, lo_freq, ['H-1', 'H0', 'H1', 'H2', 'H3'])
 
     def set_optimal_hdawg_values(self, hd, if_freq, lo_freq, HDAWG_ports=[3, 4], oscillator=2):
         '''Sets the optimal sine output values on the hdawg for the given IF
@@ -356,8 +423,8 @@ class IQ_Calibration():
         if (not self.initialized):
             raise ValueError("No calibration loaded!")
 
-        LO = np.array(self.phase.index)
-        IF = np.array(self.phase.columns.get_level_values(1))
+        LO = self._lo
+        IF = self._if
 
         default_if = 2e6
         default_lo = 12e9
@@ -372,17 +439,7 @@ class IQ_Calibration():
 
         if_f = np.linspace(LO[0], LO[-1], 100)
 
-        fidelity = []
-
-        for iff in if_f:
-            lof = freq - iff
-            if lof > LO[0] and lof < LO[-1]:
-                hm1, h0, h1, h2, h3 = self.get_harmonic_powers(iff, lof)
-                fidelity.append(self.get_fidelity(hm1, h0, h1, h2, h3, iff))
-            else:
-                fidelity.append(0)
-
-        ii = np.argmax(fidelity)
+        ii = np.argmax(self._get_fidelities(freq, if_f))
 
         mw_source.set_freq(freq - if_f[ii])
 
@@ -397,8 +454,8 @@ class IQ_Calibration():
         if (not self.initialized):
             raise ValueError("No calibration loaded!")
 
-        LO = np.array(self.phase.index)
-        IF = np.array(self.phase.columns.get_level_values(1))
+        LO = self._lo
+        IF = self._if
 
         default_if = 200e6
         default_lo = 12e9
@@ -418,26 +475,101 @@ class IQ_Calibration():
 
         if_f = np.linspace(IF[0], IF[-1], 100)
 
-        fidelity = []
-
-        for iff in if_f:
-            lof = freq - iff
-            if LO[0] < lof < LO[-1]:
-                hm1, h0, h1, h2, h3 = self.get_harmonic_powers(iff, lof)
-                fidelity.append(self.get_fidelity(hm1, h0, h1, h2, h3, iff))
-            else:
-                fidelity.append(0)
-
-        ii = np.argmax(fidelity)
+        ii = np.argmax(self._get_fidelities(freq, if_f))
 
         phase_opt, amp_i_opt, amp_q_opt, dc_i_opt, dc_q_opt = self.get_optimal_hdawg_values(if_f[ii], freq - if_f[ii])
 
         return if_f[ii], freq - if_f[ii], phase_opt, amp_i_opt, amp_q_opt, dc_i_opt, dc_q_opt
 
+    def _get_fidelities(self, freq, if_f):
+        '''Returns the fidelity of each IF frequency for an output frequency,
+        evaluated in a single interpolation. IF frequencies whose LO frequency
+        lies outside of the calibration have fidelity 0.'''
+
+        LO = self._lo
+        lof = freq - if_f
+        valid = (LO[0] < lof) & (lof < LO[-1])
+
+        fidelity = np.zeros(len(if_f))
+        if np.any(valid):
+            hm1, h0, h1, h2, h3 = self.get_harmonic_powers(if_f[valid], lof[valid])
+            fidelity[valid] = self.get_fidelity(hm1, h0, h1, h2, h3, if_f[valid])
+
+        return fidelity
+
     def get_fidelity(self, hm1, h0, h1, h2, h3, iff):
         return 1 - 10**((hm1 - h1) / 10) / (2 * iff) - 10**((h0 - h1) / 10) / (iff) - 10**((h2 - h1) / 10) / (iff) - 10**((h3 - h1) / 10) / (2 * iff)
 
 
+def _grid_cell(grid, values):
+    '''Returns the index of the grid cell containing each value and the
+    relative position within the cell, values outside the grid are clipped'''
+
+    values = np.minimum(np.maximum(values, grid[0]), grid[-1])
+    index = np.minimum(np.searchsorted(grid, values, side='right') - 1, len(grid) - 2)
+    weight = (values - grid[index]) / (grid[index + 1] - grid[index])
+    return index, weight
+
+
+def _grid_cell_scalar(grid, value):
+    '''Same as _grid_cell() for a single float value'''
+
+    value = min(max(value, grid[0]), grid[-1])
+    index = min(bisect.bisect_right(grid, value) - 1, len(grid) - 2)
+    weight = (value - grid[index]) / (grid[index + 1] - grid[index])
+    return index, weight
+
+
+def _cell_key(lo_freq, if_freq):
+    '''Identifies an (LO, IF) point independent of rounding errors'''
+
+    return (int(round(float(lo_freq))), int(round(float(if_freq))))
+
+
+def _load_checkpoint(filename, lo_power, if_volts):
+    '''Reads the points of an interrupted calibration
+
+    :return: (dict) (LO, IF) key: (q, phase, dc_i, dc_q) of the finished points
+    '''
+
+    # Drop a row that was only partially written, since new rows are appended to the file
+    with open(filename, 'r+', newline='') as cal_file:
+        content = cal_file.read()
+        if not content.endswith('\n'):
+            cal_file.seek(0)
+            cal_file.truncate(content.rfind('\n') + 1)
+
+    finished = {}
+    with open(filename, 'r', newline='') as cal_file:
+        csv_reader = csv.reader(cal_file, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
+        file_lo_power = float(next(csv_reader)[1])
+        file_if_volts = float(next(csv_reader)[1])
+        if file_lo_power != lo_power or file_if_volts != if_volts:
+            raise ValueError(f'Cannot resume {filename}, it was calibrated with LO power {file_lo_power} '
+                             f'and IF voltage {file_if_volts}')
+
+        # Skipping over the notes and column names
+        next(csv_reader)
+        next(csv_reader)
+
+        for row in csv_reader:
+            try:
+                lo_freq, if_freq, q, phase, dc_i, dc_q = (float(value) for value in row[:6])
+            except ValueError:
+                continue
+            finished[_cell_key(lo_freq, if_freq)] = (q, phase, dc_i, dc_q)
+
+    return finished
+
+
+def _nearest_cell(cell, finished_cells):
+    '''Returns the finished grid cell closest to cell, None if there is none'''
+
+    if not finished_cells:
+        return None
+    return min(finished_cells, key=lambda other: abs(other[0] - cell[0]) + abs(other[1] - cell[1]))
+
+
 def main():
     mw_client = Client(
         host='192.168.50.104',
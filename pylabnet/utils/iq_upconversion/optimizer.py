@@ -6,10 +6,19 @@ import time
 
 import pandas as pd
 import seaborn as sns
+from scipy.optimize import minimize
 import matplotlib
 import matplotlib.pyplot as plt
 from IPython.display import clear_output, display
 
+# Optimization methods of IQOptimizer
+METHODS = ['grid', 'nelder-mead']
+
+# Convergence tolerances of the Nelder-Mead search, in units of the scan window
+# and in dB
+_NM_XATOL = 0.01
+_NM_FATOL = 0.1
+
 
 class Optimizer:
 
@@ -23,7 +32,7 @@ class IQOptimizer(Optimizer):
             self, mw_source, hd, sa, carrier, signal_freq, max_iterations=5, max_lower_sideband_pow=-58, max_carrier_pow=-58, num_points=25, cushion_param=5,
             param_guess=([60, 0.6, 0.65, -0.002, 0.006]), phase_window=44, q_window=0.34, dc_i_window=0.0135,
             dc_q_window=0.0115, plot_traces=True, awg_delay_time=0.0, averages=1, min_rounds=1, HDAWG_ports=[3, 4],
-            oscillator=2):
+            oscillator=2, method='grid', max_evaluations=60):
         """ Instantiate IQ optimizer
         :param mw_source: instance of HMC_T2220 client
         :param hd: instance of AWG client
@@ -44,8 +53,16 @@ class IQOptimizer(Optimizer):
         :q_window: size of initial amplitude imbalance scan window (unitless)
         :dc_i_window: size of initial dc i offset scan window (in V)
         :dc_q_window: size of initial dc q offset scan window (in V)
+        :kwarg method: 'grid' to scan the full num_points x num_points window in
+            every iteration, 'nelder-mead' for an adaptive simplex search which
+            needs far fewer spectrum analyzer readings
+        :kwarg max_evaluations: maximal number of evaluations per iteration of
+            the 'nelder-mead' search
         """
 
+        if method not in METHODS:
+            raise ValueError(f'Unknown optimization method {method}, use one of {METHODS}')
+
         # Configure hd settings
         # Assign oscillator 1 to sine output 2
         #hd.seti('sines/1/oscselect', 1)
@@ -122,6 +139,12 @@ class IQOptimizer(Optimizer):
         self._averages = averages
         self._min_rounds = min_rounds
 
+        self.method = method
+        self.max_evaluations = max_evaluations
+
+        # Number of parameter settings measured with the spectrum analyzer
+        self.evaluations = 0
+
     def set_markers(self):
         # Configure hd to enable outputs
         # self.hd.enable_output(0)
@@ -155,6 +178,9 @@ class IQOptimizer(Optimizer):
 
     def opt_lower_sideband(self):
 
+        if self.method != 'grid':
+            return self._opt_lower_sideband_adaptive()
+
         # Rough sweep
         self._sweep_phase_amp_imbalance()
         self._set_optimal_vals()
@@ -209,6 +235,9 @@ class IQOptimizer(Optimizer):
 
     def opt_carrier(self):
 
+        if self.method != 'grid':
+            return self._opt_carrier_adaptive()
+
         num_iterations = 0
 
         # If carrier power already below threshold, no need to optimize carrier
@@ -284,24 +313,147 @@ class IQOptimizer(Optimizer):
         self.hd.log.info('Optimized param_guess is ([' + str(self.opt_phase) + ',' + str(self.opt_q) + ',' + str(.5 * (self.amp_q_opt + self.amp_i_opt)) + ',' + str(self.dc_offset_i_opt) + ',' + str(self.dc_offset_q_opt) + '])')
         self.hd.log.info('Lower sideband power is ' + str(self.lower_sb_marker.get_power()) + ' dBm')
         self.hd.log.info('Carrier power is ' + str(self.carrier_marker.get_power()) + ' dBm')
+        self.hd.log.info(f'Optimization used {self.evaluations} evaluations')
 
-    def _sweep_phase_amp_imbalance(self):
+    def _opt_lower_sideband_adaptive(self):
 
-        for i, j in it.product(range(self.num_points), repeat=2):
+        (self.opt_phase, self.opt_q), self.opt_lower_sideband_pow, num_rounds = self._minimize(
+            self._measure_lower_sideband,
+            center=[0.5 * (self.phase_min + self.phase_max), 0.5 * (self.q_min + self.q_max)],
+            window=[self.phase_max - self.phase_min, self.q_max - self.q_min],
+            target=self.max_lower_sideband_pow
+        )
+
+        self.amp_i_opt = 2 * self.opt_q / (1 + self.opt_q) * self.a0
+        self.amp_q_opt = 2 * self.a0 / (1 + self.opt_q)
+        self._set_phase_amp_imbalance(self.opt_phase, self.opt_q)
 
-            phase = self.phases[i]
-            q = self.qs[j]
+        if self.opt_lower_sideband_pow <= self.max_lower_sideband_pow:
+            self.hd.log.info(f'Lower sideband optimization completed in {num_rounds} iterations')
+        else:
+            self.hd.log.info(f'Lower sideband optimization failed to reach threshold in {num_rounds} iterations')
 
-            # Calculate i and q amplitudes from q and a0
-            amp_i = 2 * q / (1 + q) * self.a0
-            amp_q = 2 * self.a0 / (1 + q)
+        time.sleep(1)
+        self.hd.log.info('Lower sideband power is ' + str(self.lower_sb_marker.get_power()) + ' dBm')
 
-            # Set i and q amplitudes
-            self.hd.setd('sines/{}/amplitudes/{}'.format(self.HDAWG_ports[0] - 1, np.mod(self.HDAWG_ports[0] - 1, 2)), amp_i)
-            self.hd.setd('sines/{}/amplitudes/{}'.format(self.HDAWG_ports[1] - 1, np.mod(self.HDAWG_ports[1] - 1, 2)), amp_q)
+        if self.plot_traces == True:
+            self.sa.plot_trace()
+
+    def _opt_carrier_adaptive(self):
+
+        # If carrier power already below threshold, no need to optimize carrier
+        if self.carrier_marker.get_power() > (self.max_carrier_pow - 10):
+            (self.dc_offset_i_opt, self.dc_offset_q_opt), self.opt_carrier_pow, num_rounds = self._minimize(
+                self._measure_carrier,
+                center=[0.5 * (self.dc_min_i + self.dc_max_i), 0.5 * (self.dc_min_q + self.dc_max_q)],
+                window=[self.dc_max_i - self.dc_min_i, self.dc_max_q - self.dc_min_q],
+                target=self.max_carrier_pow
+            )
+            self._set_dc_offsets(self.dc_offset_i_opt, self.dc_offset_q_opt)
+
+            if self.opt_carrier_pow <= self.max_carrier_pow:
+                self.hd.log.info(f'Carrier optimization completed in {num_rounds} iterations')
+            else:
+                self.hd.log.info(f'Carrier optimization failed to reach threshold in {num_rounds} iterations')
+        else:
+            print('Skipped Carrier')
+            self.dc_offset_i_opt = self.hd.getd('sigouts/{}/offset'.format(self.HDAWG_ports[0] - 1))
+            self.dc_offset_q_opt = self.hd.getd('sigouts/{}/offset'.format(self.HDAWG_ports[1] - 1))
+
+        time.sleep(1)
+        self.hd.log.info('Carrier power is ' + str(self.carrier_marker.get_power()))
+
+        if self.plot_traces == True:
+            self.sa.plot_trace()
 
-            # Set phaseshift
-            self.hd.setd('sines/{}/phaseshift'.format(self.HDAWG_ports[0] - 1), phase)
+    def _minimize(self, measure, center, window, target):
+        """ Adaptive minimization of a measured power with Nelder-Mead
+
+        Like the grid search, the search is repeated in a window shrunk by
+        2 / cushion_param around the optimum until the power is below target
+        (after at least min_rounds) or max_iterations is reached.
+
+        :param measure: (callable) function of the parameters returning the power
+        :param center: (list) initial parameters
+        :param window: (list) size of the initial search window of each parameter
+        :param target: (float) desired upper bound of the power in dBm
+        :return: (tuple) optimal parameters, optimal power, number of rounds
+        """
+
+        best_params = np.asarray(center, dtype=float)
+        best_power = float('inf')
+        window = np.asarray(window, dtype=float)
+
+        num_rounds = 0
+        while (best_power > target or num_rounds < self._min_rounds) and num_rounds < self.max_iterations:
+
+            # Allow the spectrum analyzer to update after the jump to the new window
+            measure(*best_params)
+            time.sleep(1)
+
+            # Optimize in units of the window, starting from a simplex spanning half of it.
+            # Like the grid, the search is confined to the window.
+            offset = best_params
+            result = minimize(
+                lambda x: measure(*(offset + np.clip(x, -0.5, 0.5) * window)),
+                np.zeros(len(offset)),
+                method='Nelder-Mead',
+                options=dict(
+                    initial_simplex=np.vstack((np.zeros(len(offset)), 0.5 * np.eye(len(offset)))) - 0.25,
+                    maxfev=self.max_evaluations,
+                    xatol=_NM_XATOL,
+                    fatol=_NM_FATOL
+                )
+            )
+
+            if result.fun < best_power:
+                best_params = offset + np.clip(result.x, -0.5, 0.5) * window
+                best_power = float(result.fun)
+
+            window = window * 2 / self.cushion_param
+            num_rounds += 1
+
+        return best_params, best_power, num_rounds
+
+    def _set_phase_amp_imbalance(self, phase, q):
+
+        # Calculate i and q amplitudes from q and a0
+        amp_i = 2 * q / (1 + q) * self.a0
+        amp_q = 2 * self.a0 / (1 + q)
+
+        # Set i and q amplitudes
+        self.hd.setd('sines/{}/amplitudes/{}'.format(self.HDAWG_ports[0] - 1, np.mod(self.HDAWG_ports[0] - 1, 2)), amp_i)
+        self.hd.setd('sines/{}/amplitudes/{}'.format(self.HDAWG_ports[1] - 1, np.mod(self.HDAWG_ports[1] - 1, 2)), amp_q)
+
+        # Set phaseshift
+        self.hd.setd('sines/{}/phaseshift'.format(self.HDAWG_ports[0] - 1), phase)
+
+    def _set_dc_offsets(self, dc_i, dc_q):
+
+        self.hd.setd('sigouts/{}/offset'.format(self.HDAWG_ports[0] - 1), dc_i)
+        self.hd.setd('sigouts/{}/offset'.format(self.HDAWG_ports[1] - 1), dc_q)
+
+    def _measure_lower_sideband(self, phase, q):
+
+        # The amplitudes are only defined for a positive imbalance
+        if q <= 0:
+            return float('inf')
+
+        self._set_phase_amp_imbalance(phase, q)
+        time.sleep(self._AWG_DELAY_TIME)
+        return self._average_marker_power(self.lower_sb_marker)
+
+    def _measure_carrier(self, dc_i, dc_q):
+
+        self._set_dc_offsets(dc_i, dc_q)
+        time.sleep(self._AWG_DELAY_TIME)
+        return self._average_marker_power(self.carrier_marker)
+
+    def _sweep_phase_amp_imbalance(self):
+
+        for i, j in it.product(range(self.num_points), repeat=2):
+
+            self._set_phase_amp_imbalance(self.phases[i], self.qs[j])
 
             #See sweep dc for explanation, basically allowing the point to update
             if (i == 0 and j == 0):
@@ -316,6 +468,7 @@ class IQOptimizer(Optimizer):
             self.lower_sideband_power[i, j] = self._average_marker_power(self.lower_sb_marker)
 
     def _average_marker_power(self, marker):
+        self.evaluations += 1
         total_sum = 0
         for i in range(self._averages):
             total_sum = total_sum + marker.get_power()
@@ -341,11 +494,7 @@ class IQOptimizer(Optimizer):
 
         for i, j in it.product(range(self.num_points), repeat=2):
 
-            # Set I DC-offset
-            self.hd.setd('sigouts/{}/offset'.format(self.HDAWG_ports[0] - 1), voltages_i[i])
-
-            # Set Q DC-offset
-            self.hd.setd('sigouts/{}/offset'.format(self.HDAWG_ports[1] - 1), voltages_q[j])
+            self._set_dc_offsets(voltages_i[i], voltages_q[j])
 
             # Found a bug where the first few points in the matrix seem to be from the point before, i.e.
             # the script is running faster then the spectrum analyzer can update
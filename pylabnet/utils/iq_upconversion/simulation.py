@@ -0,0 +1,248 @@
+""" Simulated IQ upconversion setup for testing the IQ optimizers offline
+
+IQSimulation provides stand-ins for the HDAWG, microwave source and spectrum
+analyzer clients used by IQOptimizer. The simulated IQ mixer has an amplitude
+imbalance, a phase error and carrier leakage. The spectrum analyzer reports the
+power of the upper sideband, lower sideband and carrier lines at the marker
+frequencies, with Gaussian readout noise and a noise floor.
+
+Run this module to compare the number of spectrum analyzer evaluations needed
+by the optimization methods.
+"""
+
+import re
+import time
+import numpy as np
+
+from pylabnet.utils.logging.logger import LogHandler
+
+
+class IQSimulation:
+    """ Simulated IQ mixer with the clients needed by IQOptimizer """
+
+    def __init__(self, phase=93.0, q=1.04, dc_i=0.012, dc_q=-0.018, usb_power=-5.0,
+                 noise_floor=-85.0, noise=0.2, HDAWG_ports=[3, 4], seed=None):
+        """ Instantiates the simulation
+
+        :param phase: (float) optimal phase shift in degrees
+        :param q: (float) optimal amplitude imbalance
+        :param dc_i: (float) optimal DC offset of the I channel in V
+        :param dc_q: (float) optimal DC offset of the Q channel in V
+        :param usb_power: (float) upper sideband power in dBm for an average
+            amplitude of 0.65
+        :param noise_floor: (float) noise floor of the spectrum analyzer in dBm
+        :param noise: (float) standard deviation of the readout noise in dB
+        :param HDAWG_ports: (list) HDAWG ports of the I and Q channel
+        :param seed: (int) seed of the readout noise
+        """
+
+        self.phase = phase
+        self.q = q
+        self.dc_i = dc_i
+        self.dc_q = dc_q
+        self.usb_power = usb_power
+        self.noise_floor = noise_floor
+        self.noise = noise
+        self.HDAWG_ports = HDAWG_ports
+        self._rng = np.random.default_rng(seed)
+
+        self.hd = SimulatedHDAWG()
+        self.mw_source = SimulatedMWSource()
+        self.sa = SimulatedSpectrumAnalyzer(self)
+
+    def line_powers(self):
+        """ Returns the noiseless powers of the output lines
+
+        :return: (dict) frequency in Hz: power in dBm for the upper sideband,
+            lower sideband and carrier
+        """
+
+        i_port, q_port = self.HDAWG_ports
+        amp_i = self.hd.getd(f'sines/{i_port - 1}/amplitudes/{(i_port - 1) % 2}')
+        amp_q = self.hd.getd(f'sines/{q_port - 1}/amplitudes/{(q_port - 1) % 2}')
+        phase = self.hd.getd(f'sines/{i_port - 1}/phaseshift')
+        dc_i = self.hd.getd(f'sigouts/{i_port - 1}/offset')
+        dc_q = self.hd.getd(f'sigouts/{q_port - 1}/offset')
+
+        # Relative amplitude and phase error of the I path
+        error = (amp_i / amp_q / self.q if amp_q else 0) * np.exp(1j * np.deg2rad(phase - self.phase))
+        power = 10 ** (self.usb_power / 10) * (0.5 * (amp_i + amp_q) / 0.65) ** 2
+        floor = 10 ** (self.noise_floor / 10)
+
+        lo_freq = self.mw_source.freq
+        if_freq = self.hd.if_freq
+        return {
+            lo_freq + if_freq: 10 * np.log10(power * np.abs(error + 1) ** 2 / 4 + floor),
+            lo_freq - if_freq: 10 * np.log10(power * np.abs(error - 1) ** 2 / 4 + floor),
+            lo_freq: 10 * np.log10(np.abs((dc_i - self.dc_i) + 1j * (dc_q - self.dc_q)) ** 2 + floor)
+        }
+
+    def measure(self, freq, tolerance=1e6):
+        """ Returns the power at freq including readout noise
+
+        :param freq: (float) frequency in Hz
+        :param tolerance: (float) maximal distance to an output line in Hz
+        :return: (float) power in dBm
+        """
+
+        power = self.noise_floor
+        for line_freq, line_power in self.line_powers().items():
+            if abs(freq - line_freq) < tolerance:
+                power = line_power
+                break
+
+        return power + self.noise * self._rng.standard_normal()
+
+
+class SimulatedHDAWG:
+    """ Stores the node values set on the HDAWG """
+
+    def __init__(self):
+
+        self.log = LogHandler()
+        self.nodes = {}
+        self.if_freq = 0
+
+    def setd(self, node, value):
+        self.nodes[node] = value
+        if node.startswith('oscs/'):
+            self.if_freq = value
+
+    def getd(self, node):
+        return self.nodes.get(node, 0)
+
+    def seti(self, node, value):
+        self.nodes[node] = value
+
+    def geti(self, node):
+        return self.nodes.get(node, 0)
+
+    def set_channel_grouping(self, index):
+        pass
+
+    def enable_output(self, output_indices):
+        pass
+
+
+class SimulatedMWSource:
+    """ Microwave source providing the LO """
+
+    def __init__(self):
+
+        self.freq = 0
+        self.power = 0
+        self.output = False
+
+    def output_on(self):
+        self.output = True
+
+    def output_off(self):
+        self.output = False
+
+    def set_freq(self, freq):
+        self.freq = freq
+
+    def set_power(self, power):
+        self.power = power
+
+
+class SimulatedSpectrumAnalyzer:
+    """ Spectrum analyzer answering the marker commands of E4405BMarker """
+
+    _MARKER_X = re.compile(r':CALCulate:MARKer(\d+):X ([-+.\deE]+)')
+    _MARKER_Y = re.compile(r':CALCulate:MARKer(\d+):Y\?')
+
+    def __init__(self, simulation, num_points=601):
+
+        self.simulation = simulation
+        self.num_points = num_points
+        self.center_frequency = 0
+        self.frequency_span = 0
+        self.reference_level = 0
+        self.marker_freqs = {}
+
+        # Number of power readings
+        self.reads = 0
+
+    def set_center_frequency(self, center_frequency):
+        self.center_frequency = center_frequency
+
+    def set_frequency_span(self, frequency_span):
+        self.frequency_span = frequency_span
+
+    def set_reference_level(self, db):
+        self.reference_level = db
+
+    def write(self, command):
+        match = self._MARKER_X.match(command)
+        if match:
+            self.marker_freqs[int(match.group(1))] = float(match.group(2))
+
+    def query(self, command):
+        match = self._MARKER_Y.match(command)
+        if match:
+            self.reads += 1
+            return str(self.simulation.measure(self.marker_freqs.get(int(match.group(1)), 0)))
+        return '0'
+
+    def read_trace(self):
+        """ Returns the simulated trace, see Driver.read_trace() """
+
+        freqs = self.center_frequency + np.linspace(-0.5, 0.5, self.num_points) * self.frequency_span
+        tolerance = self.frequency_span / self.num_points
+        powers = [self.simulation.measure(freq, tolerance=tolerance) for freq in freqs]
+        return np.stack((freqs, powers), axis=1)
+
+    def plot_trace(self):
+        pass
+
+
+def benchmark(methods=('grid', 'nelder-mead'), seed=0, **kwargs):
+    """ Optimizes the simulated setup with each method
+
+    :param methods: (tuple) optimization methods to compare
+    :param seed: (int) seed of the simulated readout noise
+    :param kwargs: additional keyword arguments for IQOptimizer
+    :return: (dict) method: dict with the number of 'evaluations' and
+        spectrum analyzer 'reads', the final 'lower_sideband' and 'carrier'
+        power in dBm and the 'duration' in s
+    """
+
+    # Imported here since the optimizer module requires the plotting packages
+    from pylabnet.utils.iq_upconversion.optimizer import IQOptimizer
+
+    results = {}
+    for method in methods:
+        simulation = IQSimulation(seed=seed)
+        start_time = time.time()
+        opt = IQOptimizer(
+            simulation.mw_source, simulation.hd, simulation.sa, 5e9, 100e6,
+            param_guess=([90, 1, 0.65, -0.002, 0.006]), phase_window=50, q_window=0.34,
+            dc_i_window=0.2, dc_q_window=0.2, max_iterations=3, plot_traces=False,
+            method=method, **kwargs
+        )
+        opt.opt()
+        powers = simulation.line_powers()
+        results[method] = dict(
+            evaluations=opt.evaluations,
+            reads=simulation.sa.reads,
+            lower_sideband=float(powers[5e9 - 100e6]),
+            carrier=float(powers[5e9]),
+            duration=time.time() - start_time
+        )
+
+    return results
+
+
+def main():
+
+    for method, result in benchmark().items():
+        print(
+            f'{method}: {result["evaluations"]} evaluations, {result["reads"]} reads, '
+            f'lower sideband {result["lower_sideband"]:.1f} dBm, carrier {result["carrier"]:.1f} dBm, '
+            f'{result["duration"]:.1f} s'
+        )
+
+
+if __name__ == '__main__':
+    main()
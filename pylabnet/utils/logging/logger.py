@@ -8,6 +8,11 @@ import ctypes
 import signal
 import re
 import pickle
+import json
+import atexit
+import tempfile
+import threading
+from collections import deque
 from pylabnet.utils.helper_methods import get_os, get_dated_subdirectory_filepath, get_ip, load_config
 from pylabnet.utils.slackbot.slackbot import PylabnetSlackBot
 
@@ -118,6 +123,259 @@ class ILog:
     pass
 
 
+class LogShipper:
+    """ Sends log messages of a LogClient to the log server in a background thread
+
+    Logging calls only append the message to a bounded queue and return
+    immediately, such that hot loops do not wait for a round-trip to the log
+    server. The shipper thread sends the queued messages in batches via
+    LogService.exposed_log_batch().
+
+    If the queue is full, messages are dropped according to the drop policy:
+     - 'drop_oldest': discard the oldest queued message (default)
+     - 'drop_newest': discard the new message
+     - 'block': wait until there is space in the queue (backpressure). Messages
+       logged by the shipper thread itself (e.g. while reconnecting) cannot wait
+       for it and discard the oldest queued message instead
+    The number of dropped messages is reported to the log server once the
+    queue has drained.
+
+    While the log server is unreachable, messages are written to a local spill
+    file and re-sent (with their original timestamps) once the connection is
+    re-established.
+    """
+
+    DROP_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+    def __init__(self, client, max_queue=10000, batch_size=200, flush_interval=0.05,
+                 drop_policy='drop_oldest', spill_file=None, reconnect_interval=2):
+        """ Instantiates and starts the shipper thread
+
+        :param client: (LogClient) client whose connection is used to send messages
+        :param max_queue: (int) maximum number of queued messages
+        :param batch_size: (int) maximum number of messages sent per call
+        :param flush_interval: (float) maximum time in s a message waits before being sent
+        :param drop_policy: (str) what to do if the queue is full, see class docstring
+        :param spill_file: (str) path of the spill file. Defaults to a file in
+            the temp directory, unique to the process
+        :param reconnect_interval: (float) minimum time in s between reconnection attempts
+        """
+
+        if drop_policy not in self.DROP_POLICIES:
+            raise ValueError(f'Invalid drop policy {drop_policy}, use one of {self.DROP_POLICIES}')
+
+        self.client = client
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.reconnect_interval = reconnect_interval
+
+        if spill_file is None:
+            module_tag = re.sub(r'[^\w-]', '_', client._module_tag)
+            spill_file = os.path.join(
+                tempfile.gettempdir(),
+                'pylabnet_logs',
+                f'spill_{module_tag}_{os.getpid()}.jsonl'
+            )
+        self.spill_file = spill_file
+
+        self.dropped = 0
+        self._dropped_reported = 0
+        self._queue = deque()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._connected = True
+        self._last_reconnect = 0
+        self._batch_supported = True
+        self._stop = False
+
+        self._thread = threading.Thread(target=self._run, name='LogShipper', daemon=True)
+        self._thread.start()
+
+        # Send remaining messages when the interpreter exits
+        atexit.register(self.close)
+
+    def put(self, msg_str, level_str):
+        """ Queues a message for sending
+
+        :param msg_str: (str) message, including the module tag
+        :param level_str: (str) log level
+        :return: (int) 0 if the message was queued, -1 if it was dropped
+        """
+
+        item = (time.time(), level_str, msg_str)
+
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                if self.drop_policy == 'drop_newest':
+                    self.dropped += 1
+                    return -1
+                elif self.drop_policy == 'block' and threading.current_thread() is not self._thread:
+                    while len(self._queue) >= self.max_queue and not self._stop:
+                        self._cond.wait()
+                else:
+                    self._queue.popleft()
+                    self.dropped += 1
+
+            self._queue.append(item)
+
+            # The shipper wakes up by itself every flush_interval
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+
+        return 0
+
+    def flush(self, timeout=5):
+        """ Waits until all queued messages have been sent or spilled
+
+        :param timeout: (float) maximum time to wait in s
+        :return: (bool) whether the queue was emptied in time
+        """
+
+        deadline = time.time() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._queue or self._in_flight:
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self._thread.is_alive():
+                    return False
+                self._cond.wait(remaining)
+
+        return True
+
+    def close(self, timeout=5):
+        """ Sends remaining messages and stops the shipper thread
+
+        :param timeout: (float) maximum time to wait for remaining messages in s
+        """
+
+        if self._stop:
+            return
+
+        self.flush(timeout=timeout)
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join(timeout=timeout)
+
+        try:
+            atexit.unregister(self.close)
+        except Exception:
+            pass
+
+    def _run(self):
+        """ Main loop of the shipper thread """
+
+        while True:
+            with self._cond:
+                if not self._queue and not self._stop:
+                    self._cond.wait(self.flush_interval)
+                if self._stop and not self._queue:
+                    return
+
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                self._in_flight = len(batch)
+
+                # Wake up producers blocked by a full queue
+                self._cond.notify_all()
+
+            if self.dropped > self._dropped_reported:
+                batch.append((
+                    time.time(),
+                    'WARN',
+                    f' {self.client._module_tag}: Log queue full, dropped '
+                    f'{self.dropped - self._dropped_reported} messages'
+                ))
+                self._dropped_reported = self.dropped
+
+            if batch:
+                self._ship(batch)
+
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def _ship(self, batch):
+        """ Sends a batch to the log server, spilling it to disk on failure
+
+        :param batch: (list) of (timestamp, level_str, msg_str) tuples
+        """
+
+        if not self._connected and not self._reconnect():
+            self._spill(batch)
+            return
+
+        try:
+            self._replay_spill()
+            self._send(batch)
+        except Exception:
+            self._connected = False
+            self._spill(batch)
+
+    def _send(self, batch):
+        """ Sends a batch, falling back to single messages for older log servers """
+
+        if self._batch_supported:
+            try:
+                self.client._service.exposed_log_batch(pickle.dumps(batch))
+                return
+            except AttributeError:
+                if self.client._service is None:
+                    raise
+                self._batch_supported = False
+
+        for _, level_str, msg_str in batch:
+            self.client._service.exposed_log_msg(msg_str=msg_str, level_str=level_str)
+
+    def _reconnect(self):
+        """ Tries to reconnect to the log server, at most every reconnect_interval
+
+        :return: (bool) whether the client is connected
+        """
+
+        if time.time() - self._last_reconnect < self.reconnect_interval:
+            return False
+        self._last_reconnect = time.time()
+
+        # LogClient.connect() resets the module tag if it fails
+        module_tag = self.client._module_tag
+        try:
+            self.client.connect()
+            self._connected = self.client._service is not None
+        except Exception:
+            self._connected = False
+        self.client._module_tag = module_tag
+
+        return self._connected
+
+    def _spill(self, batch):
+        """ Appends a batch to the spill file """
+
+        try:
+            os.makedirs(os.path.dirname(self.spill_file), exist_ok=True)
+            with open(self.spill_file, 'a') as spill:
+                for item in batch:
+                    spill.write(json.dumps(item) + '\n')
+        except OSError:
+            # Nothing else we can do, do not disturb the host module
+            self.dropped += len(batch)
+
+    def _replay_spill(self):
+        """ Sends the messages of the spill file and removes it """
+
+        if not os.path.exists(self.spill_file):
+            return
+
+        with open(self.spill_file, 'r') as spill:
+            items = [tuple(json.loads(line)) for line in spill if line.strip()]
+
+        for start in range(0, len(items), self.batch_size):
+            self._send(items[start:start + self.batch_size])
+
+        os.remove(self.spill_file)
+
+
 class LogClient:
 
     _level_dict = dict(
@@ -129,7 +387,21 @@ class LogClient:
         DEBUG=10
     )
 
-    def __init__(self, host, port, key='pylabnet.pem', module_tag='', server_port=None, ui=None):
+    def __init__(self, host, port, key='pylabnet.pem', module_tag='', server_port=None, ui=None,
+                 asynchronous=True, **shipper_kwargs):
+        """ Connects to the log server
+
+        :param host: (str) IP address of the log server, None for no logging
+        :param port: (int) port of the log server, None for no logging
+        :param key: (str) name of the SSL key, None for an unencrypted connection
+        :param module_tag: (str) name to display with log messages
+        :param server_port: (int) port of a server running in the client's thread
+        :param ui: (str) name of a relevant .ui file for the client
+        :param asynchronous: (bool) whether to send messages in a background
+            thread, such that logging calls return immediately
+        :param shipper_kwargs: keyword arguments for the LogShipper, e.g.
+            max_queue, drop_policy or spill_file
+        """
 
         # Declare all internal vars
         self._host = ''
@@ -142,6 +414,7 @@ class LogClient:
         self._server_port = server_port  # Identifies a server running in client's thread
         self._ui = ui  # Identifies a relevant .ui file for the client
         self.operating_system = get_os()
+        self._shipper = None
         #self.lab_name = None
 
         # try:
@@ -160,6 +433,10 @@ class LogClient:
         # Set module alias to display with log messages
         self._module_tag = module_tag
 
+        # Ship messages in the background if a log server is used
+        if asynchronous and host is not None and port is not None:
+            self._shipper = LogShipper(self, **shipper_kwargs)
+
         # Log test message
         self.info('Started logging')
 
@@ -297,11 +574,26 @@ class LogClient:
             client_data_pickle = pickle.dumps(data)
             self._service.update_client_data(self._module_tag, client_data_pickle)
 
+    def flush(self, timeout=5):
+        """ Waits until all queued log messages have been sent
+
+        :param timeout: (float) maximum time to wait in s
+        :return: (bool) whether all messages were sent in time
+        """
+
+        if self._shipper is None:
+            return True
+        return self._shipper.flush(timeout=timeout)
+
     def _log_msg(self, msg_str, level_str):
 
         # Prepending log message with module name.
         message = ' {0}: {1}'.format(self._module_tag, msg_str)
 
+        # Queue message for the background shipper
+        if self._shipper is not None:
+            return self._shipper.put(msg_str=message, level_str=level_str)
+
         # Try sending message to the log server
         try:
             ret_code = self._service.exposed_log_msg(
@@ -337,6 +629,9 @@ class LogClient:
     def close_server(self):
         """ Closes the server to which the LogClient is connected"""
 
+        if self._shipper is not None:
+            self._shipper.close()
+
         try:
             self._service.close_server()
         except EOFError:
@@ -451,6 +746,26 @@ class LogService(rpyc.Service):
 
         return 0
 
+    def exposed_log_batch(self, batch_pickle):
+        """ Logs a batch of messages
+
+        :param batch_pickle: (pickle) pickled list of (timestamp, level_str, msg_str)
+            tuples, where timestamp is the time.time() of the original logging call
+        """
+
+        for timestamp, level_str, msg_str in pickle.loads(batch_pickle):
+            level = LogClient._level_dict.get(level_str, logging.INFO)
+            if not self.logger.isEnabledFor(level):
+                continue
+
+            # Keep the time of the original logging call for the log output
+            record = self.logger.makeRecord(self.logger.name, level, '', 0, msg_str, None, None)
+            record.created = timestamp
+            record.msecs = (timestamp - int(timestamp)) * 1000
+            self.logger.handle(record)
+
+        return 0
+
     def add_client_data(self, module_name, module_data_pickle):
         """ Add new client info
 
@@ -1,7 +1,74 @@
 import numpy as np
+from collections import OrderedDict
 
 
-def pb_sample(pb_obj, samp_rate, len_min=0, len_max=float('inf'), len_step=1, len_adj=True, debug=False):
+class SampleCache:
+    """ Memoizes the sample arrays of pulses
+
+    Samples are keyed on the pulse class and parameters and on the sampled time
+    points (start, step and number of points). Re-sampling a pulse block after
+    editing one pulse therefore only evaluates get_value() of the edited pulse,
+    all other pulses are copied from the cache. The least recently used arrays
+    are dropped once the cache exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes=100e6):
+        """ Instantiates an empty cache
+
+        :param max_bytes: (float) maximal total size of the cached arrays
+        """
+
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._arrays = OrderedDict()
+        self._bytes = 0
+
+    def get(self, pulse, t_start, t_step, n_pts):
+        """ Returns the samples of pulse, evaluating it only on a cache miss
+
+        :param pulse: pulse object with get_value(t_ar) method
+        :param t_start: (float) first time point
+        :param t_step: (float) spacing of the time points
+        :param n_pts: (int) number of time points
+        :return: (numpy.array) read-only array of samples
+        """
+
+        key = (_freeze(pulse), float(t_start), float(t_step), int(n_pts))
+        samples = self._arrays.get(key)
+
+        if samples is not None:
+            self._arrays.move_to_end(key)
+            self.hits += 1
+            return samples
+
+        self.misses += 1
+        samples = np.asarray(pulse.get_value(t_ar=t_start + np.arange(n_pts) * t_step))
+        samples.setflags(write=False)
+
+        if samples.nbytes <= self.max_bytes:
+            self._arrays[key] = samples
+            self._bytes += samples.nbytes
+            while self._bytes > self.max_bytes:
+                _, old_samples = self._arrays.popitem(last=False)
+                self._bytes -= old_samples.nbytes
+
+        return samples
+
+    def clear(self):
+        """ Removes all cached arrays """
+
+        self._arrays.clear()
+        self._bytes = 0
+
+
+# Cache shared by all sampling functions
+sample_cache = SampleCache()
+
+
+def pb_sample(pb_obj, samp_rate, len_min=0, len_max=float('inf'), len_step=1, len_adj=True, debug=False,
+              analog=False, cache=sample_cache):
     """ Generate sample array.
 
     Unlike PulseBlock class, which makes now assumptions beyond the base class
@@ -33,6 +100,12 @@ def pb_sample(pb_obj, samp_rate, len_min=0, len_max=float('inf'), len_step=1, le
     :param debug: (bool) if True, time-point array will be included as a last
     element in the returned tuple
 
+    :param analog: (bool) if True, analog channels are sampled as well,
+    otherwise only digital channels are included
+
+    :param cache: (SampleCache) cache for the samples of each pulse, None to
+    always evaluate get_value()
+
     :return: (tuple)
     (
         samp_dict = {'ch_name': sample_array, ...}
@@ -131,7 +204,7 @@ def pb_sample(pb_obj, samp_rate, len_min=0, len_max=float('inf'), len_step=1, le
     for ch in pb_obj.dflt_dict.keys():
 
         # Skip the channel if it is not digital
-        if ch.is_analog:
+        if ch.is_analog and not analog:
             continue
 
         ch_name = ch.name
@@ -148,10 +221,18 @@ def pb_sample(pb_obj, samp_rate, len_min=0, len_max=float('inf'), len_step=1, le
                 indx_1 = int(p_item.t0 * samp_rate)
                 indx_2 = indx_1 + int(p_item.dur * samp_rate)
 
-                # calculate new values
-                val_ar = p_item.get_value(
-                    t_ar=t_ar[indx_1: indx_2]
-                )
+                # calculate new values, or take them from the cache
+                if cache is None:
+                    val_ar = p_item.get_value(
+                        t_ar=t_ar[indx_1: indx_2]
+                    )
+                else:
+                    val_ar = cache.get(
+                        p_item,
+                        t_start=indx_1 * t_step,
+                        t_step=t_step,
+                        n_pts=len(t_ar[indx_1: indx_2])
+                    )
 
                 # set the values to sample array
                 samp_dict[ch_name][indx_1: indx_2] = val_ar
@@ -175,8 +256,11 @@ def pulse_length_samples(pulse, samp_rate):
     return n_pts
 
 
-def pulse_sample(pulse, dflt_pulse, samp_rate, len_min=32, len_step=1, len_adj=True):
+def pulse_sample(pulse, dflt_pulse, samp_rate, len_min=32, len_step=1, len_adj=True, cache=sample_cache):
     """ Generate sample array from a single pulse object
+
+    :param cache: (SampleCache) cache for the pulse samples, None to always
+        evaluate get_value()
     """
 
     t_step = 1 / samp_rate
@@ -222,12 +306,49 @@ def pulse_sample(pulse, dflt_pulse, samp_rate, len_min=32, len_step=1, len_adj=T
         num=n_pts
     )
     # calculate new values
-    samp_arr = pulse.get_value(t_ar=t_ar[:n_pts_orig])
+    if cache is None:
+        samp_arr = pulse.get_value(t_ar=t_ar[:n_pts_orig])
+    else:
+        samp_arr = cache.get(pulse, t_start=pulse.t0, t_step=t_step, n_pts=n_pts_orig)
     # buffer the end with default values
     samp_arr = np.append(samp_arr, dflt_pulse.get_value(t_ar=t_ar[n_pts_orig:]))
 
     return samp_arr, n_pts, add_pts
 
+def _freeze(value):
+    """ Converts pulse objects and their parameters into a hashable key """
+
+    if type(value) in _SCALAR_TYPES:
+        return value
+    # Number subclasses such as Placeholder hold their value besides their attributes
+    if isinstance(value, (int, float, complex)):
+        number = complex(value) if isinstance(value, complex) else float(value)
+        return (type(value).__qualname__, number) + _freeze_attributes(value)
+    if hasattr(value, '__dict__'):
+        return (type(value).__qualname__,) + _freeze_attributes(value)
+    if isinstance(value, dict):
+        return tuple(sorted((str(key), _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, np.ndarray):
+        return (value.dtype.str, value.shape, value.tobytes())
+    if isinstance(value, np.generic):
+        return value
+    return repr(value)
+
+
+def _freeze_attributes(value):
+    """ Converts the instance attributes of value into a hashable key """
+
+    return tuple(
+        (name, item if type(item) in _SCALAR_TYPES else _freeze(item))
+        for name, item in getattr(value, '__dict__', {}).items()
+    )
+
+
+# Types which are used in cache keys as they are
+_SCALAR_TYPES = {str, int, float, bool, type(None)}
+
 # TODO YQ
 # def extend_pulse(pulse, pulse_list, dflt_pulse, t_start, t_end):
 #     """ Extends a pulse to a specified start and end time by padding with the
@@ -1,5 +1,6 @@
 
 import os
+import re
 from pylabnet.hardware.awg.zi_hdawg import Driver, Sequence, AWGModule
 from pylabnet.utils.zi_hdawg_pulseblock_handler.zi_hdawg_pb_handler import AWGPulseBlockHandler
 
@@ -27,10 +28,81 @@ class PulsedExperiment():
         return files_trimmed
 
     def replace_placeholders(self):
-        """Replace all sequence placeholders with values."""
-        self.seq.replace_placeholders(self.placeholder_dict)
+        """Replace all sequence placeholders with values.
+
+        Placeholders bound to user registers are skipped, their values are
+        written to the registers in prepare_awg().
+        """
+        self.seq.replace_placeholders({
+            placeholder: value for placeholder, value in self.placeholder_dict.items()
+            if placeholder not in self.register_placeholders
+        })
         self.hd.log.info("Replaced placeholders.")
 
+    def bind_register_placeholders(self):
+        """Bind placeholders to HDAWG user registers.
+
+        Sequence template placeholders are replaced by a getUserReg() call.
+        All other names are treated as pulseblock Placeholder variables and
+        are declared as sequencer variables read from the user register.
+        """
+
+        declarations = ""
+        self.register_variables = {}
+
+        for placeholder, reg_index in self.register_placeholders.items():
+            if reg_index not in range(16):
+                self.hd.log.error(f"User register {reg_index} for placeholder {placeholder} invalid, must be in range 0-15.")
+                continue
+
+            if placeholder in self.seq.unresolved_placeholders:
+                self.seq.replace_placeholders({placeholder: f"getUserReg({reg_index})"})
+            else:
+                declarations += f"var {placeholder} = getUserReg({reg_index});\n"
+                self.register_variables[placeholder] = reg_index
+
+        self.seq.prepend_sequence(declarations)
+        self.hd.log.info(f"Bound placeholders {list(self.register_placeholders.keys())} to user registers.")
+
+    def refresh_register_variables(self, pulse_sequence):
+        """Prepend commands re-reading the user registers of all register-bound
+        variables used in a pulseblock sequence, such that new values take
+        effect on the next pass through the pulseblock.
+
+        :pulse_sequence: (str) AWG commands of a pulseblock
+        """
+
+        refresh_sequence = ""
+        for variable, reg_index in self.register_variables.items():
+            if re.search(rf"\b{variable}\b", pulse_sequence):
+                refresh_sequence += f"{variable} = getUserReg({reg_index});\n"
+
+        return refresh_sequence + pulse_sequence
+
+    def set_placeholder_value(self, placeholder, value):
+        """Change the value of a register-bound placeholder on the running AWG.
+
+        This only writes the user register and does not require the sequence
+        to be recompiled or uploaded, which makes it suitable for sweeps.
+
+        :placeholder: (str) Name of the placeholder, must be a key of the
+            register_placeholders dictionary.
+        :value: (int) New value of the placeholder.
+        """
+
+        if placeholder not in self.register_placeholders:
+            self.hd.log.error(f"Placeholder {placeholder} is not bound to a user register, sequence must be recompiled.")
+            return
+
+        if self.awg is None:
+            self.hd.log.error("AWG not prepared yet, call get_ready() first.")
+            return
+
+        self.awg.set_user_register(self.register_placeholders[placeholder], value)
+
+        if self.placeholder_dict is not None:
+            self.placeholder_dict[placeholder] = value
+
     def replace_awg_commands(self, pulseblock):
         """Replace all waveform placeholders with actual AWG waveform commands.
 
@@ -52,6 +124,9 @@ class PulsedExperiment():
         # Generate instruction set which represents pulse sequence.
         prologue_sequence, pulse_sequence, upload_waveforms, upload_iq_waveforms = pb_handler.get_awg_sequence(len(self.upload_waveforms))
 
+        # Re-read user registers of register-bound variables in this pulseblock
+        pulse_sequence = self.refresh_register_variables(pulse_sequence)
+
         # Replace the pulseblock name placeholder with the generated instructions
         self.seq.replace_placeholders({pulseblock.name: pulse_sequence})
         self.seq.prepend_sequence(prologue_sequence)
@@ -71,6 +146,10 @@ class PulsedExperiment():
         if self.placeholder_dict is not None:
             self.replace_placeholders()
 
+        # Bind the sweep placeholders to user registers
+        if self.register_placeholders:
+            self.bind_register_placeholders()
+
         # Then replace the waveform commands
         for pulseblock in self.pulseblocks:
             pb_handler = self.replace_awg_commands(pulseblock)
@@ -139,6 +218,14 @@ class PulsedExperiment():
             awg.setup_dio(pb_handler.used_dio_bits)
             awg.setup_analog(pb_handler.setup_config_dict, self.assignment_dict)
 
+        self.awg = awg
+
+        # Write initial values of register-bound placeholders
+        if self.placeholder_dict is not None:
+            for placeholder in self.register_placeholders:
+                if placeholder in self.placeholder_dict:
+                    self.set_placeholder_value(placeholder, self.placeholder_dict[placeholder])
+
         return awg
 
     def prepare_microwave(self):
@@ -189,7 +276,8 @@ class PulsedExperiment():
                  sequence_string=None,
                  marker_string='$',
                  template_directory="sequence_templates",
-                 iplot=True):
+                 iplot=True,
+                 register_placeholders=None):
         """ Initilizes pulseblock experiment
 
         :pulseblocks: Single Pulseblock object or list of Pulseblock objects.
@@ -205,6 +293,12 @@ class PulsedExperiment():
         :marker_string: (str) String used to wrap placeholders to indicate them for replacement.
         :template_directory: Folder where to look for .seqct templates.
         :iplot: If True, sequences will be plotted.
+        :register_placeholders: (dict) Sweep mode: Dictionary mapping placeholder
+            names to HDAWG user register indices (0-15). These placeholders are
+            read from the user registers by the sequencer, such that their value
+            can be changed with set_placeholder_value() without recompiling.
+            Both sequence template placeholders and pulseblock Placeholder
+            variables are supported. Values must be integers.
         """
 
         # Ugly typecasting
@@ -225,6 +319,11 @@ class PulsedExperiment():
         self.placeholder_dict = placeholder_dict
         self.exp_config_dict = exp_config_dict
         self.iplot = iplot
+        self.register_placeholders = register_placeholders if register_placeholders is not None else {}
+        self.register_variables = {}
+
+        # AWG module, set once the sequence has been uploaded.
+        self.awg = None
 
         # List of waveforms to be uploaded. Items are of the form:
         # tuple(waveform var name, ch_name, start_step, end_step, np.array waveform)
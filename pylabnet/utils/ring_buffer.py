@@ -0,0 +1,332 @@
+""" Pre-allocated 1D storage for rolling data, e.g. time traces of monitors
+
+Appending to a NumPy array with np.append() re-allocates and copies the whole
+array on every call, such that a long-running monitor slows down quadratically
+with the number of points. RingBuffer stores the points in a pre-allocated array
+instead:
+
+ - With a capacity, the newest `capacity` points are kept. Every point is
+   written twice (at i and i + capacity), such that the points in order of
+   arrival always form a contiguous slice of the storage. view() therefore
+   returns an ordered array without copying.
+ - Without a capacity, all points are kept and the storage doubles in size
+   when it is full (amortized O(1) appends).
+
+Note that views returned by view() share memory with the buffer. Use
+np.copy() if the data needs to remain unchanged by subsequent appends.
+
+TraceStore groups several bounded buffers of equal length, e.g. the frequency,
+setpoint, voltage and error traces of a laser lock channel. Since plots rarely
+have more horizontal pixels than a few thousand, decimate_minmax() reduces a
+trace for display while keeping its extrema (and therefore glitches and lock
+jumps) visible.
+"""
+
+import time
+import numpy as np
+
+
+class RingBuffer:
+    """ 1D rolling storage with ordered zero-copy views """
+
+    def __init__(self, capacity=None, dtype=None, initial_size=1024):
+        """ Instantiates an empty buffer
+
+        :param capacity: (int) number of points to keep, None to keep all points
+        :param dtype: dtype of the storage. If None, it is inferred from the
+            first appended data. The storage is upcast if data of a wider type
+            is appended later (as np.append() would do).
+        :param initial_size: (int) initial storage size if capacity is None
+        """
+
+        self._capacity = None if capacity is None else int(capacity)
+        self._initial_size = max(int(initial_size), 1)
+        self._dtype = None if dtype is None else np.dtype(dtype)
+        self._storage = None
+        self._head = 0
+        self._size = 0
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def __len__(self):
+        return self._size
+
+    def append(self, values):
+        """ Appends a scalar or an array of values
+
+        :param values: (scalar or array) data to add, arrays are flattened
+        """
+
+        values = np.asarray(values)
+        if values.ndim != 1:
+            values = values.reshape(-1)
+        num_values = len(values)
+        if num_values == 0:
+            return
+
+        if values.dtype != self._dtype or self._storage is None:
+            self._ensure_dtype(values.dtype)
+
+        if self._capacity is None:
+            self._append_unbounded(values, num_values)
+        else:
+            self._append_bounded(values, num_values)
+
+    def view(self):
+        """ Returns the stored points in order of arrival
+
+        :return: (np.ndarray) view into the storage, empty if no data was added
+        """
+
+        if self._storage is None:
+            return np.empty(0, dtype=self._dtype)
+
+        if self._capacity is None:
+            return self._storage[:self._size]
+
+        start = (self._head - self._size) % self._capacity
+        return self._storage[start:start + self._size]
+
+    def set_capacity(self, capacity):
+        """ Changes the capacity, keeping the newest points
+
+        :param capacity: (int) new number of points to keep, None to keep all points
+        """
+
+        capacity = None if capacity is None else int(capacity)
+        if capacity == self._capacity:
+            return
+
+        data = self.view().copy()
+        if capacity is not None:
+            data = data[-capacity:] if capacity > 0 else data[:0]
+
+        self._capacity = capacity
+        self._storage = None
+        self._head = 0
+        self._size = 0
+        self.append(data)
+
+    def clear(self):
+        """ Removes all points, keeping the storage for re-use """
+
+        self._head = 0
+        self._size = 0
+
+    def _ensure_dtype(self, dtype):
+        """ Allocates the storage or upcasts it to hold values of dtype """
+
+        if self._storage is None:
+            self._dtype = dtype if self._dtype is None else np.result_type(self._dtype, dtype)
+            if self._capacity is None:
+                size = self._initial_size
+            else:
+                size = 2 * max(self._capacity, 1)
+            self._storage = np.empty(size, dtype=self._dtype)
+
+        elif not np.can_cast(dtype, self._dtype, casting='safe'):
+            self._dtype = np.result_type(self._dtype, dtype)
+            self._storage = self._storage.astype(self._dtype)
+
+    def _append_unbounded(self, values, num_values):
+        """ Appends values, doubling the storage when it is full """
+
+        required = self._size + num_values
+        if required > len(self._storage):
+            new_storage = np.empty(max(required, 2 * len(self._storage)), dtype=self._dtype)
+            new_storage[:self._size] = self._storage[:self._size]
+            self._storage = new_storage
+
+        self._storage[self._size:required] = values
+        self._size = required
+
+    def _append_bounded(self, values, num_values):
+        """ Writes values into both halves of the storage, overwriting the oldest points """
+
+        capacity = self._capacity
+        if capacity == 0:
+            return
+
+        # Only the newest points fit
+        if num_values >= capacity:
+            self._storage[:capacity] = values[-capacity:]
+            self._storage[capacity:] = values[-capacity:]
+            self._head = 0
+            self._size = capacity
+            return
+
+        if num_values == 1:
+            self._storage[self._head] = values[0]
+            self._storage[self._head + capacity] = values[0]
+        else:
+            end = self._head + num_values
+            if end <= capacity:
+                self._storage[self._head:end] = values
+                self._storage[self._head + capacity:end + capacity] = values
+            else:
+                split = capacity - self._head
+                self._storage[self._head:capacity] = values[:split]
+                self._storage[self._head + capacity:] = values[:split]
+                self._storage[:end - capacity] = values[split:]
+                self._storage[capacity:end] = values[split:]
+
+        self._head = (self._head + num_values) % capacity
+        self._size = min(self._size + num_values, capacity)
+
+
+class TraceStore:
+    """ Named bounded RingBuffers with a common length """
+
+    def __init__(self, names, capacity=0, dtype=float):
+        """ Instantiates empty traces
+
+        :param names: (iterable) names of the traces
+        :param capacity: (int) number of points to keep per trace
+        :param dtype: dtype of the traces
+        """
+
+        self.capacity = int(capacity)
+        self._buffers = {name: RingBuffer(capacity=self.capacity, dtype=dtype) for name in names}
+
+    @property
+    def names(self):
+        return tuple(self._buffers)
+
+    def reset(self, capacity=None, **values):
+        """ Fills traces with a constant value
+
+        :param capacity: (int) new number of points to keep, None to keep the
+            current capacity
+        :param values: value to fill each trace with, keyed by trace name.
+            Traces that are not given are emptied.
+        """
+
+        if capacity is not None and int(capacity) != self.capacity:
+            self.capacity = int(capacity)
+            for buffer in self._buffers.values():
+                buffer.set_capacity(self.capacity)
+
+        for name, buffer in self._buffers.items():
+            buffer.clear()
+            if name in values:
+                buffer.append(np.full(self.capacity, values[name]))
+
+    def append(self, name, value):
+        """ Appends a value to a trace, dropping its oldest point if it is full
+
+        :param name: (str) name of the trace
+        :param value: (scalar or array) value(s) to append
+        """
+
+        self._buffers[name].append(value)
+
+    def view(self, name):
+        """ Returns a trace in order of arrival, without copying
+
+        :param name: (str) name of the trace
+        :return: (np.ndarray) view into the storage of the trace
+        """
+
+        return self._buffers[name].view()
+
+    def decimated(self, name, max_points):
+        """ Returns a trace reduced for display with decimate_minmax()
+
+        :param name: (str) name of the trace
+        :param max_points: (int) maximal number of points to return
+        :return: (tuple) x (indices into the trace) and y arrays
+        """
+
+        return decimate_minmax(self.view(name), max_points)
+
+
+def decimate_minmax(data, max_points):
+    """ Reduces data for plotting, keeping the minimum and maximum of each bin
+
+    The data is split into bins of equal size, each of which is represented
+    by its minimum and maximum in their original order. Unlike plain
+    subsampling, no peak is lost.
+
+    :param data: (np.ndarray) 1D data to decimate
+    :param max_points: (int) maximal number of points to return
+    :return: (tuple) x (indices of the returned points in data) and y arrays
+    """
+
+    num_points = len(data)
+    bin_size = int(np.ceil(2 * num_points / max(max_points, 2)))
+    if bin_size <= 2:
+        return np.arange(num_points), data
+
+    num_bins = num_points // bin_size
+    bins = data[:num_bins * bin_size].reshape(num_bins, bin_size)
+    rows = np.arange(num_bins)
+    arg_min = bins.argmin(axis=1)
+    arg_max = bins.argmax(axis=1)
+    first = np.minimum(arg_min, arg_max)
+    second = np.maximum(arg_min, arg_max)
+
+    starts = rows * bin_size
+    x = np.empty(2 * num_bins, dtype=int)
+    x[0::2] = starts + first
+    x[1::2] = starts + second
+
+    # Points which do not fill a complete bin are returned as they are
+    x = np.concatenate((x, np.arange(num_bins * bin_size, num_points)))
+    return x, data[x]
+
+
+def benchmark(num_points=int(1e6), data_length=10000, baseline_points=1000):
+    """ Compares RingBuffer with np.append() for point-by-point appends
+
+    Appending all points with np.append() takes quadratic time, so it is
+    timed for baseline_points appends to an array which already has the
+    length reached at the end of the run.
+
+    :param num_points: (int) number of points to append
+    :param data_length: (int) capacity used for the bounded (RollingLine) case
+    :param baseline_points: (int) number of points appended with np.append()
+
+    :return: (dict) time per appended point in us for each method
+    """
+
+    values = np.random.random(num_points)
+    results = {}
+
+    for name, capacity in (('rolling', data_length), ('infinite', None)):
+
+        # Previous implementation, at the final data length
+        if capacity is None:
+            data = values[:num_points - baseline_points].copy()
+        else:
+            data = values[:capacity].copy()
+        start = time.perf_counter()
+        for value in values[-baseline_points:]:
+            if capacity is not None and len(data) == capacity:
+                data = np.append(data, value)[1:]
+            else:
+                data = np.append(data, value)
+        results[f'{name}_np_append_us'] = (time.perf_counter() - start) / baseline_points * 1e6
+
+        # Ring buffer, including the view as used for plotting
+        buffer = RingBuffer(capacity=capacity)
+        start = time.perf_counter()
+        for value in values:
+            buffer.append(value)
+            data = buffer.view()
+        results[f'{name}_ring_buffer_us'] = (time.perf_counter() - start) / num_points * 1e6
+
+        assert np.array_equal(data, values[-len(data):])
+
+    return results
+
+
+def main():
+    results = benchmark()
+    for key, value in results.items():
+        print(f'{key:>28}: {value:.3f} us per point')
+
+
+if __name__ == "__main__":
+    main()
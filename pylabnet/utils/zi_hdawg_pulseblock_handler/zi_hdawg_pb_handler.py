@@ -1,6 +1,6 @@
 import re
 import numpy as np
-from pylabnet.utils.pulseblock.pb_sample import pb_sample, pulse_sample
+from pylabnet.utils.pulseblock.pb_sample import pb_sample, pulse_sample, pulse_length_samples
 from pylabnet.utils.pulseblock.placeholder import Placeholder
 from pylabnet.utils.pulseblock.pulse import PCombined
 
@@ -14,11 +14,38 @@ ANA_SAMP_RATE = 2.4e9
 SETDIO_OFFSET = 4
 
 
+def pack_digital_codewords(digital_sample_dict, num_samples):
+    """ Pack sample-wise DIO bit values into an array of DIO codewords.
+
+    Vectorized equivalent of calling gen_single_digital_codeword() on every
+    sample: each channel is converted to a 0/1 array once, shifted to its DIO
+    bit position and OR-ed into the codeword array. The cost therefore scales
+    with the number of DIO bits rather than the number of samples.
+
+    :digital_sample_dict: (dict) Keys: DIO bit numbers, values: sample arrays
+        whose truthy entries indicate that the DIO bit should be turned on.
+    :num_samples: (int) Number of samples per channel.
+
+    :return: dio_codewords: (np.array) of dtype int64 with one codeword per
+        sample.
+    """
+
+    dio_codewords = np.zeros(num_samples, dtype='int64')
+
+    for dio_bit, ch_samples in digital_sample_dict.items():
+        # Truthiness of each sample decides whether the bit is set.
+        bit_on = (np.asarray(ch_samples[:num_samples]) != 0).astype('int64')
+        # E.g., for DIO-bit 3: 0000 ... 0001000 wherever the bit is on.
+        dio_codewords[:len(bit_on)] |= (bit_on << int(dio_bit))
+
+    return dio_codewords
+
+
 class AWGPulseBlockHandler():
 
     def __init__(self, pb, assignment_dict=None, exp_config_dict=None,
                  dig_samp_rate=DIG_SAMP_RATE, ana_samp_rate=ANA_SAMP_RATE,
-                 hd=None, end_low=True):
+                 hd=None, end_low=True, edge_based=True):
         """ Initializes the pulse block handler for the ZI HDAWG.
 
         :hd: (object) An instance of the zi_hdawg.Driver()
@@ -40,6 +67,10 @@ class AWGPulseBlockHandler():
             provided, user is asked to provide all channel values.
         :exp_config_dict: (dict) Dictionary of any experiment configurations.
         :end_low: (bool) whether or not to force the sequence to end low
+        :edge_based: (bool) If True, the digital commands are compiled directly
+            from the pulse edges in the pulseblock without sampling it. If
+            False, the pulseblock is densely sampled and the DIO codewords
+            are extracted from the sampled waveform.
         """
 
         # Use the log client of the HDAWG.
@@ -55,6 +86,7 @@ class AWGPulseBlockHandler():
         self.digital_sr = dig_samp_rate
         self.analog_sr = ana_samp_rate
         self.exp_config_dict = exp_config_dict
+        self.edge_based = edge_based
 
         # Ask user for bit assignment if no dictionary provided.
         if assignment_dict is None:
@@ -70,13 +102,22 @@ class AWGPulseBlockHandler():
             self._check_key_assignments()
 
         # Store remapped samples, number of samples and number of traces for the
-        # digital channels.
-        (self.digital_sample_dict,
-         self.num_digital_samples,
-         self.num_digital_traces) = self._get_remapped_digital_samples(samp_rate=dig_samp_rate)
+        # digital channels. In edge-based mode the samples are only generated
+        # on demand by gen_digital_codewords().
+        if self.edge_based:
+            self.digital_sample_dict = None
+            self.num_digital_samples = pulse_length_samples(self.pb, dig_samp_rate)
+            self.num_digital_traces = len([ch for ch in self.pb.dflt_dict.keys() if not ch.is_analog])
+
+            # List of DIO bits that are used by pulses in this pulseblock
+            self.used_dio_bits = list(self._get_digital_bit_defaults().keys())
+        else:
+            (self.digital_sample_dict,
+             self.num_digital_samples,
+             self.num_digital_traces) = self._get_remapped_digital_samples(samp_rate=dig_samp_rate)
 
-        # List of DIO bits that are used by pulses in this pulseblock
-        self.used_dio_bits = list(self.digital_sample_dict.keys())
+            # List of DIO bits that are used by pulses in this pulseblock
+            self.used_dio_bits = list(self.digital_sample_dict.keys())
 
         # Stores a list of configs for each type of config (e.g. osc freq, DC offset)
         # Populated when we parse the Pulseblocks and then used when we setup the
@@ -170,6 +211,47 @@ class AWGPulseBlockHandler():
 
         return digital_sample_dict, num_digital_samples, num_digital_traces
 
+    def _get_digital_bit_defaults(self):
+        """Map each digital channel of the pulseblock to its DIO bit.
+
+        Returns dictionary with keys corresponding to DIO bit numbers and
+        values to the (bool) default value of the channel.
+        """
+
+        bit_defaults = {}
+        for ch, dflt_pulse in self.pb.dflt_dict.items():
+            if ch.is_analog:
+                continue
+
+            if self.assignment_dict[ch.name][0] == "analog":
+                self.log.warn(f"Attempted to map an analog channel {ch.name} using the functions for digital signals.")
+                continue
+
+            # Digital default pulses are constant, so a single sample suffices.
+            bit_defaults[self.assignment_dict[ch.name][1]] = bool(dflt_pulse.get_value(t_ar=np.zeros(1))[0])
+
+        return bit_defaults
+
+    def _get_pulse_edge_indices(self, p_item):
+        """Find the AWG timesteps of the rising and falling edge of a pulse,
+        keeping the Placeholder value of timings.
+
+        :p_item: (object) Pulse object in the pulseblock
+
+        :return: (tuple) of start and end index in AWG timesteps
+        """
+
+        if type(p_item.t0) == Placeholder:
+            indx_1 = (p_item.t0 * self.digital_sr).round_val().int_val()
+        else:
+            indx_1 = int(round(p_item.t0 * self.digital_sr))
+        if type(p_item.t0 + p_item.dur) == Placeholder:
+            indx_2 = (indx_1 + p_item.dur * self.digital_sr).round_val().int_val()
+        else:
+            indx_2 = int(round(indx_1 + p_item.dur * self.digital_sr))
+
+        return indx_1, indx_2
+
     def gen_single_digital_codeword(self, sample_dict):
         """ Generate a single DIO codeword.
 
@@ -195,13 +277,26 @@ class AWGPulseBlockHandler():
 
         return codeword
 
-    def gen_digital_codewords(self):
+    def gen_digital_codewords(self, vectorized=True):
         """Generate array of DIO codewords.
 
         Given the remapped sample array, translate it into an
-        array of DIO codewords, sample by sample.
+        array of DIO codewords.
+
+        :vectorized: (bool) If True (default), pack all samples at once using
+            pack_digital_codewords(). If False, use the original
+            sample-by-sample loop over gen_single_digital_codeword().
         """
 
+        # Sample the pulseblock if this was skipped at initialization.
+        if self.digital_sample_dict is None:
+            (self.digital_sample_dict,
+             self.num_digital_samples,
+             self.num_digital_traces) = self._get_remapped_digital_samples(samp_rate=self.digital_sr)
+
+        if vectorized:
+            return pack_digital_codewords(self.digital_sample_dict, self.num_digital_samples)
+
         # Array storing one codeword per sample.
         dio_codewords = np.zeros(self.num_digital_samples, dtype='int64')
 
@@ -490,14 +585,7 @@ class AWGPulseBlockHandler():
         for ch in [ch for ch in self.pb.p_dict.keys() if not ch.is_analog]:
             for p_item in self.pb.p_dict[ch]:
                 # Find indexes of pulse edges
-                if type(p_item.t0) == Placeholder:
-                    indx_1 = (p_item.t0 * self.digital_sr).round_val().int_val()
-                else:
-                    indx_1 = int(round(p_item.t0 * self.digital_sr))
-                if type(p_item.t0 + p_item.dur) == Placeholder:
-                    indx_2 = (indx_1 + p_item.dur * self.digital_sr).round_val().int_val()
-                else:
-                    indx_2 = int(round(indx_1 + p_item.dur * self.digital_sr))
+                indx_1, indx_2 = self._get_pulse_edge_indices(p_item)
 
                 codeword_times.extend([indx_1, indx_2])
 
@@ -519,6 +607,72 @@ class AWGPulseBlockHandler():
 
         return codewords, codeword_times
 
+    def gen_digital_commands_from_edges(self):
+        """Generate zipped version of DIO commands directly from pulse edges.
+
+        Event-based equivalent of zip_digital_commands(gen_digital_codewords()):
+        instead of sampling the pulseblock at every AWG timestep, the DIO
+        transitions are read from the start and end times of the pulses in
+        the pulseblock. Memory and runtime therefore scale with the number of
+        pulses rather than the number of samples.
+
+        :return: codewords: (np.array) of unique DIO codewords ordered in time
+        :return: codeword_times: (list) of times in AWG timesteps to output the
+            DIO codewords
+        """
+
+        bit_defaults = self._get_digital_bit_defaults()
+
+        # Bit values to apply at each edge time. Falling edges are stored
+        # separately so that they are applied before rising edges occurring at
+        # the same time (i.e. back-to-back pulses).
+        rising_edges, falling_edges = {}, {}
+
+        for ch in [ch for ch in self.pb.p_dict.keys() if not ch.is_analog]:
+            if self.assignment_dict[ch.name][0] == "analog":
+                continue
+            dio_bit = self.assignment_dict[ch.name][1]
+
+            for p_item in self.pb.p_dict[ch]:
+                indx_1, indx_2 = self._get_pulse_edge_indices(p_item)
+
+                # Pulses shorter than one timestep do not produce any output.
+                if indx_2 == indx_1:
+                    continue
+
+                # Digital pulses are constant, so a single sample suffices.
+                p_val = bool(p_item.get_value(t_ar=np.zeros(1))[0])
+                rising_edges.setdefault(indx_1, {})[dio_bit] = p_val
+                falling_edges.setdefault(indx_2, {})[dio_bit] = bit_defaults.get(dio_bit, False)
+
+        # Time 0 is always needed since otherwise we would have no initial value.
+        edge_times = list(set([0]) | set(rising_edges.keys()) | set(falling_edges.keys()))
+        edge_times.sort()
+
+        bit_state = dict(bit_defaults)
+        codewords, codeword_times = [], []
+
+        for edge_time in edge_times:
+            bit_state.update(falling_edges.get(edge_time, {}))
+            bit_state.update(rising_edges.get(edge_time, {}))
+            codeword = self.gen_single_digital_codeword(bit_state)
+
+            # Only keep times at which the DIO output actually changes.
+            if len(codewords) == 0 or codeword != codewords[-1]:
+                codewords.append(codeword)
+                codeword_times.append(edge_time)
+
+        # Force final output to be zero
+        if self.end_low and codewords[-1] != 0:
+            codewords.append(0)
+            codeword_times.append(max(self.num_digital_samples - 1, codeword_times[-1] + 1))
+
+        # DIO output never changes within the pulseblock.
+        if len(codewords) == 1:
+            return [], []
+
+        return np.array(codewords, dtype='int64'), codeword_times
+
     def combine_command_timings(self, digital_codewords, digital_times, waveforms):
         """ Combine the commands and timings from the analog and digital commands
         to give a combined list of codewords and wait time intervals.
@@ -742,11 +896,15 @@ class AWGPulseBlockHandler():
             will generate the pulses described by the pulseblock.
         """
 
-        # Get sample-wise sets of codewords for the digital channels.
-        digital_codewords_samples = self.gen_digital_codewords()
+        if self.edge_based:
+            # Read the codewords + waittimes directly from the pulse edges.
+            digital_codewords, digital_times = self.gen_digital_commands_from_edges()
+        else:
+            # Get sample-wise sets of codewords for the digital channels.
+            digital_codewords_samples = self.gen_digital_codewords()
 
-        # Reduce this array to a set of codewords + waittimes.
-        digital_codewords, digital_times = self.zip_digital_commands(digital_codewords_samples)
+            # Reduce this array to a set of codewords + waittimes.
+            digital_codewords, digital_times = self.zip_digital_commands(digital_codewords_samples)
 
         # Get instructions for the analog channels
         # List of tuples (waveform var name, ch_name, start_step, end_step, np.array waveform)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+# The store requires h5py and the logging dependencies
+try:
+    from pylabnet.scripts.data_center import chunked_store
+except ImportError as exc:
+    pytest.skip(f'Chunked store not available: {exc}', allow_module_level=True)
+if not chunked_store.AVAILABLE:
+    pytest.skip('h5py is not installed', allow_module_level=True)
+
+
+class FakeDataset:
+
+    def __init__(self, data):
+        self.name = 'counts'
+        self.is_important = False
+        self.children = {}
+        self.data = data
+
+    def get_save_arrays(self):
+        return dict(data=self.data)
+
+
+def make_store(tmp_path, **kwargs):
+    return chunked_store.ChunkedDatasetStore(filename='run', directory=str(tmp_path), date_dir=False, **kwargs)
+
+
+def test_new_rows_are_appended(tmp_path):
+
+    store = make_store(tmp_path)
+    dataset = FakeDataset(np.arange(10.))
+    assert store.save(dataset)['rewritten'] == 10
+
+    dataset.data = np.arange(15.)
+    stats = store.save(dataset)
+    assert (stats['appended'], stats['rewritten']) == (5, 0)
+    assert_array_equal(chunked_store.load(store.filepath)['counts']['data'], dataset.data)
+
+
+@pytest.mark.parametrize('verify_interval', [1, 3])
+def test_modified_saved_rows_are_rewritten(tmp_path, verify_interval):
+
+    store = make_store(tmp_path, verify_interval=verify_interval)
+    dataset = FakeDataset(np.arange(10.))
+    store.save(dataset)
+
+    # Neither the first nor the last saved row changes, which is only detected
+    # once the saved rows are verified
+    rewritten = []
+    for rows in range(11, 11 + verify_interval):
+        dataset.data = np.arange(float(rows))
+        dataset.data[5] = -1
+        rewritten.append(store.save(dataset)['rewritten'])
+
+    assert rewritten == [0] * (verify_interval - 1) + [len(dataset.data)]
+    assert_array_equal(chunked_store.load(store.filepath)['counts']['data'], dataset.data)
@@ -0,0 +1,68 @@
+import pytest
+
+# The optimizer module requires the plotting, instrument and GUI packages
+try:
+    from pylabnet.utils.iq_upconversion import optimizer
+    from pylabnet.utils.iq_upconversion.simulation import IQSimulation
+except ImportError as exc:
+    pytest.skip(f'IQ optimizer not available: {exc}', allow_module_level=True)
+
+
+def make_optimizer(simulation, method, **kwargs):
+
+    return optimizer.IQOptimizer(
+        simulation.mw_source, simulation.hd, simulation.sa, 5e9, 100e6,
+        param_guess=([90, 1, 0.65, -0.002, 0.006]), phase_window=50, q_window=0.34,
+        dc_i_window=0.2, dc_q_window=0.2, max_iterations=3, plot_traces=False,
+        method=method, **kwargs
+    )
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(optimizer.time, 'sleep', lambda duration: None)
+
+
+def test_nelder_mead_reaches_threshold():
+
+    simulation = IQSimulation(seed=0)
+    opt = make_optimizer(simulation, 'nelder-mead')
+    opt.opt()
+
+    assert opt.opt_lower_sideband_pow <= opt.max_lower_sideband_pow
+    assert opt.opt_carrier_pow <= opt.max_carrier_pow
+
+    # A single round of the grid search measures num_points^2 settings per optimization
+    assert opt.evaluations < 2 * opt.num_points ** 2 / 4
+
+
+def test_nelder_mead_stays_in_window():
+
+    simulation = IQSimulation(seed=0)
+    opt = make_optimizer(simulation, 'nelder-mead')
+    opt.max_iterations = 1
+
+    def measure(phase, q):
+        assert opt.phase_min <= phase <= opt.phase_max
+        assert opt.q_min <= q <= opt.q_max
+        return phase ** 2
+
+    # The optimum of measure lies far outside the window of the first round
+    (phase, q), _, _ = opt._minimize(
+        measure,
+        center=[0.5 * (opt.phase_min + opt.phase_max), 0.5 * (opt.q_min + opt.q_max)],
+        window=[opt.phase_max - opt.phase_min, opt.q_max - opt.q_min],
+        target=-float('inf')
+    )
+    assert phase == pytest.approx(opt.phase_min)
+
+
+def test_rejects_non_positive_imbalance():
+
+    simulation = IQSimulation(seed=0)
+    opt = make_optimizer(simulation, 'nelder-mead')
+    nodes = dict(simulation.hd.nodes)
+
+    assert opt._measure_lower_sideband(90, -1) == float('inf')
+    assert opt._measure_lower_sideband(90, 0) == float('inf')
+    assert simulation.hd.nodes == nodes
@@ -0,0 +1,68 @@
+import pickle
+import threading
+
+import pytest
+
+# The logger requires the networking and Slack dependencies
+try:
+    from pylabnet.utils.logging.logger import LogShipper
+except ImportError as exc:
+    pytest.skip(f'Logger not available: {exc}', allow_module_level=True)
+
+
+class FakeService:
+
+    def __init__(self, on_batch=None):
+        self.messages = []
+        self.on_batch = on_batch
+
+    def exposed_log_batch(self, batch):
+        self.messages.extend(msg_str for _, _, msg_str in pickle.loads(batch))
+        if self.on_batch is not None:
+            self.on_batch()
+
+
+class FakeClient:
+
+    def __init__(self, service):
+        self._module_tag = 'test'
+        self._service = service
+
+
+def make_shipper(tmp_path, service, **kwargs):
+    return LogShipper(FakeClient(service), spill_file=str(tmp_path / 'spill.jsonl'), **kwargs)
+
+
+def test_messages_are_shipped(tmp_path):
+
+    service = FakeService()
+    shipper = make_shipper(tmp_path, service)
+    for index in range(500):
+        shipper.put(f'message {index}', 'INFO')
+
+    assert shipper.flush()
+    assert service.messages == [f'message {index}' for index in range(500)]
+    shipper.close()
+
+
+def test_block_policy_on_shipper_thread(tmp_path):
+
+    shipper = None
+
+    # Logging while sending, e.g. from a reconnection, happens on the shipper thread
+    def log_from_shipper():
+        assert threading.current_thread() is shipper._thread
+        for _ in range(3):
+            shipper.put('from shipper', 'INFO')
+
+    service = FakeService(on_batch=log_from_shipper)
+    shipper = make_shipper(tmp_path, service, max_queue=1, batch_size=1, drop_policy='block')
+    shipper.put('first', 'INFO')
+
+    # The shipper keeps sending its own messages, only waiting for it would deadlock
+    thread = threading.Thread(target=shipper.close, kwargs=dict(timeout=1), daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert service.messages[0] == 'first'
+    assert shipper.dropped > 0
@@ -0,0 +1,164 @@
+import pytest
+from numpy.testing import assert_allclose
+
+# The driver requires the NI DAQmx API
+try:
+    from pylabnet.hardware.ni_daqs import nidaqmx_card
+    from pylabnet.hardware.ni_daqs.nidaqmx_card import nidaqmx, DummyTask, TaskPool
+except ImportError as exc:
+    pytest.skip(f'NI DAQmx driver not available: {exc}', allow_module_level=True)
+
+
+class FakeDevice:
+    """ Device with a single AI timing engine, reserved by a committed or running task """
+
+    def __init__(self):
+        self.engine = None
+        self.created = 0
+        self.failures = 0
+
+    def new_task(self):
+        self.created += 1
+        return FakeTask(self)
+
+
+class FakeTask:
+
+    def __init__(self, device):
+        self.device = device
+        self.committed = False
+        self.closed = False
+
+    def control(self, action):
+        self._reserve()
+        self.committed = True
+
+    def read(self, number_of_samples_per_channel=1):
+        self._reserve()
+        if not self.committed:
+            self.device.engine = None
+        return 1.0
+
+    def close(self):
+        self.closed = True
+        if self.device.engine is self:
+            self.device.engine = None
+
+    def _reserve(self):
+        if self.device.engine not in (None, self):
+            self.device.failures += 1
+            raise nidaqmx.DaqError('Resource reserved', -50103)
+        self.device.engine = self
+
+
+def read(pool, channel, persistent=False):
+    return pool.run(channel, ('ai',), lambda task: None, lambda task: task.read(), persistent=persistent)
+
+
+@pytest.fixture
+def device():
+    return FakeDevice()
+
+
+def test_task_is_reused(device):
+
+    pool = TaskPool(new_task=device.new_task)
+    for _ in range(5):
+        read(pool, 'Dev1/ai0')
+    assert device.created == 1
+
+    # A new configuration replaces the task
+    pool.run('Dev1/ai0', ('ai', 5.0), lambda task: None, lambda task: task.read())
+    assert device.created == 2
+
+
+def test_competing_channels_are_not_cached(device):
+
+    pool = TaskPool(new_task=device.new_task)
+    for _ in range(10):
+        read(pool, 'Dev1/ai0')
+        read(pool, 'Dev1/ai1')
+
+    # Only the first conflict fails, afterwards each call creates a single task
+    assert device.failures == 1
+    assert device.created == 2 + 19
+    assert pool.get('Dev1/ai0') is None and pool.get('Dev1/ai1') is None
+
+    # Other channels are still cached, until they compete as well
+    read(pool, 'Dev1/ai2')
+    read(pool, 'Dev1/ai2')
+    assert pool.get('Dev1/ai2') is not None
+    read(pool, 'Dev1/ai0')
+    assert pool.get('Dev1/ai2') is None and 'Dev1/ai2' in pool._uncached
+
+    # Closing all tasks, e.g. after a reset, caches the channels again
+    pool.invalidate()
+    created = device.created
+    read(pool, 'Dev1/ai0')
+    read(pool, 'Dev1/ai0')
+    assert device.created == created + 1
+
+
+def test_persistent_task_is_kept(device):
+
+    pool = TaskPool(new_task=device.new_task)
+    stream = pool.run('Dev1/ai0', ('ai_stream',), lambda task: None, lambda task: task, persistent=True)
+
+    with pytest.raises(nidaqmx.DaqError):
+        read(pool, 'Dev1/ai1')
+    assert pool.get('Dev1/ai0') is stream and not stream.closed
+
+
+def test_failed_task_is_recreated(device):
+
+    pool = TaskPool(new_task=device.new_task)
+    read(pool, 'Dev1/ai0')
+    task = pool.get('Dev1/ai0')
+
+    def fail(number_of_samples_per_channel=1):
+        raise nidaqmx.DaqError('Device reset', -88709)
+    task.read = fail
+
+    assert read(pool, 'Dev1/ai0') == 1.0
+    assert task.closed and pool.get('Dev1/ai0') is not task
+
+
+def test_disabled_pool_closes_tasks(device):
+
+    pool = TaskPool(new_task=device.new_task, enabled=False)
+    read(pool, 'Dev1/ai0')
+    read(pool, 'Dev1/ai0')
+    assert device.created == 2 and pool.get('Dev1/ai0') is None
+
+
+@pytest.fixture
+def dummy(monkeypatch):
+    monkeypatch.setattr(DummyTask, 'OVERHEAD', 0)
+    monkeypatch.setattr(DummyTask, '_ao_value', 0.0)
+
+
+def test_dummy_task_reads_last_output(dummy):
+
+    with DummyTask() as task:
+        task.ao_channels.add_ao_voltage_chan('Dev1/ao0')
+        task.write([0.5, 2.0])
+
+    with DummyTask() as task:
+        task.ai_channels.add_ai_voltage_chan('Dev1/ai0')
+        assert task.read() == pytest.approx(2.0, abs=0.01)
+        assert_allclose(task.read(number_of_samples_per_channel=10), 2.0, atol=0.01)
+
+    with DummyTask() as task:
+        task.di_channels.add_di_chan('Dev1/port0/line0')
+        assert task.read() == [False]
+
+
+def test_dummy_task_hardware_timing(dummy):
+
+    task = DummyTask()
+    task.ai_channels.add_ai_voltage_chan('Dev1/ai0')
+    task.timing.cfg_samp_clk_timing(1000)
+    task.start()
+
+    assert len(task.read(number_of_samples_per_channel=50)) == 50
+    assert len(task.read(number_of_samples_per_channel=nidaqmx.constants.READ_ALL_AVAILABLE)) < 50
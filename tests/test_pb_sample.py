@@ -0,0 +1,40 @@
+import numpy as np
+
+from pylabnet.utils.pulseblock.pb_sample import SampleCache, pb_sample, pulse_sample
+from pylabnet.utils.pulseblock.placeholder import Placeholder
+from pylabnet.utils.pulseblock.pulse import PConst, DConst
+from pylabnet.utils.pulseblock.pulse_block import PulseBlock
+
+
+def test_pb_sample_placeholder_value_change():
+    """ Re-sampling after changing the value of a placeholder must not return cached samples """
+
+    cache = SampleCache()
+    pb = PulseBlock(p_obj_list=[PConst(ch='a0', dur=1e-6, val=Placeholder('amp', 0.5))])
+    pulse, = pb.p_dict[next(iter(pb.p_dict))]
+
+    samples, _, _ = pb_sample(pb, samp_rate=10e6, analog=True, cache=cache)
+    np.testing.assert_allclose(samples['a0'], 0.5)
+
+    pulse.val = Placeholder('amp', 1.0)
+    samples, _, _ = pb_sample(pb, samp_rate=10e6, analog=True, cache=cache)
+    np.testing.assert_allclose(samples['a0'], 1.0)
+    assert cache.misses == 2
+
+
+def test_pulse_sample_placeholder_value_change():
+
+    cache = SampleCache()
+    pulse = PConst(ch='a0', dur=1e-6, val=Placeholder('amp', 0.5))
+
+    samples, _, _ = pulse_sample(pulse, DConst(), samp_rate=10e6, len_min=1, cache=cache)
+    np.testing.assert_allclose(samples, 0.5)
+
+    pulse.val = Placeholder('amp', 1.0)
+    samples, _, _ = pulse_sample(pulse, DConst(), samp_rate=10e6, len_min=1, cache=cache)
+    np.testing.assert_allclose(samples, 1.0)
+
+    # Same value again is a cache hit
+    pulse.val = Placeholder('amp', 1.0)
+    pulse_sample(pulse, DConst(), samp_rate=10e6, len_min=1, cache=cache)
+    assert cache.hits == 1
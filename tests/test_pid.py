@@ -0,0 +1,42 @@
+import numpy as np
+from numpy.testing import assert_allclose
+
+from pylabnet.scripts.pid import PID
+
+
+def test_first_sample_fills_history():
+
+    pid = PID(p=0, i=1, setpoint=1, memory=10)
+    pid.set_pv(3)
+    pid.set_cv()
+
+    # A history of zeros would give (3 - 10 * 1) / 10
+    assert pid.cv == 2
+    assert_allclose(pid._pv, np.full(10, 3))
+
+
+def test_step_many_matches_step():
+
+    pv = np.random.default_rng(0).normal(size=50)
+    for integrate_window in (True, False):
+        single = PID(p=0.5, i=0.2, d=0.1, setpoint=0.3, memory=8, integrate_window=integrate_window)
+        many = PID(p=0.5, i=0.2, d=0.1, setpoint=0.3, memory=8, integrate_window=integrate_window)
+
+        assert_allclose(many.step_many(pv), [single.step(value) for value in pv])
+        assert_allclose(many._pv, single._pv)
+
+
+def test_newest_sample_integral():
+
+    pid = PID(p=0, i=2, setpoint=1, memory=4, integrate_window=False)
+    pid.step(5)
+    assert pid.step(2) == 2 * (2 - 1) / 4
+
+
+def test_resize_before_first_sample():
+
+    pid = PID(i=1, memory=4)
+    pid.set_parameters(memory=6)
+    pid.step(2)
+
+    assert_allclose(pid._pv, np.full(6, 2))
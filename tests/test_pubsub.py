@@ -0,0 +1,172 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+# The network core requires the logging dependencies
+try:
+    from rpyc.utils.server import ThreadedServer
+    from pylabnet.network.client_server import si_tt
+except ImportError as exc:
+    pytest.skip(f'Network core not available: {exc}', allow_module_level=True)
+
+
+N_BINS = 500
+
+
+class FakeCounter:
+    """ Count trace that advances by one bin every ms, bin i has counts i and -i """
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.generation = 1
+        self.transferred = []
+
+    def cursor(self):
+        return int((time.monotonic() - self.start) * 1000)
+
+    def trace(self, cursor):
+        bins = np.arange(cursor - N_BINS + 1, cursor + 1)
+        return np.stack((bins, -bins))
+
+    def get_counts(self, name):
+        return self.trace(self.cursor())
+
+    def get_counts_since(self, name, generation=None, cursor=None):
+        new_cursor = self.cursor()
+        trace = self.trace(new_cursor)
+
+        if generation != self.generation or cursor is None or not 0 <= new_cursor - cursor < N_BINS:
+            counts = trace
+        else:
+            counts = np.ascontiguousarray(trace[:, N_BINS - (new_cursor - cursor):])
+        self.transferred.append(counts.shape[-1])
+        return self.generation, new_cursor, counts
+
+
+@pytest.fixture
+def server():
+    """ Serves a si_tt service, yields it with a function connecting new clients """
+
+    service = si_tt.Service()
+    service.assign_module(FakeCounter())
+    server = ThreadedServer(
+        service, port=0, protocol_config={'allow_public_attrs': True, 'sync_request_timeout': 300}
+    )
+    threading.Thread(target=server.start, daemon=True).start()
+    time.sleep(0.2)
+
+    clients = []
+
+    def connect():
+        clients.append(si_tt.Client('localhost', server.port, key=None))
+        return clients[-1]
+
+    yield service, connect
+
+    # Disconnect the clients first, such that their connections end cleanly
+    for client in clients:
+        client._stop_bg_thread()
+        client._connection.close()
+    wait_for(lambda: not any(publisher_subscribers(service)))
+    server.close()
+
+
+def wait_for(condition, timeout=2):
+
+    start = time.monotonic()
+    while not condition():
+        if time.monotonic() - start > timeout:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def publisher_subscribers(service):
+    return [len(publisher._subscribers) for publisher in service._publishers.values()]
+
+
+def test_subscribers_share_a_publisher(server):
+
+    service, connect = server
+    clients = [connect() for _ in range(3)]
+    subscriptions = [client.subscribe('counts', rate=20, name='ctr') for client in clients]
+
+    for subscription in subscriptions:
+        assert subscription.get(timeout=2) is not None
+    assert publisher_subscribers(service) == [3]
+
+    for subscription in subscriptions:
+        subscription.close()
+    assert publisher_subscribers(service) == [0]
+
+
+def test_slow_consumer_is_coalesced(server):
+
+    service, connect = server
+    fast_client = connect()
+    slow_client = connect()
+
+    fast = fast_client.subscribe('counts', rate=50, name='ctr')
+    slow = slow_client.subscribe('counts', rate=50, callback=lambda frame: time.sleep(0.2), name='ctr')
+    time.sleep(1.5)
+
+    stats = list(service._publishers.values())[0].stats()
+    assert fast.received > 3 * slow.received
+    assert stats[slow.id]['skipped'] > 0
+    assert stats[fast.id]['skipped'] <= 5
+
+
+def test_incremental_frames_merge_into_trace(server):
+
+    service, connect = server
+    counter = service._module
+    errors = []
+
+    def check(frame):
+        if not np.array_equal(frame, counter.trace(frame[0, -1])):
+            errors.append(frame)
+
+    fast = connect().subscribe('counts', rate=50, callback=check, name='ctr')
+    slow = connect().subscribe('counts', rate=5, callback=check, name='ctr')
+    time.sleep(1)
+
+    assert fast.received > 10 and slow.received > 1
+    assert not errors
+
+    # After the first frames only the new bins are transferred
+    assert max(counter.transferred[2:]) < N_BINS
+
+    # A cleared measurement sends the full trace again
+    counter.generation += 1
+    received = fast.received
+    assert wait_for(lambda: fast.received > received + 2)
+    assert not errors
+
+
+def test_disconnect_ends_subscriptions(server):
+
+    service, connect = server
+    client = connect()
+    client.subscribe('counts', rate=20, name='ctr')
+    client.subscribe('counts', rate=20, name='other')
+    assert publisher_subscribers(service) == [1, 1]
+
+    client._connection.close()
+    assert wait_for(lambda: publisher_subscribers(service) == [0, 0])
+    assert all(publisher._loop is None for publisher in service._publishers.values())
+
+
+def test_unsubscribe_only_own_subscriptions(server):
+
+    service, connect = server
+    owner = connect()
+    other = connect()
+    subscription = owner.subscribe('counts', rate=20, name='ctr')
+
+    other._service.exposed_unsubscribe(subscription.id)
+    assert publisher_subscribers(service) == [1]
+
+    subscription.close()
+    assert publisher_subscribers(service) == [0]
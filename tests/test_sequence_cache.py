@@ -0,0 +1,137 @@
+import os
+
+import pytest
+
+# The HDAWG driver requires the Zurich Instruments API
+try:
+    from pylabnet.hardware.awg import zi_hdawg
+except ImportError as exc:
+    pytest.skip(f'HDAWG driver not available: {exc}', allow_module_level=True)
+
+
+class FakeLog:
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class FakeDriver:
+
+    def __init__(self, sequence_cache):
+        self.log = FakeLog()
+        self.device_id = 'dev8060'
+        self.sequence_cache = sequence_cache
+
+
+class FakeAWGModule:
+    """ Mimics the compiler and ELF upload nodes of a zhinst awgModule """
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        self.compilations = []
+        self.uploads = []
+        self.nodes = {}
+
+    def set(self, node, value):
+        self.nodes[node] = value
+
+        if node == 'compiler/sourcestring':
+            self.compilations.append(value)
+            elf_dir = os.path.join(self.directory, 'awg', 'elf')
+            os.makedirs(elf_dir, exist_ok=True)
+            with open(os.path.join(elf_dir, 'compiled.elf'), 'wb') as elf_file:
+                elf_file.write(f'elf of {value}'.encode('utf-8'))
+            self.nodes['elf/file'] = 'compiled.elf'
+
+        elif node == 'elf/upload':
+            elf_path = os.path.join(self.directory, 'awg', 'elf', self.nodes['elf/file'])
+            with open(elf_path, 'rb') as elf_file:
+                self.uploads.append(elf_file.read())
+
+    def getInt(self, node):
+        return 0
+
+    def getDouble(self, node):
+        return 1.0
+
+    def getString(self, node):
+        if node == 'directory':
+            return self.directory
+        return self.nodes.get(node, '')
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(zi_hdawg.time, 'sleep', lambda duration: None)
+
+
+def make_awg(tmp_path, cache):
+
+    awg = zi_hdawg.AWGModule.__new__(zi_hdawg.AWGModule)
+    awg.hd = FakeDriver(cache)
+    awg.index = 0
+    awg.channel_grouping = 0
+    awg.module = FakeAWGModule(tmp_path)
+    return awg
+
+
+def upload(awg, source):
+
+    awg.compile_upload_sequence(zi_hdawg.Sequence(awg.hd, source))
+
+
+def test_hit_skips_compilation(tmp_path):
+
+    cache = zi_hdawg.SequenceCache()
+    awg = make_awg(tmp_path, cache)
+
+    upload(awg, 'playZero(32);')
+    upload(awg, 'playZero(32);')
+    upload(awg, 'playZero(64);')
+
+    assert awg.module.compilations == ['playZero(32);', 'playZero(64);']
+    # Only the cache hit uploads an ELF file explicitly
+    assert awg.module.uploads == [b'elf of playZero(32);']
+    assert cache.get_stats() == {'hits': 1, 'misses': 2, 'entries': 2}
+
+
+def test_lru_eviction():
+
+    cache = zi_hdawg.SequenceCache(max_entries=2)
+    cache.put('a', b'a')
+    cache.put('b', b'b')
+    assert cache.get('a') == b'a'
+
+    # 'b' is now the least recently used entry
+    cache.put('c', b'c')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'a'
+    assert cache.get('c') == b'c'
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_persistent_store(tmp_path):
+
+    cache_dir = str(tmp_path / 'cache')
+    zi_hdawg.SequenceCache(cache_dir=cache_dir).put('a', b'a')
+
+    cache = zi_hdawg.SequenceCache(cache_dir=cache_dir)
+    assert cache.get('a') == b'a'
+    assert cache.get_stats() == {'hits': 1, 'misses': 0, 'entries': 1}
+
+
+def test_wave_files_change_key(tmp_path):
+
+    cache = zi_hdawg.SequenceCache()
+    awg = make_awg(tmp_path, cache)
+    wave_dir = tmp_path / 'awg' / 'waves'
+    wave_dir.mkdir(parents=True)
+    (wave_dir / 'pulse.csv').write_text('0\n1\n')
+
+    source = 'playWave("pulse");'
+    upload(awg, source)
+    upload(awg, source)
+    (wave_dir / 'pulse.csv').write_text('1\n0\n')
+    upload(awg, source)
+
+    assert awg.module.compilations == [source, source]
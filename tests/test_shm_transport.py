@@ -0,0 +1,72 @@
+import types
+
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from pylabnet.network.core import shm_transport
+
+if not shm_transport.AVAILABLE:
+    pytest.skip('Shared memory is not available', allow_module_level=True)
+
+
+@pytest.fixture
+def transports(monkeypatch):
+
+    # Sender and receiver share the resource tracker of this process, which
+    # must keep the registration of the sender
+    monkeypatch.setattr(shm_transport, 'os', types.SimpleNamespace(name='test'))
+
+    sender = shm_transport.SharedMemoryTransport(max_segments=3)
+    receiver = shm_transport.SharedMemoryTransport()
+    yield sender, receiver
+    receiver.close()
+    sender.close()
+
+
+def make_arrays(number, size=100000):
+    return [np.full(size, index, dtype=float) for index in range(number)]
+
+
+def test_concurrent_payloads_are_not_overwritten(transports):
+
+    sender, receiver = transports
+    arrays = make_arrays(3)
+    payloads = [sender.encode(array) for array in arrays]
+
+    assert all(shm_transport.is_shm_payload(payload) for payload in payloads)
+    for payload, array in zip(payloads, arrays):
+        assert_array_equal(receiver.decode(payload), array)
+
+
+def test_all_segments_busy_falls_back_to_socket(transports):
+
+    sender, receiver = transports
+    arrays = make_arrays(4)
+    payloads = [sender.encode(array) for array in arrays]
+
+    assert not shm_transport.is_shm_payload(payloads[-1])
+    for payload, array in zip(payloads, arrays):
+        assert_array_equal(receiver.decode(payload), array)
+
+
+def test_decoded_segments_are_reused(transports):
+
+    sender, receiver = transports
+    for array in make_arrays(10):
+        assert_array_equal(receiver.decode(sender.encode(array)), array)
+    assert len(sender._send_segments) == 1
+
+    # A larger array does not fit into the released segment
+    larger = np.arange(200000.)
+    payloads = [sender.encode(array) for array in make_arrays(2)] + [sender.encode(larger)]
+    assert_array_equal(receiver.decode(payloads[-1]), larger)
+    assert len(sender._send_segments) == 3
+
+
+def test_small_arrays_use_socket(transports):
+
+    sender, receiver = transports
+    payload = sender.encode(np.arange(10))
+    assert not shm_transport.is_shm_payload(payload)
+    assert_array_equal(receiver.decode(payload), np.arange(10))
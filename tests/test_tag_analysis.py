@@ -0,0 +1,145 @@
+import types
+
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from pylabnet.hardware.counter.swabian_instruments import tag_analysis as ta
+
+
+CLICK, START, PRESEL, ROUND, END = 1, 2, 3, 4, 5
+
+
+@pytest.fixture(scope='module')
+def tags():
+    rng = np.random.default_rng(3)
+    n_tags = 60000
+    timestamps = np.sort(rng.integers(0, 3 * 10 ** 9, n_tags)).astype(np.int64)
+    channels = rng.integers(1, 6, n_tags).astype(np.int32)
+    return channels, timestamps
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    monkeypatch.setattr(ta, 'MIN_SEGMENT_SIZE', 1000)
+
+
+def make_measurements():
+    return [
+        ta.Histogram(CLICK, START, binwidth=20000, n_bins=100),
+        ta.Correlation(CLICK, PRESEL, binwidth=5000, n_bins=60),
+        ta.Coincidences(CLICK, PRESEL, window=3000),
+        ta.GatedCounter(CLICK, ROUND),
+        ta.GatedCounter(CLICK, ROUND, END),
+        ta.ConditionalHistogram(CLICK, START, ROUND, PRESEL, threshold=1, binwidth=20000, n_bins=100)
+    ]
+
+
+def assert_same_results(measurements, expected):
+
+    for measurement, reference in zip(measurements, expected):
+        assert_array_equal(measurement.get_data(), reference.get_data())
+        assert_array_equal(measurement.get_index(), reference.get_index())
+    assert_array_equal(measurements[5].get_raw_data(), expected[5].get_raw_data())
+    assert_array_equal(measurements[5].get_preselection_counts(), expected[5].get_preselection_counts())
+
+
+@pytest.mark.parametrize('chunk_size', [777, 50000])
+def test_parallel_segments_match_sequential(tags, small_segments, chunk_size):
+
+    sequential = ta.analyze(tags, make_measurements(), chunk_size=len(tags[1]), n_workers=1)
+    parallel = ta.analyze(tags, make_measurements(), chunk_size=chunk_size, n_workers=7)
+    assert_same_results(parallel, sequential)
+
+
+def test_parallel_processes_match_sequential(tags, small_segments, tmp_path):
+
+    filename = str(tmp_path / 'tags')
+    ta.save_tags(filename, *tags)
+
+    sequential = ta.analyze(tags, make_measurements(), n_workers=1)
+    parallel = ta.analyze(filename, make_measurements(), chunk_size=5000, n_workers=3)
+    assert_same_results(parallel, sequential)
+
+
+def test_histogram_matches_brute_force(tags):
+
+    channels, timestamps = tags
+    expected = np.zeros(100, dtype=np.int64)
+    last_start = None
+    for channel, timestamp in zip(channels, timestamps):
+        if channel == START:
+            last_start = timestamp
+        elif channel == CLICK and last_start is not None and (timestamp - last_start) // 20000 < 100:
+            expected[(timestamp - last_start) // 20000] += 1
+
+    histogram = ta.Histogram(CLICK, START, binwidth=20000, n_bins=100)
+    for begin in range(0, len(timestamps), 7000):
+        histogram.process(channels[begin:begin + 7000], timestamps[begin:begin + 7000])
+    histogram.flush()
+    assert_array_equal(histogram.get_data(), expected)
+
+
+def test_correlation_matches_brute_force(tags):
+
+    channels, timestamps = tags
+    binwidth, n_bins = 5000, 60
+    offset = binwidth * n_bins // 2
+    delays = (timestamps[channels == PRESEL][:, None] - timestamps[channels == CLICK][None, :]).ravel()
+    delays = delays[(delays >= -offset) & (delays < binwidth * n_bins - offset)]
+    expected = np.bincount((delays + offset) // binwidth, minlength=n_bins)
+
+    correlation = ta.Correlation(CLICK, PRESEL, binwidth=binwidth, n_bins=n_bins)
+    for begin in range(0, len(timestamps), 7000):
+        correlation.process(channels[begin:begin + 7000], timestamps[begin:begin + 7000])
+    correlation.flush()
+    assert_array_equal(correlation.get_data(), expected)
+
+
+def test_conditional_histogram_matches_preselected_histogram():
+
+    # PreselectedHistogram receives the histogram and the preselection counts
+    # of every round from the data center
+    datasets = pytest.importorskip('pylabnet.scripts.data_center.datasets')
+
+    rng = np.random.default_rng(5)
+    binwidth, n_bins, threshold = 1000, 50, 2
+    conditional = ta.ConditionalHistogram(CLICK, START, ROUND, PRESEL, threshold, binwidth=binwidth, n_bins=n_bins)
+    preselected = types.SimpleNamespace(
+        presel_params=dict(less_than='False', threshold=threshold, avg_values=10)
+    )
+    counts = types.SimpleNamespace(data=[])
+    dataset = types.SimpleNamespace(children={'Preselection Counts': counts})
+    preselected_trace = types.SimpleNamespace(data=None)
+    raw = np.zeros(n_bins, dtype=np.int64)
+
+    # Every round starts with its marker, followed by preselection tags, a start and clicks
+    round_time = 10 ** 6
+    for index in range(200):
+        begin = index * round_time
+        n_presel = rng.integers(0, 5)
+        clicks = begin + 1000 + rng.integers(0, binwidth * n_bins, rng.integers(0, 20))
+        timestamps = np.concatenate((
+            [begin], begin + 10 + np.arange(n_presel), [begin + 1000], clicks
+        )).astype(np.int64)
+        channels = np.concatenate((
+            [ROUND], np.full(n_presel, PRESEL), [START], np.full(len(clicks), CLICK)
+        )).astype(np.int32)
+        order = np.argsort(timestamps, kind='stable')
+        channels, timestamps = channels[order], timestamps[order]
+
+        histogram = ta.Histogram(CLICK, START, binwidth=binwidth, n_bins=n_bins)
+        histogram.process(channels, timestamps)
+        conditional.process(channels, timestamps)
+
+        dataset.recent_data = histogram.get_data()
+        raw += dataset.recent_data
+        counts.data.append(n_presel)
+        datasets.PreselectedHistogram.preselect(preselected, dataset, preselected_trace)
+    conditional.flush()
+
+    # Some rounds fail the preselection
+    assert 0 < preselected_trace.data.sum() < raw.sum()
+    assert_array_equal(conditional.get_data(), preselected_trace.data)
+    assert_array_equal(conditional.get_raw_data(), raw)
+    assert_array_equal(conditional.get_preselection_counts(), counts.data)